@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class StepRequestBody(BaseModel):
@@ -11,5 +11,13 @@ class ResetRequestBody(BaseModel):
     id: int
     data_idx: int
 
+class StepBatchRequestBody(BaseModel):
+    items: List[StepRequestBody]
+
+
+class ResetBatchRequestBody(BaseModel):
+    items: List[ResetRequestBody]
+
+
 class CloseRequestBody(BaseModel):
     id: int
\ No newline at end of file
@@ -1,5 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import os
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from .model import *
 from .environment import server
 
@@ -36,6 +44,16 @@ def step(body: StepRequestBody):
 def reset(body: ResetRequestBody):
     return server.reset(body.id, body.data_idx)
 
+
+@app.post("/step_batch")
+def step_batch(body: StepBatchRequestBody):
+    return [server.step(item.id, item.action) for item in body.items]
+
+
+@app.post("/reset_batch")
+def reset_batch(body: ResetBatchRequestBody):
+    return [server.reset(item.id, item.data_idx) for item in body.items]
+
 @app.get("/observation")
 def get_observation(id: int):
     print(f"Observing environment {id}")
@@ -53,3 +71,41 @@ def render_endpoint(body: CloseRequestBody):
         return result
     except Exception as e:
         return {"error": str(e)}
+
+
+async def serve_session(websocket: WebSocket, ops: dict[str, Callable[[dict], Any]]) -> None:
+    """Serve `ops` as msgpack frames over one WebSocket; keep in sync with the textcraft and lmrlgym servers."""
+    if msgpack is None:
+        await websocket.close(code=1011, reason="msgpack is not installed")
+        return
+    await websocket.accept()
+    try:
+        while True:
+            request = msgpack.unpackb(await websocket.receive_bytes())
+            op = ops.get(request["op"])
+            if op is None:
+                reply = {"status": 404, "detail": f"Unknown op: {request['op']}"}
+            else:
+                try:
+                    body = await run_in_threadpool(op, request["body"])
+                    reply = {"status": 200, "body": body}
+                except Exception as e:
+                    reply = {"status": 500, "detail": str(e)}
+            await websocket.send_bytes(msgpack.packb(reply))
+    except WebSocketDisconnect:
+        pass
+
+
+# ops of the `/ws` endpoint, also called directly by env clients with backend="local"
+session_ops = {
+    "create": lambda body: server.create(),
+    "step": lambda body: server.step(body["id"], body["action"]),
+    "reset": lambda body: server.reset(body["id"], body["data_idx"]),
+    "observation": lambda body: server.observe(int(body["id"])),
+    "close": lambda body: server.close(body["id"]),
+}
+
+
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket):
+    await serve_session(websocket, session_ops)
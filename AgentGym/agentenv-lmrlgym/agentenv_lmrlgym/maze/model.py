@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -9,3 +11,11 @@ class MazeStepRequestBody(BaseModel):
 class MazeResetRequestBody(BaseModel):
     id: int
     game: int
+
+
+class MazeStepBatchRequestBody(BaseModel):
+    items: List[MazeStepRequestBody]
+
+
+class MazeResetBatchRequestBody(BaseModel):
+    items: List[MazeResetRequestBody]
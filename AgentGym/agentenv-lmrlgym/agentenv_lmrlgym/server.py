@@ -1,4 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from .maze.environment import maze_server
 from .maze.model import *
 from .wordle.environment import wordle_server
@@ -12,6 +20,29 @@ def hello():
     return "This is environment LMRL-Gym."
 
 
+async def serve_session(websocket: WebSocket, ops: dict[str, Callable[[dict], Any]]) -> None:
+    """Serve `ops` as msgpack frames over one WebSocket; keep in sync with the babyai and textcraft servers."""
+    if msgpack is None:
+        await websocket.close(code=1011, reason="msgpack is not installed")
+        return
+    await websocket.accept()
+    try:
+        while True:
+            request = msgpack.unpackb(await websocket.receive_bytes())
+            op = ops.get(request["op"])
+            if op is None:
+                reply = {"status": 404, "detail": f"Unknown op: {request['op']}"}
+            else:
+                try:
+                    body = await run_in_threadpool(op, request["body"])
+                    reply = {"status": 200, "body": body}
+                except Exception as e:
+                    reply = {"status": 500, "detail": str(e)}
+            await websocket.send_bytes(msgpack.packb(reply))
+    except WebSocketDisconnect:
+        pass
+
+
 # ----------------------------------------
 # maze
 # ----------------------------------------
@@ -32,6 +63,32 @@ def maze_reset(body: MazeResetRequestBody):
     return maze_server.reset(body.id, body.game)
 
 
+@app.post("/maze/step_batch")
+def maze_step_batch(body: MazeStepBatchRequestBody):
+    return [maze_server.step(item.id, item.action) for item in body.items]
+
+
+@app.post("/maze/reset_batch")
+def maze_reset_batch(body: MazeResetBatchRequestBody):
+    return [maze_server.reset(item.id, item.game) for item in body.items]
+
+
+# ops of the `/ws` endpoint, also called directly by env clients with backend="local"
+maze_session_ops = {
+    "create": lambda body: maze_server.create(),
+    "step": lambda body: maze_server.step(body["id"], body["action"]),
+    "reset": lambda body: maze_server.reset(body["id"], body["game"]),
+    "available_actions": lambda body: maze_server.get_available_actions(),
+    "observation": lambda body: maze_server.get_observation(int(body["id"])),
+    "detail": lambda body: maze_server.get_detailed_info(int(body["id"])),
+}
+
+
+@app.websocket("/maze/ws")
+async def maze_websocket_session(websocket: WebSocket):
+    await serve_session(websocket, maze_session_ops)
+
+
 @app.get("/maze/available_actions")
 def maze_get_available_actions():
     return maze_server.get_available_actions()
@@ -67,6 +124,32 @@ def wordle_reset(body: WordleResetRequestBody):
     return wordle_server.reset(body.id, body.seed)
 
 
+@app.post("/wordle/step_batch")
+def wordle_step_batch(body: WordleStepBatchRequestBody):
+    return [wordle_server.step(item.id, item.action) for item in body.items]
+
+
+@app.post("/wordle/reset_batch")
+def wordle_reset_batch(body: WordleResetBatchRequestBody):
+    return [wordle_server.reset(item.id, item.seed) for item in body.items]
+
+
+# ops of the `/ws` endpoint, also called directly by env clients with backend="local"
+wordle_session_ops = {
+    "create": lambda body: wordle_server.create(),
+    "step": lambda body: wordle_server.step(body["id"], body["action"]),
+    "reset": lambda body: wordle_server.reset(body["id"], body["seed"]),
+    "filtered_vocab": lambda body: wordle_server.get_filtered_vocab(int(body["id"])),
+    "observation": lambda body: wordle_server.get_observation(int(body["id"])),
+    "detail": lambda body: wordle_server.get_detailed_info(int(body["id"])),
+}
+
+
+@app.websocket("/wordle/ws")
+async def wordle_websocket_session(websocket: WebSocket):
+    await serve_session(websocket, wordle_session_ops)
+
+
 @app.get("/wordle/filtered_vocab")
 def wordle_get_filtered_vocab(id: int):
     return wordle_server.get_filtered_vocab(id)
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -9,3 +11,11 @@ class WordleStepRequestBody(BaseModel):
 class WordleResetRequestBody(BaseModel):
     id: int
     seed: int
+
+
+class WordleStepBatchRequestBody(BaseModel):
+    items: List[WordleStepRequestBody]
+
+
+class WordleResetBatchRequestBody(BaseModel):
+    items: List[WordleResetRequestBody]
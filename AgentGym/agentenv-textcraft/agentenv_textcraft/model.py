@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class CreateRequestBody(BaseModel):
@@ -16,5 +16,13 @@ class ResetRequestBody(BaseModel):
     id: int
     data_idx: Optional[int] = 0
 
+class StepBatchRequestBody(BaseModel):
+    items: List[StepRequestBody]
+
+
+class ResetBatchRequestBody(BaseModel):
+    items: List[ResetRequestBody]
+
+
 class CloseRequestBody(BaseModel):
     id: int
\ No newline at end of file
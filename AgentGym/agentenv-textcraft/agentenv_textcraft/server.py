@@ -1,5 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import os
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Callable
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from .model import *
 from .env_wrapper import server
 
@@ -39,6 +47,18 @@ def reset(body: ResetRequestBody):
     return server.reset(body.id, body.data_idx)
 
 
+@app.post("/step_batch")
+def step_batch(body: StepBatchRequestBody):
+    print(f"/step_batch {[item.id for item in body.items]}")
+    return [server.step(item.id, item.action) for item in body.items]
+
+
+@app.post("/reset_batch")
+def reset_batch(body: ResetBatchRequestBody):
+    print(f"/reset_batch {[(item.id, item.data_idx) for item in body.items]}")
+    return [server.reset(item.id, item.data_idx) for item in body.items]
+
+
 @app.get("/observation")
 def get_observation(id: int):
     print(f"/observation {id}")
@@ -63,3 +83,44 @@ def get_detailed_info(id: int):
 def close(body: CloseRequestBody):
     print(f"/close {body.id}")
     return server.close(body.id)
+
+
+async def serve_session(websocket: WebSocket, ops: dict[str, Callable[[dict], Any]]) -> None:
+    """Serve `ops` as msgpack frames over one WebSocket; keep in sync with the babyai and lmrlgym servers."""
+    if msgpack is None:
+        await websocket.close(code=1011, reason="msgpack is not installed")
+        return
+    await websocket.accept()
+    try:
+        while True:
+            request = msgpack.unpackb(await websocket.receive_bytes())
+            op = ops.get(request["op"])
+            if op is None:
+                reply = {"status": 404, "detail": f"Unknown op: {request['op']}"}
+            else:
+                try:
+                    body = await run_in_threadpool(op, request["body"])
+                    reply = {"status": 200, "body": body}
+                except Exception as e:
+                    reply = {"status": 500, "detail": str(e)}
+            await websocket.send_bytes(msgpack.packb(reply))
+    except WebSocketDisconnect:
+        pass
+
+
+# ops of the `/ws` endpoint, also called directly by env clients with backend="local"
+session_ops = {
+    "create": lambda body: server.create(body.get("commands"), body.get("goal")),
+    "step": lambda body: server.step(body["id"], body["action"]),
+    "reset": lambda body: server.reset(body["id"], body.get("data_idx", 0)),
+    "observation": lambda body: server.get_observation(int(body["id"])),
+    "commands": lambda body: server.get_commands(int(body["id"])),
+    "goal": lambda body: server.get_goal(int(body["id"])),
+    "detail": lambda body: server.get_detailed_info(int(body["id"])),
+    "close": lambda body: server.close(body["id"]),
+}
+
+
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket):
+    await serve_session(websocket, session_ops)
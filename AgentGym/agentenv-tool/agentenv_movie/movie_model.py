@@ -21,3 +21,11 @@ class StepResponse(BaseModel):
 class ResetQuery(BaseModel):
     env_idx: int
     id: Optional[int] = None
+
+
+class StepBatchQuery(BaseModel):
+    items: List[StepQuery]
+
+
+class ResetBatchQuery(BaseModel):
+    items: List[ResetQuery]
@@ -49,3 +49,27 @@ def observation(env_idx: int):
 def reset(reset_query: ResetQuery):
     todo_env_server.reset(reset_query.env_idx, reset_query.id)
     return todo_env_server.observation(reset_query.env_idx)
+
+
+@app.post("/step_batch")
+def step_batch(step_batch_query: StepBatchQuery):
+    """Step several environments in one request, results in the order of the items"""
+    results = []
+    for step_query in step_batch_query.items:
+        try:
+            results.append(step(step_query))
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+
+@app.post("/reset_batch")
+def reset_batch(reset_batch_query: ResetBatchQuery):
+    """Reset several environments in one request, results in the order of the items"""
+    results = []
+    for reset_query in reset_batch_query.items:
+        try:
+            results.append(reset(reset_query))
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
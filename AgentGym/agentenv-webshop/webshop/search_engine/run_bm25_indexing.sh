@@ -0,0 +1,6 @@
+# BM25 indexes for `WEBSHOP_SEARCH_ENGINE=bm25`, otherwise built on first use
+for resources in resources_100 resources resources_1k resources_100k; do
+  PYTHONPATH=.. python -m web_agent_site.engine.bm25 \
+    --input ${resources}/documents.jsonl \
+    --index bm25_${resources/resources/indexes}
+done
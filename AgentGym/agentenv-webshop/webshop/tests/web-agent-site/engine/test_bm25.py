@@ -0,0 +1,158 @@
+import json
+import math
+import numpy as np
+import pytest
+from collections import Counter
+
+from web_agent_site.engine.bm25 import (
+    BM25Index,
+    BM25Searcher,
+    analyze,
+    byte4_to_int,
+    int_to_byte4,
+    porter_stem,
+    tokenize,
+)
+from web_agent_site.engine.engine import get_top_n_product_from_keywords, init_search_engine
+
+DOCS = [
+    ('B03', 'red cotton shirt for men, size: small, medium, and large'),
+    ('B01', "men's running shoes with rubber soles, red"),
+    ('B02', 'running shoes'),
+    ('B05', 'the'),
+    ('B04', 'red red red hat, 3.5 inches wide'),
+    ('B06', 'women\'s blue running shorts with pockets, x-large'),
+]
+
+@pytest.fixture
+def documents_path(tmp_path):
+    path = tmp_path / 'documents.jsonl'
+    with open(path, 'w') as f:
+        for docid, contents in DOCS:
+            f.write(json.dumps({'id': docid, 'contents': contents, 'product': {'asin': docid}}) + '\n')
+    return str(path)
+
+def test_porter_stem():
+    suite = [
+        ('caresses', 'caress'), ('ponies', 'poni'), ('cats', 'cat'), ('agreed', 'agre'),
+        ('plastered', 'plaster'), ('motoring', 'motor'), ('hopping', 'hop'), ('falling', 'fall'),
+        ('filing', 'file'), ('happy', 'happi'), ('relational', 'relat'), ('conditional', 'condit'),
+        ('radicalli', 'radic'), ('digitizer', 'digit'), ('vietnamization', 'vietnam'),
+        ('decisiveness', 'decis'), ('sensibiliti', 'sensibl'), ('electrical', 'electr'),
+        ('adjustable', 'adjust'), ('replacement', 'replac'), ('adoption', 'adopt'),
+        ('homologous', 'homolog'), ('generalizations', 'gener'), ('controll', 'control'),
+        ('shoes', 'shoe'), ('running', 'run'), ('as', 'as'),
+    ]
+    for word, expected in suite:
+        assert porter_stem(word) == expected
+
+def test_tokenize():
+    suite = [
+        ("Men's x-large", ["Men's", 'x', 'large']),
+        ('3.5oz, $19.99 1,000', ['3.5oz', '19.99', '1,000']),
+        ('u.s.a a.5 color:red', ['u.s.a', 'a', '5', 'color:red']),
+        ('size: small, medium', ['size', 'small', 'medium']),
+        ('中文 ___ _a_', ['中', '文', '_a_']),
+    ]
+    for text, expected in suite:
+        assert tokenize(text) == expected
+
+def test_analyze():
+    assert analyze("The Men's Running Shoes, with 3.5oz soles") == ['men', 'run', 'shoe', '3.5oz', 'sole']
+
+def test_norm_bytes():
+    # Lengths below 40 are exact, longer ones lose precision but keep their order
+    for length in range(40):
+        assert byte4_to_int(int_to_byte4(length)) == length
+    assert byte4_to_int(int_to_byte4(100)) == 96
+    decoded = [byte4_to_int(int_to_byte4(length)) for length in range(5000)]
+    assert decoded == sorted(decoded)
+    assert all(int_to_byte4(length) < 256 for length in [2 ** 20, 2 ** 31 - 1])
+
+def lucene_scores(query, k1=0.9, b=0.4):
+    """BM25 scores of Lucene's `BM25Similarity`, one document at a time"""
+    doc_terms = {docid: analyze(contents) for docid, contents in DOCS}
+    doc_count = sum(1 for terms in doc_terms.values() if terms)
+    avgdl = np.float32(sum(map(len, doc_terms.values())) / doc_count)
+    doc_freqs = Counter(term for terms in doc_terms.values() for term in set(terms))
+    k1, b = np.float32(k1), np.float32(b)
+    scores = {}
+    for docid, terms in doc_terms.items():
+        freqs = Counter(terms)
+        dl = np.float32(byte4_to_int(int_to_byte4(len(terms))))
+        norm_inverse = np.float32(1) / (k1 * ((np.float32(1) - b) + b * dl / avgdl))
+        clauses = []
+        for term, count in Counter(analyze(query)).items():
+            if freqs[term]:
+                df = doc_freqs[term]
+                idf = np.float32(math.log(1 + (doc_count - df + 0.5) / (df + 0.5)))
+                weight = np.float32(count) * idf
+                clauses.append(weight - weight / (np.float32(1) + np.float32(freqs[term]) * norm_inverse))
+        if clauses:
+            scores[docid] = np.float32(sum(float(c) for c in clauses))
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+@pytest.mark.parametrize('query', ['red', 'running shoes', 'Red RED shirt', 'blue shorts pockets', 'the'])
+def test_search_matches_lucene_scoring(documents_path, query):
+    searcher = BM25Searcher(BM25Index.build(documents_path))
+    hits = searcher.search(query, k=10)
+    assert [(hit.docid, hit.score) for hit in hits] == [
+        (docid, float(score)) for docid, score in lucene_scores(query)
+    ]
+
+def test_search_k_and_ties(tmp_path, documents_path):
+    searcher = BM25Searcher(BM25Index.build(documents_path))
+    assert [hit.docid for hit in searcher.search('running', k=3)] == ['B02', 'B01', 'B06']
+    assert [hit.docid for hit in searcher.search('running', k=1)] == ['B02']
+    assert searcher.search('unknown words', k=3) == []
+
+    # Documents scoring the same are ordered by docid, also when k cuts them
+    path = tmp_path / 'ties.jsonl'
+    with open(path, 'w') as f:
+        for docid in ['C3', 'C1', 'C4', 'C2']:
+            f.write(json.dumps({'id': docid, 'contents': 'red shirt'}) + '\n')
+    searcher = BM25Searcher(BM25Index.build(str(path)))
+    assert [hit.docid for hit in searcher.search('shirt', k=10)] == ['C1', 'C2', 'C3', 'C4']
+    assert [hit.docid for hit in searcher.search('shirt', k=2)] == ['C1', 'C2']
+
+def test_set_bm25(documents_path):
+    searcher = BM25Searcher(BM25Index.build(documents_path))
+    searcher.set_bm25(k1=1.2, b=0.75)
+    hits = searcher.search('red shirt', k=10)
+    assert [(hit.docid, hit.score) for hit in hits] == [
+        (docid, float(score)) for docid, score in lucene_scores('red shirt', k1=1.2, b=0.75)
+    ]
+
+def test_save_and_mmap(tmp_path, documents_path):
+    index_dir = str(tmp_path / 'index')
+    searcher = BM25Searcher.from_index_dir(index_dir, documents_path=documents_path)
+    loaded = BM25Searcher.from_index_dir(index_dir)
+    assert isinstance(loaded.index.postings_docs, np.memmap)
+    for query in ['red', 'running shoes', 'shorts']:
+        assert [(h.docid, h.score) for h in loaded.search(query)] == \
+            [(h.docid, h.score) for h in searcher.search(query)]
+
+    doc = loaded.doc('B04')
+    assert doc.docid() == 'B04'
+    assert json.loads(doc.raw())['product'] == {'asin': 'B04'}
+    assert doc.contents() == DOCS[4][1]
+    assert loaded.doc('B99') is None
+
+def test_from_index_dir_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        BM25Searcher.from_index_dir(str(tmp_path / 'index'))
+
+def test_init_search_engine_backend():
+    with pytest.raises(ValueError):
+        init_search_engine(num_products=1000, backend='unknown')
+
+def test_get_top_n_product_from_keywords(documents_path):
+    searcher = BM25Searcher(BM25Index.build(documents_path))
+    product_item_dict = {docid: {'asin': docid} for docid, _ in DOCS}
+    top_n_products = get_top_n_product_from_keywords(
+        ['running', 'shoes'],
+        searcher,
+        list(product_item_dict.values()),
+        product_item_dict,
+    )
+    assert [p['asin'] for p in top_n_products] == ['B02', 'B01', 'B06']
@@ -0,0 +1,102 @@
+import json
+import pytest
+
+import web_agent_site.engine.engine as engine
+from web_agent_site.engine.engine import (
+    get_top_n_product_from_keywords,
+    normalize_keywords,
+    search_asins,
+    search_cache_info,
+    warm_search_cache,
+)
+
+class Hit:
+    def __init__(self, docid):
+        self.docid = docid
+
+class Doc:
+    def __init__(self, docid):
+        self.docid = docid
+
+    def raw(self):
+        return json.dumps({'id': self.docid, 'contents': '', 'product': {}})
+
+class CountingSearcher:
+    """Search engine returning the documents whose id shares a word with the query"""
+    def __init__(self, docids):
+        self.docids = docids
+        self.queries = []
+        self.docs = []
+
+    def search(self, query, k=10):
+        self.queries.append(query)
+        words = set(query.split())
+        return [Hit(d) for d in self.docids if words & set(d.split('-'))][:k]
+
+    def doc(self, docid):
+        self.docs.append(docid)
+        return Doc(docid)
+
+@pytest.fixture
+def searcher():
+    return CountingSearcher(['red-shirt', 'blue-shirt', 'red-hat', 'green-sock'])
+
+def test_normalize_keywords():
+    suite = [
+        (['red', 'shirt'], 'red shirt'),
+        (['Red', '', 'SHIRT '], 'red shirt'),
+        (['red shirt\t'], 'red shirt'),
+        ([''], ''),
+    ]
+    for keywords, expected in suite:
+        assert normalize_keywords(keywords) == expected
+
+def test_search_asins_cached(searcher):
+    assert search_asins(['red', 'shirt'], searcher) == ('red-shirt', 'blue-shirt', 'red-hat')
+    assert search_asins(['Red', '', 'shirt'], searcher) == ('red-shirt', 'blue-shirt', 'red-hat')
+    assert searcher.queries == ['red shirt']
+
+    # Documents already seen are not parsed again
+    assert search_asins(['hat'], searcher) == ('red-hat',)
+    assert searcher.docs == ['red-shirt', 'blue-shirt', 'red-hat']
+
+    info = search_cache_info(searcher)
+    assert info['results'] == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'size': 2, 'maxsize': engine.SEARCH_CACHE_SIZE}
+    assert info['doc_ids']['hits'] == 1
+    assert info['doc_ids']['misses'] == 3
+
+def test_search_cache_per_engine(searcher):
+    other = CountingSearcher(['red-sock'])
+    assert search_asins(['red'], searcher) == ('red-shirt', 'red-hat')
+    assert search_asins(['red'], other) == ('red-sock',)
+
+def test_search_cache_bounded(monkeypatch, searcher):
+    monkeypatch.setattr(engine, 'SEARCH_CACHE_SIZE', 2)
+    for query in ['red', 'blue', 'green', 'red']:
+        search_asins([query], searcher)
+    assert searcher.queries == ['red', 'blue', 'green', 'red']
+    assert search_cache_info(searcher)['results']['size'] == 2
+
+def test_warm_search_cache(searcher):
+    n_searched = warm_search_cache(searcher, ['Red shirt', 'red  shirt', 'hat', 'sock'], limit=2)
+    assert n_searched == 2
+    assert searcher.queries == ['red shirt', 'hat']
+    assert search_cache_info(searcher)['results']['hits'] == 0
+    assert search_cache_info(searcher)['results']['misses'] == 0
+
+    search_asins(['RED', 'shirt'], searcher)
+    assert searcher.queries == ['red shirt', 'hat']
+    assert search_cache_info(searcher)['results']['hits'] == 1
+
+def test_get_top_n_product_from_keywords(searcher):
+    product_item_dict = {
+        'red-shirt': {'asin': 'red-shirt'},
+        'red-hat': {'asin': 'red-hat'},
+    }
+    top_n_products = get_top_n_product_from_keywords(
+        ['red', 'blue'],
+        searcher,
+        list(product_item_dict.values()),
+        product_item_dict,
+    )
+    assert top_n_products == [product_item_dict['red-shirt'], product_item_dict['red-hat']]
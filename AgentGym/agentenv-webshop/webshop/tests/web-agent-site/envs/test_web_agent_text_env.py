@@ -0,0 +1,169 @@
+import random
+import pytest
+from bs4 import BeautifulSoup
+from flask import render_template_string
+
+import web_agent_site.envs.web_agent_text_env as text_env
+from web_agent_site.envs.web_agent_text_env import (
+    Page,
+    SimServer,
+    app,
+    get_catalog,
+    tag_visible,
+)
+from web_agent_site.engine.engine import TEMPLATE_SOURCES, page_cache_key
+
+BASE_URL = 'http://127.0.0.1:3000'
+
+@pytest.fixture
+def catalog_loads(monkeypatch):
+    """Replace the catalog loaders with small fakes, and record each load"""
+    loads = []
+    def load_products(filepath, num_products=None, human_goals=True):
+        loads.append((filepath, num_products))
+        products = [{'asin': f'A{i}'} for i in range(3)]
+        product_item_dict = {p['asin']: p for p in products}
+        product_prices = {p['asin']: 10.0 for p in products}
+        return products, product_item_dict, product_prices, {}
+    def get_goals(all_products, product_prices, human_goals=True):
+        return [
+            {'asin': p['asin'], 'instruction_text': f'goal {i}', 'weight': 1}
+            for p in all_products for i in range(3)
+        ]
+    monkeypatch.setattr(text_env, 'load_products', load_products)
+    monkeypatch.setattr(text_env, 'init_search_engine', lambda num_products=None: object())
+    monkeypatch.setattr(text_env, 'get_goals', get_goals)
+    monkeypatch.setattr(text_env, '_catalogs', {})
+    return loads
+
+def test_catalog_shared_by_servers(catalog_loads):
+    server_1 = SimServer(BASE_URL, 'items.json')
+    random_state = random.getstate()
+    server_2 = SimServer(BASE_URL, 'items.json')
+    assert catalog_loads == [('items.json', None)]
+    assert server_1.product_item_dict is server_2.product_item_dict
+    assert server_1.search_engine is server_2.search_engine
+    assert server_1.goals is server_2.goals
+    assert server_1.cum_weights == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    # Each server leaves `random` as shuffling the goals itself did
+    assert random.getstate() == random_state
+    assert server_1.user_sessions is not server_2.user_sessions
+
+def test_catalog_per_arguments(catalog_loads):
+    get_catalog('items.json', 100)
+    get_catalog('items.json', 1000)
+    get_catalog('items.json', 100)
+    assert catalog_loads == [('items.json', 100), ('items.json', 1000)]
+
+def test_filter_goals_keep_catalog(catalog_loads):
+    server = SimServer(BASE_URL, 'items.json', filter_goals=lambda i, goal: i < 2)
+    assert len(server.goals) == 2
+    assert server.cum_weights == [0, 1, 2]
+    assert len(get_catalog('items.json').goals) == 9
+
+def test_assigned_instruction_text_copies_goal(catalog_loads):
+    server = SimServer(BASE_URL, 'items.json')
+    server.assigned_instruction_text = 'assigned'
+    server.receive('session', None, session_int=0)
+    assert server.user_sessions['session']['goal']['instruction_text'] == 'assigned'
+    assert server.goals[0]['instruction_text'] != 'assigned'
+
+PRODUCT = {
+    'asin': 'B0TEST',
+    'Title': 'Shirt & <tie> "set"',
+    'Price': '$10.0 to $20.0',
+    'Rating': 'N.A.',
+    'MainImage': 'http://image',
+    'options': {'color': ['red', ' ', 'buy now'], 'size': ['', 'a & b']},
+    'option_to_image': {},
+    'Description': '  padded\n',
+    'BulletPoints': ['first', '', '\n', 'x\r\ny'],
+    'Reviews': [{'title': 'good', 'score': 4, 'body': ' '}, {'score': 1}],
+    'Attributes': ['cotton', ' '],
+    'category': 'fashion',
+    'query': '\xa0',
+    'product_category': 'a › b',
+}
+PAGE_ARGS = dict(
+    session_id='abc',
+    keywords=['shirt', '&'],
+    page=1,
+    asin='B0TEST',
+    options={'color': 'red'},
+    instruction_text='Find a shirt & <tie>',
+)
+PAGES = [
+    ('start', dict(session_id='abc', instruction_text=' ')),
+    ('search', dict(PAGE_ARGS, products=[PRODUCT, {'asin': ' '}], total=2)),
+    ('search', dict(PAGE_ARGS, products=[], total=0, page=2)),
+    ('click', dict(PAGE_ARGS, product_info=PRODUCT, show_attrs=False)),
+    ('click', dict(PAGE_ARGS, product_info=PRODUCT, show_attrs=True)),
+    ('click[Description]', dict(PAGE_ARGS, product_info=PRODUCT)),
+    ('click[Features]', dict(PAGE_ARGS, product_info=PRODUCT)),
+    ('click[Reviews]', dict(PAGE_ARGS, product_info=PRODUCT)),
+    ('click[Attributes]', dict(PAGE_ARGS, product_info=PRODUCT)),
+]
+
+@pytest.mark.parametrize('action, kwargs', PAGES)
+def test_page_text_matches_html(catalog_loads, action, kwargs):
+    page = Page(SimServer(BASE_URL, 'items.json'), action, **kwargs)
+    texts = BeautifulSoup(page.html, 'html.parser').findAll(text=True)
+    html_text = ' [SEP] '.join(t.strip() for t in filter(tag_visible, texts) if t != '\n')
+    assert page.text() == html_text
+
+@pytest.mark.parametrize('action, kwargs', PAGES)
+def test_page_clickables_match_html(catalog_loads, action, kwargs):
+    page = Page(SimServer(BASE_URL, 'items.json'), action, **kwargs)
+    html_obj = BeautifulSoup(page.html, 'html.parser')
+    html_clickables = {
+        b.get_text().lower(): b
+        for b in html_obj.find_all(class_='btn') + html_obj.find_all(class_='product-link')
+    }
+    for opt in html_obj.select('input[type="radio"]'):
+        html_clickables[opt.get('value')] = opt
+    has_search_bar, clickables = page.clickables()
+    clickables = dict(clickables)
+    assert has_search_bar == (html_obj.find(id='search_input') is not None)
+    assert list(clickables) == list(html_clickables)
+    for name, clickable in clickables.items():
+        assert clickable.get('class') == html_clickables[name].get('class')
+        assert clickable.get('name') == html_clickables[name].get('name')
+
+def test_done_page_text_from_html(catalog_loads):
+    page = Page(
+        SimServer(BASE_URL, 'items.json'), 'click[Buy Now]',
+        session_id='abc', reward=1.0, asin='B0TEST', options={},
+    )
+    assert page.text() is None
+    assert page.clickables() == (False, [])
+
+@pytest.mark.parametrize('action, kwargs', PAGES)
+def test_page_html_matches_template_string(catalog_loads, action, kwargs):
+    page = Page(SimServer(BASE_URL, 'items.json'), action, **kwargs)
+    name = page_cache_key(action, **kwargs)
+    name = name[0] if name else 'search_page.html' if action == 'start' else 'results_page.html'
+    with app.app_context(), app.test_request_context():
+        assert page.html == render_template_string(TEMPLATE_SOURCES[name], **kwargs)
+
+def test_page_cache(catalog_loads):
+    server = SimServer(BASE_URL, 'items.json')
+    kwargs = dict(PAGE_ARGS, product_info=PRODUCT, show_attrs=False, session_id='cache')
+    first = Page(server, 'click', **kwargs).html
+    assert (server.render_count, server.render_cache_hits) == (1, 0)
+    assert Page(server, 'click', **kwargs).html == first
+    assert (server.render_count, server.render_cache_hits) == (1, 1)
+
+    # Anything the page is rendered from is part of the key
+    for changed in [
+        dict(options={'color': 'red', 'size': 'a & b'}),
+        dict(show_attrs=True),
+        dict(page=2),
+        dict(product_info=dict(PRODUCT)),
+    ]:
+        Page(server, 'click', **dict(kwargs, **changed)).html
+    assert (server.render_count, server.render_cache_hits) == (5, 1)
+
+    # Pages other than item pages are not cached
+    Page(server, 'search', **dict(PAGE_ARGS, products=[], total=0)).html
+    Page(server, 'search', **dict(PAGE_ARGS, products=[], total=0)).html
+    assert (server.render_count, server.render_cache_hits) == (7, 1)
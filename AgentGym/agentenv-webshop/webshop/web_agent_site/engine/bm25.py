@@ -0,0 +1,540 @@
+"""
+BM25 search over the product documents of `search_engine/convert_product_file_format.py`, in
+NumPy, as an alternative to the Lucene indexes searched through pyserini (and a JVM).
+
+The index is array-backed postings (a CSR of terms by documents) saved as `.npy` files and
+memory-mapped when loaded, so a saved index opens without reading its postings. Scoring follows
+the pyserini 0.17 defaults (Lucene 8 `BM25Similarity`, k1=0.9, b=0.4, over `DefaultEnglishAnalyzer`
+terms), in the same float32 arithmetic, with ties broken by docid as `LuceneSearcher` does:
+
+* Scores match Lucene's to float32 rounding (a relative difference below 1e-6), for documents
+  that the two analyzers split into the same terms.
+* The analyzer is a Python approximation of Lucene's: `tokenize` follows the UAX#29 word breaking
+  of `StandardTokenizer` for letters, digits and the punctuation joining them, but does not emit
+  emoji, nor split tokens over 255 characters. Documents or queries with such text may score
+  differently. The rankings are otherwise the same, up to documents whose scores are within that
+  rounding of each other.
+
+    python -m web_agent_site.engine.bm25 \\
+        --input search_engine/resources_1k/documents.jsonl --index search_engine/bm25_indexes_1k
+"""
+import os
+import re
+import json
+import shutil
+import argparse
+from array import array
+from collections import Counter
+
+import numpy as np
+from tqdm import tqdm
+
+INDEX_VERSION = 1
+# Stems of query tokens a searcher keeps
+STEM_CACHE_SIZE = 100000
+
+# Lucene's `EnglishAnalyzer.ENGLISH_STOP_WORDS_SET`
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in', 'into', 'is',
+    'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the', 'their', 'then', 'there',
+    'these', 'they', 'this', 'to', 'was', 'will', 'with',
+])
+
+# Ideographs and kana are tokens of one character each
+_IDEOGRAPHIC = r'\u3040-\u309f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_WORD = rf'[^\W{_IDEOGRAPHIC}]'
+_LETTER = rf'[^\W\d_{_IDEOGRAPHIC}]'
+# Letters joined by . : ' and digits by . , ; ' stay one token
+_TOKEN = re.compile(
+    rf"[{_IDEOGRAPHIC}]"
+    rf"|{_WORD}+(?:(?:(?<={_LETTER})[.:'’](?={_LETTER})|(?<=\d)[.,;'’](?=\d)){_WORD}+)*"
+)
+
+
+def tokenize(text):
+    """Tokens of `text`, as Lucene's `StandardTokenizer` splits it"""
+    return [token for token in _TOKEN.findall(text) if token.strip('_')]
+
+
+def analyze(text, stems=None):
+    """
+    Terms of `text`, as pyserini's `DefaultEnglishAnalyzer` indexes it: tokens without their
+    possessive 's, lowercased, without stop words and Porter-stemmed. `stems` memoizes the stems.
+    """
+    if stems is None:
+        stems = {}
+    terms = []
+    for token in tokenize(text):
+        if token[-2:] in ("'s", "'S", '’s', '’S'):
+            token = token[:-2]
+        token = token.lower()
+        if token in STOP_WORDS:
+            continue
+        term = stems.get(token)
+        if term is None:
+            term = stems[token] = porter_stem(token)
+        terms.append(term)
+    return terms
+
+
+def porter_stem(word):
+    """Stem of `word` by the Porter algorithm, as Lucene's `PorterStemmer` (the reference version)"""
+    if len(word) <= 2:
+        return word
+    return _PorterStemmer(word).stem()
+
+
+class _PorterStemmer:
+    def __init__(self, word):
+        self.b = word
+        self.k = len(word) - 1
+        self.j = 0
+
+    def cons(self, i):
+        ch = self.b[i]
+        if ch in 'aeiou':
+            return False
+        if ch == 'y':
+            return i == 0 or not self.cons(i - 1)
+        return True
+
+    def m(self):
+        """Number of consonant sequences between 0 and j"""
+        n, i = 0, 0
+        while True:
+            if i > self.j:
+                return n
+            if not self.cons(i):
+                break
+            i += 1
+        i += 1
+        while True:
+            while True:
+                if i > self.j:
+                    return n
+                if self.cons(i):
+                    break
+                i += 1
+            i += 1
+            n += 1
+            while True:
+                if i > self.j:
+                    return n
+                if not self.cons(i):
+                    break
+                i += 1
+            i += 1
+
+    def vowelinstem(self):
+        return any(not self.cons(i) for i in range(self.j + 1))
+
+    def doublec(self, j):
+        return j >= 1 and self.b[j] == self.b[j - 1] and self.cons(j)
+
+    def cvc(self, i):
+        return (
+            i >= 2 and self.cons(i) and not self.cons(i - 1) and self.cons(i - 2)
+            and self.b[i] not in 'wxy'
+        )
+
+    def ends(self, s):
+        if len(s) > self.k + 1 or not self.b[:self.k + 1].endswith(s):
+            return False
+        self.j = self.k - len(s)
+        return True
+
+    def setto(self, s):
+        self.b = self.b[:self.j + 1] + s + self.b[self.k + 1:]
+        self.k = self.j + len(s)
+
+    def r(self, s):
+        if self.m() > 0:
+            self.setto(s)
+
+    def step1(self):
+        if self.b[self.k] == 's':
+            if self.ends('sses'):
+                self.k -= 2
+            elif self.ends('ies'):
+                self.setto('i')
+            elif self.b[self.k - 1] != 's':
+                self.k -= 1
+        if self.ends('eed'):
+            if self.m() > 0:
+                self.k -= 1
+        elif (self.ends('ed') or self.ends('ing')) and self.vowelinstem():
+            self.k = self.j
+            if self.ends('at'):
+                self.setto('ate')
+            elif self.ends('bl'):
+                self.setto('ble')
+            elif self.ends('iz'):
+                self.setto('ize')
+            elif self.doublec(self.k):
+                self.k -= 1
+                if self.b[self.k] in 'lsz':
+                    self.k += 1
+            elif self.m() == 1 and self.cvc(self.k):
+                self.setto('e')
+
+    def step2(self):
+        if self.ends('y') and self.vowelinstem():
+            self.b = self.b[:self.k] + 'i' + self.b[self.k + 1:]
+
+    def replace_suffix(self, suffixes):
+        # The first suffix the word ends with is replaced if m() > 0, the others are not tried
+        for suffix, replacement in suffixes:
+            if self.ends(suffix):
+                self.r(replacement)
+                return
+
+    def step3(self):
+        if self.k == 0:
+            return
+        self.replace_suffix(_STEP3_SUFFIXES.get(self.b[self.k - 1], ()))
+
+    def step4(self):
+        self.replace_suffix(_STEP4_SUFFIXES.get(self.b[self.k], ()))
+
+    def step5(self):
+        if self.k == 0:
+            return
+        for suffix in _STEP5_SUFFIXES.get(self.b[self.k - 1], ()):
+            if self.ends(suffix):
+                if suffix == 'ion' and not (self.j >= 0 and self.b[self.j] in 'st'):
+                    continue
+                if self.m() > 1:
+                    self.k = self.j
+                return
+
+    def step6(self):
+        self.j = self.k
+        if self.b[self.k] == 'e':
+            a = self.m()
+            if a > 1 or a == 1 and not self.cvc(self.k - 1):
+                self.k -= 1
+        if self.b[self.k] == 'l' and self.doublec(self.k) and self.m() > 1:
+            self.k -= 1
+
+    def stem(self):
+        self.step1()
+        if self.k > 0:
+            self.step2()
+            self.step3()
+            self.step4()
+            self.step5()
+            self.step6()
+        return self.b[:self.k + 1]
+
+
+_STEP3_SUFFIXES = {
+    'a': [('ational', 'ate'), ('tional', 'tion')],
+    'c': [('enci', 'ence'), ('anci', 'ance')],
+    'e': [('izer', 'ize')],
+    'l': [('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous')],
+    'o': [('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate')],
+    's': [('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous')],
+    't': [('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble')],
+    'g': [('logi', 'log')],
+}
+_STEP4_SUFFIXES = {
+    'e': [('icate', 'ic'), ('ative', ''), ('alize', 'al')],
+    'i': [('iciti', 'ic')],
+    'l': [('ical', 'ic'), ('ful', '')],
+    's': [('ness', '')],
+}
+_STEP5_SUFFIXES = {
+    'a': ['al'],
+    'c': ['ance', 'ence'],
+    'e': ['er'],
+    'i': ['ic'],
+    'l': ['able', 'ible'],
+    'n': ['ant', 'ement', 'ment', 'ent'],
+    'o': ['ion', 'ou'],
+    's': ['ism'],
+    't': ['ate', 'iti'],
+    'u': ['ous'],
+    'v': ['ive'],
+    'z': ['ize'],
+}
+
+
+def int_to_byte4(i):
+    """Lucene's `SmallFloat.intToByte4`, the norm byte a document length is indexed as"""
+    if i < _NUM_FREE_VALUES:
+        return i
+    return _NUM_FREE_VALUES + _long_to_int4(i - _NUM_FREE_VALUES)
+
+
+def byte4_to_int(b):
+    """Lucene's `SmallFloat.byte4ToInt`, the document length BM25 scores a norm byte as"""
+    if b < _NUM_FREE_VALUES:
+        return b
+    return _NUM_FREE_VALUES + _int4_to_long(b - _NUM_FREE_VALUES)
+
+
+def _long_to_int4(i):
+    num_bits = i.bit_length()
+    if num_bits < 4:
+        return i
+    shift = num_bits - 4
+    return ((i >> shift) & 0x07) | ((shift + 1) << 3)
+
+
+def _int4_to_long(i):
+    bits = i & 0x07
+    shift = (i >> 3) - 1
+    if shift == -1:
+        return bits
+    return (bits | 0x08) << shift
+
+
+_NUM_FREE_VALUES = 255 - _long_to_int4(2 ** 31 - 1)
+LENGTH_TABLE = np.array([byte4_to_int(b) for b in range(256)], dtype=np.float32)
+
+
+class BM25Index:
+    """
+    Postings of the product documents: `indptr[t]:indptr[t + 1]` slices the documents
+    (`postings_docs`) and frequencies (`postings_tfs`) of term `t`, in document order
+    """
+    ARRAYS = ['indptr', 'postings_docs', 'postings_tfs', 'doc_norms', 'doc_offsets', 'id_ranks']
+
+    def __init__(self, meta, terms, docids, arrays):
+        self.meta = meta
+        self.terms = terms
+        self.docids = docids
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.doc_indices = {docid: i for i, docid in enumerate(docids)}
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.num_docs = len(docids)
+        self.doc_freqs = np.diff(self.indptr)
+
+    @classmethod
+    def build(cls, documents_path):
+        """Index the `id` and `contents` of the documents in the JSON lines at `documents_path`"""
+        terms, term_ids, stems = [], {}, {}
+        docids, doc_offsets, doc_norms = [], array('q'), array('B')
+        # Postings in document order, kept compact until they are sorted by term
+        posting_terms, posting_docs, posting_tfs = array('i'), array('i'), array('f')
+        doc_count, sum_total_term_freq = 0, 0
+        with open(documents_path, 'rb') as f:
+            offset = 0
+            for line in tqdm(f):
+                line_offset, offset = offset, offset + len(line)
+                if not line.strip():
+                    continue
+                doc = json.loads(line)
+                doc_terms = analyze(doc['contents'], stems)
+                counts = Counter(doc_terms)
+                doc_index = len(docids)
+                docids.append(doc['id'])
+                doc_offsets.append(line_offset)
+                doc_norms.append(int_to_byte4(len(doc_terms)))
+                # Lucene counts the documents that have terms
+                doc_count += bool(doc_terms)
+                sum_total_term_freq += len(doc_terms)
+                for term, count in counts.items():
+                    term_id = term_ids.get(term)
+                    if term_id is None:
+                        term_id = term_ids[term] = len(terms)
+                        terms.append(term)
+                    posting_terms.append(term_id)
+                    posting_docs.append(doc_index)
+                    posting_tfs.append(count)
+        posting_terms = np.frombuffer(posting_terms, dtype=np.int32)
+        order = np.argsort(posting_terms, kind='stable')
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(terms)), out=indptr[1:])
+        id_ranks = np.empty(len(docids), dtype=np.int32)
+        id_ranks[sorted(range(len(docids)), key=docids.__getitem__)] = np.arange(len(docids))
+        arrays = {
+            'indptr': indptr,
+            'postings_docs': np.frombuffer(posting_docs, dtype=np.int32)[order],
+            'postings_tfs': np.frombuffer(posting_tfs, dtype=np.float32)[order],
+            'doc_norms': np.frombuffer(doc_norms, dtype=np.uint8).copy(),
+            'doc_offsets': np.frombuffer(doc_offsets, dtype=np.int64).copy(),
+            'id_ranks': id_ranks,
+        }
+        meta = {
+            'version': INDEX_VERSION,
+            'documents_path': os.path.abspath(documents_path),
+            'doc_count': doc_count,
+            'sum_total_term_freq': sum_total_term_freq,
+        }
+        return cls(meta, terms, docids, arrays)
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(index_dir, f'{name}.npy'), getattr(self, name))
+        meta = dict(
+            self.meta,
+            documents_path=os.path.relpath(self.meta['documents_path'], index_dir),
+        )
+        with open(os.path.join(index_dir, 'terms.json'), 'w') as f:
+            json.dump(self.terms, f)
+        with open(os.path.join(index_dir, 'docids.json'), 'w') as f:
+            json.dump(self.docids, f)
+        # Written last: an index directory without it is incomplete
+        with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, index_dir, mmap=True):
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != INDEX_VERSION:
+            raise ValueError(
+                f'BM25 index {index_dir} has version {meta["version"]}, expected {INDEX_VERSION}'
+            )
+        meta['documents_path'] = os.path.normpath(os.path.join(index_dir, meta['documents_path']))
+        with open(os.path.join(index_dir, 'terms.json')) as f:
+            terms = json.load(f)
+        with open(os.path.join(index_dir, 'docids.json')) as f:
+            docids = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(index_dir, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name in cls.ARRAYS
+        }
+        return cls(meta, terms, docids, arrays)
+
+    @staticmethod
+    def exists(index_dir):
+        return os.path.exists(os.path.join(index_dir, 'meta.json'))
+
+
+class BM25Hit:
+    def __init__(self, docid, score):
+        self.docid = docid
+        self.score = score
+
+    def __repr__(self):
+        return f'BM25Hit(docid={self.docid!r}, score={self.score})'
+
+
+class BM25Document:
+    """Document of a `BM25Searcher`, read from its line of the documents file"""
+    def __init__(self, docid, raw):
+        self._docid = docid
+        self._raw = raw
+
+    def docid(self):
+        return self._docid
+
+    def raw(self):
+        return self._raw
+
+    def contents(self):
+        return json.loads(self._raw)['contents']
+
+
+class BM25Searcher:
+    """
+    Searcher with the `search` and `doc` methods of pyserini's `LuceneSearcher`, over a
+    `BM25Index`, scoring a query's terms in vectorized NumPy over their postings
+    """
+    def __init__(self, index, k1=0.9, b=0.4):
+        self.index = index
+        meta = index.meta
+        self.num_docs = index.num_docs
+        # Lucene's `BM25Similarity` statistics, as floats
+        self.avgdl = np.float32(meta['sum_total_term_freq'] / meta['doc_count'])
+        idf = np.log(1 + (meta['doc_count'] - index.doc_freqs + 0.5) / (index.doc_freqs + 0.5))
+        self.idf = idf.astype(np.float32)
+        self.stems = {}
+        self.set_bm25(k1, b)
+
+    @classmethod
+    def from_index_dir(cls, index_dir, documents_path=None, **kwargs):
+        """
+        Searcher over the index saved at `index_dir`, memory-mapped. If there is none, it is built
+        from the documents at `documents_path` and saved there first.
+        """
+        if not BM25Index.exists(index_dir):
+            if documents_path is None:
+                raise FileNotFoundError(f'No BM25 index at {index_dir}')
+            # Saved aside and renamed, as processes starting together may all build it
+            build_dir = f'{index_dir}.{os.getpid()}.tmp'
+            BM25Index.build(documents_path).save(build_dir)
+            try:
+                os.rename(build_dir, index_dir)
+            except OSError:
+                shutil.rmtree(build_dir)
+                if not BM25Index.exists(index_dir):
+                    raise
+        return cls(BM25Index.load(index_dir), **kwargs)
+
+    def set_bm25(self, k1=0.9, b=0.4):
+        self.k1 = np.float32(k1)
+        self.b = np.float32(b)
+        # 1 / (k1 * (1 - b + b * dl / avgdl)) of each norm byte
+        self.norm_inverses = np.float32(1) / (
+            self.k1 * ((np.float32(1) - self.b) + self.b * LENGTH_TABLE / self.avgdl)
+        )
+
+    def scores(self, q):
+        """`(docs, scores)` of the documents matching a term of `q`, with their BM25 scores"""
+        index = self.index
+        if len(self.stems) > STEM_CACHE_SIZE:
+            self.stems = {}
+        counts = Counter(analyze(q, self.stems))
+        docs, contributions = [], []
+        for term, count in counts.items():
+            term_id = index.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = index.indptr[term_id], index.indptr[term_id + 1]
+            term_docs = index.postings_docs[start:end]
+            freqs = index.postings_tfs[start:end]
+            weight = np.float32(count) * self.idf[term_id]
+            # Lucene's `weight - weight / (1 + freq * normInverse)`, in float32
+            x = freqs * self.norm_inverses[index.doc_norms[term_docs]]
+            docs.append(term_docs)
+            contributions.append(weight - weight / (np.float32(1) + x))
+        if not docs:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        # Clause scores are summed as doubles, then rounded to a float
+        scores = np.bincount(
+            np.concatenate(docs),
+            weights=np.concatenate(contributions).astype(np.float64),
+            minlength=self.num_docs,
+        )
+        # Every clause scores above 0
+        matched = np.flatnonzero(scores)
+        return matched, scores[matched].astype(np.float32)
+
+    def search(self, q, k=10):
+        """Top `k` hits for `q` by score, ties broken by docid"""
+        docs, scores = self.scores(q)
+        if len(docs) > k:
+            # Keep every document scoring as the k-th, then order them by docid
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = scores >= kth
+            docs, scores = docs[keep], scores[keep]
+        order = np.lexsort((self.index.id_ranks[docs], -scores))[:k]
+        return [BM25Hit(self.index.docids[docs[i]], float(scores[i])) for i in order]
+
+    def doc(self, docid):
+        doc_index = self.index.doc_indices.get(docid)
+        if doc_index is None:
+            return None
+        with open(self.index.meta['documents_path'], 'rb') as f:
+            f.seek(int(self.index.doc_offsets[doc_index]))
+            raw = f.readline().decode('utf-8').rstrip('\n')
+        return BM25Document(docid, raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the BM25 index of product documents')
+    parser.add_argument('--input', required=True, help='documents.jsonl of convert_product_file_format.py')
+    parser.add_argument('--index', required=True, help='directory to save the index to')
+    args = parser.parse_args()
+    index = BM25Index.build(args.input)
+    index.save(args.index)
+    print(f'Indexed {index.num_docs} documents, {len(index.terms)} terms.')
+
+
+if __name__ == '__main__':
+    main()
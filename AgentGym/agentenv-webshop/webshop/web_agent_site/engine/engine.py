@@ -4,28 +4,32 @@ import os
 import re
 import json
 import random
-from collections import defaultdict
+import threading
+import weakref
+from collections import defaultdict, OrderedDict
 from ast import literal_eval
 from decimal import Decimal
 
 import cleantext
 from tqdm import tqdm
 from rank_bm25 import BM25Okapi
-from flask import render_template_string
+from flask import current_app, has_request_context, render_template, request
 from rich import print
-from pyserini.search.lucene import LuceneSearcher
 
 from web_agent_site.utils import (
     BASE_DIR,
     DEFAULT_FILE_PATH,
     DEFAULT_REVIEW_PATH,
     DEFAULT_ATTR_PATH,
-    HUMAN_ATTR_PATH
+    HUMAN_ATTR_PATH,
+    SEARCH_ENGINE,
 )
 
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 
 SEARCH_RETURN_N = 50
+SEARCH_CACHE_SIZE = 10000
+DOC_ID_CACHE_SIZE = 100000
 PRODUCT_WINDOW = 10
 TOP_K_ATTR = 10
 
@@ -41,19 +45,105 @@ ACTION_TO_TEMPLATE = {
     'Attributes': 'attributes_page.html',
 }
 
+# Rendered item and sub-pages kept per Flask app
+PAGE_CACHE_SIZE = 512
+
 def map_action_to_html(action, **kwargs):
+    return render_page(action, **kwargs)[0]
+
+
+def render_page(action, **kwargs):
+    """
+    Render the page of `action` like `map_action_to_html` and return `(html, cached)`. Item pages
+    and their sub-pages are kept in an LRU cache of the current app, keyed by everything they are
+    rendered from, so that revisiting one returns it without rendering it again.
+    """
+    key = page_cache_key(action, **kwargs)
+    if key is None:
+        return _render_page(action, **kwargs), False
+    cache = current_app.extensions.setdefault('webshop_page_cache', LRUCache(PAGE_CACHE_SIZE))
+    html = cache.get(key)
+    if html is not None:
+        return html, True
+    html = _render_page(action, **kwargs)
+    # The entry keeps product_info alive, so its id in the key is not reused
+    cache.put(key, html, kwargs['product_info'])
+    return html, False
+
+
+def page_cache_key(action, **kwargs):
+    """Key of the page of `action` in the page cache, or None if it is not cached"""
+    action_name, action_arg = parse_action(action)
+    if action_name != 'click' or action_arg == END_BUTTON:
+        return None
+    keywords = kwargs['keywords']
+    return (
+        ACTION_TO_TEMPLATE.get(action_arg, 'item_page.html'),
+        kwargs['asin'],
+        tuple(kwargs['options'].items()),
+        kwargs.get('show_attrs') if action_arg not in ACTION_TO_TEMPLATE else None,
+        id(kwargs['product_info']),
+        kwargs['session_id'],
+        tuple(keywords) if isinstance(keywords, list) else keywords,
+        kwargs['page'],
+        kwargs.get('instruction_text'),
+        # URLs are built against the root of the request
+        request.url_root if has_request_context() else None,
+    )
+
+
+class LRUCache:
+    """Thread-safe LRU cache, with its hit and miss counts"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, *refs):
+        """Cache `value`, keeping `refs` alive as long as it is cached"""
+        with self.lock:
+            self.entries[key] = (value, refs)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+        }
+
+
+def _render_page(action, **kwargs):
     action_name, action_arg = parse_action(action)
     if action_name == 'start':
-        path = os.path.join(TEMPLATE_DIR, 'search_page.html')
-        html = render_template_string(
-            read_html_template(path=path),
+        html = render_template(
+            compiled_template('search_page.html'),
             session_id=kwargs['session_id'],
             instruction_text=kwargs['instruction_text'],
         )
     elif action_name == 'search':
-        path = os.path.join(TEMPLATE_DIR, 'results_page.html')
-        html = render_template_string(
-            read_html_template(path=path),
+        html = render_template(
+            compiled_template('results_page.html'),
             session_id=kwargs['session_id'],
             products=kwargs['products'],
             keywords=kwargs['keywords'],
@@ -62,9 +152,8 @@ def map_action_to_html(action, **kwargs):
             instruction_text=kwargs['instruction_text'],
         )
     elif action_name == 'click' and action_arg == END_BUTTON:
-        path = os.path.join(TEMPLATE_DIR, 'done_page.html')
-        html = render_template_string(
-            read_html_template(path),
+        html = render_template(
+            compiled_template('done_page.html'),
             session_id=kwargs['session_id'],
             reward=kwargs['reward'],
             asin=kwargs['asin'],
@@ -79,9 +168,8 @@ def map_action_to_html(action, **kwargs):
             product_category=kwargs.get('product_category'),
         )
     elif action_name == 'click' and action_arg in ACTION_TO_TEMPLATE:
-        path = os.path.join(TEMPLATE_DIR, ACTION_TO_TEMPLATE[action_arg])
-        html = render_template_string(
-            read_html_template(path),
+        html = render_template(
+            compiled_template(ACTION_TO_TEMPLATE[action_arg]),
             session_id=kwargs['session_id'],
             product_info=kwargs['product_info'],
             keywords=kwargs['keywords'],
@@ -91,9 +179,8 @@ def map_action_to_html(action, **kwargs):
             instruction_text=kwargs.get('instruction_text')
         )
     elif action_name == 'click':
-        path = os.path.join(TEMPLATE_DIR, 'item_page.html')
-        html = render_template_string(
-            read_html_template(path),
+        html = render_template(
+            compiled_template('item_page.html'),
             session_id=kwargs['session_id'],
             product_info=kwargs['product_info'],
             keywords=kwargs['keywords'],
@@ -108,12 +195,179 @@ def map_action_to_html(action, **kwargs):
     return html
 
 
+# Whitespace that BeautifulSoup collapses in strings made only of it
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+
+def html_text_node(value):
+    """
+    String that `BeautifulSoup(html, 'html.parser')` keeps for the text `value` rendered
+    between two tags: None if it is empty, a newline or a space if it is only whitespace
+    """
+    if value == '':
+        return None
+    if all(c in ASCII_SPACES for c in value):
+        return '\n' if '\n' in value else ' '
+    return value
+
+
+def _template_str(obj, key=None):
+    """How a template renders `obj` (or `obj.key` for a dict `obj`): missing values render empty"""
+    if key is not None:
+        if key not in obj:
+            return ''
+        obj = obj[key]
+    return str(obj)
+
+
+def map_action_to_text_nodes(action, **kwargs):
+    """
+    Text nodes of the page `map_action_to_html` renders for the same arguments, built from the
+    values directly, in document order and without the whitespace between tags, which parses
+    into newlines. Returns None for the done page, whose text only comes from its HTML.
+    """
+    action_name, action_arg = parse_action(action)
+    instruction_text = _template_str(kwargs.get('instruction_text'))
+    if action_name == 'start':
+        nodes = ['WebShop', 'Instruction: ', instruction_text, 'Search']
+    elif action_name == 'search':
+        nodes = [
+            'Instruction:',
+            instruction_text,
+            BACK_TO_SEARCH,
+            f"Page {kwargs['page']} (Total results: {kwargs['total']})",
+        ]
+        if kwargs['page'] > 1:
+            nodes.append(PREV_PAGE)
+        nodes.append(NEXT_PAGE)
+        for item in kwargs['products']:
+            nodes += [
+                _template_str(item, 'asin'),
+                _template_str(item, 'Title'),
+                _template_str(item, 'Price'),
+            ]
+    elif action_name == 'click' and action_arg == END_BUTTON:
+        return None
+    elif action_name == 'click' and action_arg in ACTION_TO_TEMPLATE:
+        product_info = kwargs['product_info']
+        nodes = ['Instruction:', instruction_text, BACK_TO_SEARCH, PREV_PAGE]
+        if action_arg == 'Description':
+            nodes.append(_template_str(product_info, 'Description'))
+        elif action_arg == 'Features':
+            for bulletpoint in product_info.get('BulletPoints', []):
+                nodes.append(' ' + _template_str(bulletpoint))
+        elif action_arg == 'Reviews':
+            for review in product_info.get('Reviews', []):
+                nodes += [
+                    '"' + _template_str(review, 'title') + '"',
+                    _template_str(review, 'score'),
+                    _template_str(review, 'body'),
+                ]
+        else:
+            for attribute in product_info.get('Attributes', []):
+                nodes.append(' ' + _template_str(attribute))
+            nodes += [
+                _template_str(product_info, 'category'),
+                _template_str(product_info, 'query'),
+                _template_str(product_info, 'product_category'),
+            ]
+    elif action_name == 'click':
+        product_info = kwargs['product_info']
+        nodes = ['Instruction:', instruction_text, BACK_TO_SEARCH, PREV_PAGE]
+        for option_name, option_contents in product_info['options'].items():
+            nodes.append(_template_str(option_name))
+            nodes += [_template_str(option_content) for option_content in option_contents]
+        nodes += [
+            _template_str(product_info, 'Title'),
+            'Price: ' + _template_str(product_info, 'Price'),
+            'Rating: ' + _template_str(product_info, 'Rating'),
+            'Description',
+            'Features',
+            'Reviews',
+        ]
+        if kwargs['show_attrs']:
+            nodes.append('Attributes')
+        nodes.append(END_BUTTON)
+    else:
+        raise ValueError('Action name not recognized.')
+    return [node for node in map(html_text_node, nodes) if node is not None]
+
+
+def map_action_to_clickables(action, **kwargs):
+    """
+    Clickables of the page `map_action_to_html` renders for the same arguments, built from the
+    values directly, as `(has_search_bar, [(name, attrs), ...])`: the lowercased text of buttons
+    and product links, then the value of options, in document order, with the HTML attributes
+    of their element that the simulated server reads.
+    """
+    action_name, action_arg = parse_action(action)
+    back_to_search = (BACK_TO_SEARCH.lower(), {'class': ['btn', 'btn-success']})
+    prev_page = (PREV_PAGE.lower(), {'class': ['btn', 'btn-primary']})
+    if action_name == 'start':
+        return True, [('search', {'class': ['btn', 'btn-success']})]
+    elif action_name == 'search':
+        clickables = [back_to_search]
+        if kwargs['page'] > 1:
+            clickables.append(prev_page)
+        clickables.append((NEXT_PAGE.lower(), {'class': ['btn', 'btn-primary']}))
+        for item in kwargs['products']:
+            asin = html_text_node(_template_str(item, 'asin')) or ''
+            clickables.append((asin.lower(), {'class': ['product-link']}))
+        return False, clickables
+    elif action_name == 'click' and action_arg == END_BUTTON:
+        return False, []
+    elif action_name == 'click' and action_arg in ACTION_TO_TEMPLATE:
+        return False, [back_to_search, prev_page]
+    elif action_name == 'click':
+        clickables = [back_to_search, prev_page]
+        sub_pages = ['Description', 'Features', 'Reviews']
+        if kwargs['show_attrs']:
+            sub_pages.append('Attributes')
+        for sub_page in sub_pages:
+            clickables.append((sub_page.lower(), {'class': ['btn', 'btn-primary']}))
+        clickables.append((END_BUTTON.lower(), {'class': ['btn', 'btn-lg', 'purchase']}))
+        for option_name, option_contents in kwargs['product_info']['options'].items():
+            for option_content in option_contents:
+                value = _template_str(option_content)
+                clickables.append(
+                    (value, {'type': 'radio', 'name': _template_str(option_name), 'value': value})
+                )
+        return False, clickables
+    else:
+        raise ValueError('Action name not recognized.')
+
+
 def read_html_template(path):
     with open(path) as f:
         template = f.read()
     return template
 
 
+# Sources of the page templates, read once at import
+TEMPLATE_SOURCES = {
+    name: read_html_template(os.path.join(TEMPLATE_DIR, name))
+    for name in [
+        'search_page.html',
+        'results_page.html',
+        'item_page.html',
+        'done_page.html',
+        *ACTION_TO_TEMPLATE.values(),
+    ]
+}
+
+
+def compiled_template(name):
+    """
+    Template `name` compiled by the Jinja environment of the current app, which compiles each
+    template once instead of on every render like `render_template_string`
+    """
+    templates = current_app.extensions.setdefault('webshop_templates', {})
+    template = templates.get(name)
+    if template is None:
+        template = templates[name] = current_app.jinja_env.from_string(TEMPLATE_SOURCES[name])
+    return template
+
+
 def parse_action(action):
     """
     Parse action string to action name and its arguments.
@@ -165,14 +419,86 @@ def get_top_n_product_from_keywords(
         query = ' '.join(keywords[1:]).strip()
         top_n_products = [p for p in all_products if p['query'] == query]
     else:
-        keywords = ' '.join(keywords)
-        hits = search_engine.search(keywords, k=SEARCH_RETURN_N)
-        docs = [search_engine.doc(hit.docid) for hit in hits]
-        top_n_asins = [json.loads(doc.raw())['id'] for doc in docs]
+        top_n_asins = search_asins(keywords, search_engine)
         top_n_products = [product_item_dict[asin] for asin in top_n_asins if asin in product_item_dict]
     return top_n_products
 
 
+class SearchCache:
+    """
+    Search results of a search engine: ranked ASINs by normalized query, and the ASINs of the
+    documents the engine returned, which are otherwise parsed from each document's raw JSON
+    """
+    def __init__(self):
+        self.results = LRUCache(SEARCH_CACHE_SIZE)
+        self.doc_ids = LRUCache(DOC_ID_CACHE_SIZE)
+
+    def info(self):
+        return {'results': self.results.info(), 'doc_ids': self.doc_ids.info()}
+
+
+# Search caches of the process, by search engine
+_search_caches = weakref.WeakKeyDictionary()
+_search_caches_lock = threading.Lock()
+
+
+def get_search_cache(search_engine):
+    with _search_caches_lock:
+        cache = _search_caches.get(search_engine)
+        if cache is None:
+            cache = _search_caches[search_engine] = SearchCache()
+        return cache
+
+
+def normalize_keywords(keywords):
+    """Query of the search keywords, lowercased and single-spaced as the search analyzer sees it"""
+    return ' '.join(' '.join(keywords).lower().split())
+
+
+def search_asins(keywords, search_engine):
+    """Ranked ASINs of the top `SEARCH_RETURN_N` hits for `keywords`, cached by normalized query"""
+    cache = get_search_cache(search_engine)
+    query = normalize_keywords(keywords)
+    asins = cache.results.get(query)
+    if asins is None:
+        asins = _search(query, search_engine, cache)
+        cache.results.put(query, asins)
+    return asins
+
+
+def _search(query, search_engine, cache):
+    asins = []
+    for hit in search_engine.search(query, k=SEARCH_RETURN_N):
+        asin = cache.doc_ids.get(hit.docid)
+        if asin is None:
+            asin = json.loads(search_engine.doc(hit.docid).raw())['id']
+            cache.doc_ids.put(hit.docid, asin)
+        asins.append(asin)
+    return tuple(asins)
+
+
+def warm_search_cache(search_engine, queries, limit=SEARCH_CACHE_SIZE):
+    """
+    Run up to `limit` distinct `queries` that are not cached yet through the search cache of
+    `search_engine`, without counting them as lookups of its results
+    """
+    cache = get_search_cache(search_engine)
+    n_searched = 0
+    for query in dict.fromkeys(normalize_keywords([q]) for q in queries):
+        if n_searched >= limit:
+            break
+        if query in cache.results:
+            continue
+        cache.results.put(query, _search(query, search_engine, cache))
+        n_searched += 1
+    return n_searched
+
+
+def search_cache_info(search_engine):
+    """Hit rates and sizes of the search cache of `search_engine`"""
+    return get_search_cache(search_engine).info()
+
+
 def get_product_per_page(top_n_products, page):
     return top_n_products[(page - 1) * PRODUCT_WINDOW:page * PRODUCT_WINDOW]
 
@@ -192,7 +518,12 @@ def generate_product_prices(all_products):
     return product_prices
 
 
-def init_search_engine(num_products=None):
+def init_search_engine(num_products=None, backend=SEARCH_ENGINE):
+    """
+    Search engine over the products, `backend` being 'lucene' for the pyserini index of
+    `search_engine/run_indexing.sh` or 'bm25' for a `BM25Searcher`, whose index is built from the
+    same documents on first use and memory-mapped afterwards
+    """
     if num_products == 100:
         indexes = 'indexes_100'
     elif num_products == 1000:
@@ -203,7 +534,18 @@ def init_search_engine(num_products=None):
         indexes = 'indexes'
     else:
         raise NotImplementedError(f'num_products being {num_products} is not supported yet.')
-    search_engine = LuceneSearcher(os.path.join(BASE_DIR, f'../search_engine/{indexes}'))
+    if backend == 'lucene':
+        from pyserini.search.lucene import LuceneSearcher
+        search_engine = LuceneSearcher(os.path.join(BASE_DIR, f'../search_engine/{indexes}'))
+    elif backend == 'bm25':
+        from web_agent_site.engine.bm25 import BM25Searcher
+        resources = indexes.replace('indexes', 'resources')
+        search_engine = BM25Searcher.from_index_dir(
+            os.path.join(BASE_DIR, f'../search_engine/bm25_{indexes}'),
+            documents_path=os.path.join(BASE_DIR, f'../search_engine/{resources}/documents.jsonl'),
+        )
+    else:
+        raise ValueError(f'Search engine backend {backend} is not supported.')
     return search_engine
 
 
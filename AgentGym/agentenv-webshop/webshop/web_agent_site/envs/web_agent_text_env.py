@@ -2,6 +2,7 @@ import gym
 import json
 import random
 import string
+import threading
 import time
 import torch
 
@@ -13,7 +14,12 @@ from web_agent_site.engine.engine import (
     load_products,
     init_search_engine,
     get_top_n_product_from_keywords,
-    map_action_to_html,
+    search_cache_info,
+    warm_search_cache,
+    render_page,
+    map_action_to_text_nodes,
+    map_action_to_clickables,
+    html_text_node,
     parse_action,
     get_product_per_page,
     ACTION_TO_TEMPLATE,
@@ -50,6 +56,7 @@ class WebAgentTextEnv(gym.Env):
         session
         session_prefix
         show_attrs
+        warm_search_cache
         """
         super(WebAgentTextEnv, self).__init__()
         self.observation_mode = observation_mode
@@ -66,6 +73,7 @@ class WebAgentTextEnv(gym.Env):
             self.kwargs.get('num_products'),
             self.kwargs.get('human_goals'),
             self.kwargs.get('show_attrs', False),
+            self.kwargs.get('warm_search_cache', False),
         ) if server is None else server
         self.browser = SimBrowser(self.server)
 
@@ -124,6 +132,14 @@ class WebAgentTextEnv(gym.Env):
 
     def get_available_actions(self):
         """Returns list of available actions at the current step"""
+        if self.observation_mode == 'text':
+            # Built from the page's values, as the HTML below would give them
+            has_search_bar, clickables = self.browser.page.clickables()
+            self.text_to_clickable = dict(clickables)
+            return dict(
+                has_search_bar=has_search_bar,
+                clickables=list(self.text_to_clickable.keys()),
+            )
         html_obj = self._parse_html()
 
         # Collect search bar, buttons, links, and options as clickables
@@ -159,6 +175,11 @@ class WebAgentTextEnv(gym.Env):
 
     def get_instruction_text(self):
         """Get corresponding instruction text for current environment session"""
+        page = self.browser.page
+        if self.observation_mode == 'text' and page.action != f'click[{END_BUTTON}]':
+            header = 'Instruction: ' if page.action == 'start' else 'Instruction:'
+            instruction_text = html_text_node(str(page.kwargs.get('instruction_text'))) or ''
+            return header + instruction_text
         html_obj = self._parse_html(self.browser.page_source)
         instruction_text = html_obj.find(id='instruction-text').h4.text
         return instruction_text
@@ -179,13 +200,16 @@ class WebAgentTextEnv(gym.Env):
     @property
     def observation(self):
         """Compiles state into either the `html` or `text` observation mode"""
-        html = self.state['html']
         if self.observation_mode == 'html':
-            return html
+            return self.state['html']
         elif self.observation_mode == 'text':
-            return self.convert_html_to_text(html, simple=True)
+            # Built from the page's values, unless only its HTML has it
+            text = self.browser.page.text()
+            if text is None:
+                text = self.convert_html_to_text(self.state['html'], simple=True)
+            return text
         elif self.observation_mode == 'text_rich':
-            return self.convert_html_to_text(html, simple=False)
+            return self.convert_html_to_text(self.state['html'], simple=False)
         elif self.observation_mode == 'url':
             return self.state['url']
         else:
@@ -271,6 +295,94 @@ def tag_visible(element):
     )
 
 
+class Page:
+    """
+    Page of the simulated WebShop application, kept as the action and values it is rendered
+    from: its HTML is rendered on first use, while the `text` observation and the clickables
+    are built from the values directly
+    """
+    def __init__(self, server, action, **kwargs):
+        self.server = server
+        self.action = action
+        # The session keeps updating its options dict
+        if 'options' in kwargs:
+            kwargs['options'] = dict(kwargs['options'])
+        self.kwargs = kwargs
+        self._html = None
+
+    @property
+    def html(self):
+        """HTML of the page, rendered by the templates of the WebShop application"""
+        if self._html is None:
+            old_time = time.time()
+            with app.app_context(), app.test_request_context():
+                self._html, cached = render_page(self.action, **self.kwargs)
+            self.server.render_time += time.time() - old_time
+            if cached:
+                self.server.render_cache_hits += 1
+            else:
+                self.server.render_count += 1
+        return self._html
+
+    def text(self):
+        """Observation of `text` mode, or None if only the HTML gives it"""
+        nodes = map_action_to_text_nodes(self.action, **self.kwargs)
+        if nodes is None:
+            return None
+        return ' [SEP] '.join(node.strip() for node in nodes if node != '\n')
+
+    def clickables(self):
+        """`(has_search_bar, [(name, attrs), ...])` of the page's search bar and clickables"""
+        return map_action_to_clickables(self.action, **self.kwargs)
+
+
+class Catalog:
+    """Read-only products, search engine and goals of the WebShop simulator, shared by `SimServer`s"""
+    def __init__(self, file_path, num_products=None, human_goals=0):
+        self.all_products, self.product_item_dict, self.product_prices, _ = \
+            load_products(filepath=file_path, num_products=num_products, human_goals=human_goals)
+        self.search_engine = init_search_engine(num_products=num_products)
+        self.goals = get_goals(self.all_products, self.product_prices, human_goals)
+        print(f'Loaded {len(self.goals)} goals.')
+
+        # HBY: Fix outcome for random shuffling of goals
+        random.seed(233)
+        random.shuffle(self.goals)
+        self.random_state = random.getstate()
+
+        self.weights = [goal['weight'] for goal in self.goals]
+        self.cum_weights = [0]
+        for w in self.weights:
+            self.cum_weights.append(self.cum_weights[-1] + w)
+        self.search_cache_warmed = False
+
+    def warm_search_cache(self):
+        """Search the goals' product queries, then their instructions, ahead of the agents"""
+        if self.search_cache_warmed:
+            return
+        queries = [goal['query'] for goal in self.goals]
+        queries += [goal['instruction_text'] for goal in self.goals]
+        n_searched = warm_search_cache(self.search_engine, queries)
+        self.search_cache_warmed = True
+        print(f'Warmed the search cache with {n_searched} queries.')
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(file_path, num_products=None, human_goals=0):
+    """
+    Returns the `Catalog` for the given arguments, loaded on first use and then shared by all
+    `SimServer`s of the process, so that creating an environment only creates its sessions
+    """
+    key = (file_path, num_products, bool(human_goals))
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = Catalog(file_path, num_products, human_goals)
+        return _catalogs[key]
+
+
 class SimServer:
     """Lightweight simulator of WebShop Flask application for generating HTML observations"""
     def __init__(
@@ -282,6 +394,7 @@ class SimServer:
         num_products=None,
         human_goals=0,
         show_attrs=False,
+        warm_search_cache=False,
     ):
         """
         Constructor for simulated server serving WebShop application
@@ -291,20 +404,23 @@ class SimServer:
         limit_goals (`int`) -- Limit to number of goals available
         num_products (`int`) -- Number of products to search across
         human_goals (`bool`) -- If true, load human goals; otherwise, load synthetic goals
+        warm_search_cache (`bool`) -- If true, search the goals' queries into the search cache
         """
-        # Load all products, goals, and search engine
+        # Products, goals, and search engine are loaded once per process and shared
+        catalog = get_catalog(file_path, num_products, human_goals)
+        if warm_search_cache:
+            catalog.warm_search_cache()
         self.base_url = base_url
-        self.all_products, self.product_item_dict, self.product_prices, _ = \
-            load_products(filepath=file_path, num_products=num_products, human_goals=human_goals)
-        self.search_engine = init_search_engine(num_products=num_products)
-        self.goals = get_goals(self.all_products, self.product_prices, human_goals)
+        self.all_products = catalog.all_products
+        self.product_item_dict = catalog.product_item_dict
+        self.product_prices = catalog.product_prices
+        self.search_engine = catalog.search_engine
+        self.goals = catalog.goals
         self.show_attrs = show_attrs
-        print(f'Loaded {len(self.goals)} goals.')
-
 
         # HBY: Fix outcome for random shuffling of goals
-        random.seed(233)
-        random.shuffle(self.goals)
+        # (the catalog shuffled them, leave `random` as the shuffle did)
+        random.setstate(catalog.random_state)
 
         # Apply `filter_goals` parameter if exists to select speific goal(s)
         if filter_goals is not None:
@@ -329,26 +445,37 @@ class SimServer:
         print(f'Loaded {len(self.goals)} goals.')
 
         # Set extraneous housekeeping variables
-        self.weights = [goal['weight'] for goal in self.goals]
-        self.cum_weights = [0]
-        for w in self.weights:
-            self.cum_weights.append(self.cum_weights[-1] + w)
+        if self.goals is catalog.goals:
+            self.weights = catalog.weights
+            self.cum_weights = catalog.cum_weights
+        else:
+            self.weights = [goal['weight'] for goal in self.goals]
+            self.cum_weights = [0]
+            for w in self.weights:
+                self.cum_weights.append(self.cum_weights[-1] + w)
         self.user_sessions = dict()
         self.search_time = 0
         self.render_time = 0
+        self.render_count = 0  # pages rendered by the templates
+        self.render_cache_hits = 0  # pages returned by the page cache
         self.sample_time = 0
         self.assigned_instruction_text = None  # TODO: very hacky, should remove
+
+    def search_cache_info(self):
+        """Hit rates and sizes of the process-wide search cache of this server's search engine"""
+        return search_cache_info(self.search_engine)
         
     @app.route('/', methods=['GET', 'POST'])
     def index(self, session_id, **kwargs):
         """Redirect to the search page with the given session ID"""
-        html = map_action_to_html(
+        page = Page(
+            self,
             'start',
             session_id=session_id,
             instruction_text=kwargs['instruction_text'],
         )
         url = f'{self.base_url}/{session_id}'
-        return html, url
+        return page, url
     
     @app.route('/', methods=['GET', 'POST'])
     def search_results(self, session_id, **kwargs):
@@ -382,9 +509,8 @@ class SimServer:
             f'{keywords_url_string}/{page}'
         )
 
-        # Render HTML search page and record amount of time taken
-        old_time = time.time()
-        html = map_action_to_html(
+        page = Page(
+            self,
             'search',
             session_id=session_id,
             products=products,
@@ -393,8 +519,7 @@ class SimServer:
             total=len(top_n_products),
             instruction_text=session["goal"]["instruction_text"],
         )
-        self.render_time += time.time() - old_time
-        return html, url
+        return page, url
     
     @app.route('/', methods=['GET', 'POST'])
     def item_page(self, session_id, **kwargs):
@@ -426,7 +551,8 @@ class SimServer:
             f'{session["page"]}/{option_string}'
         )
 
-        html = map_action_to_html(
+        page = Page(
+            self,
             'click',
             session_id=session_id,
             product_info=product_info,
@@ -437,7 +563,7 @@ class SimServer:
             instruction_text=session["goal"]["instruction_text"],
             show_attrs=self.show_attrs,
         )
-        return html, url
+        return page, url
 
     @app.route('/', methods=['GET', 'POST'])
     def item_sub_page(self, session_id, **kwargs):
@@ -458,7 +584,8 @@ class SimServer:
             f'{session["asin"]}/{keywords_url_string}/{session["page"]}/'
             f'{clickable_name}/{session["options"]}'
         )
-        html = map_action_to_html(
+        page = Page(
+            self,
             f'click[{clickable_name}]',
             session_id=session_id,
             product_info=product_info,
@@ -468,7 +595,7 @@ class SimServer:
             options=session["options"],
             instruction_text=session["goal"]["instruction_text"],
         )
-        return html, url
+        return page, url
 
     @app.route('/', methods=['GET', 'POST'])
     def done(self, session_id, **kwargs):
@@ -496,7 +623,8 @@ class SimServer:
             f'{self.base_url}/done/{session_id}/'
             f'{session["asin"]}/{session["options"]}'
         )
-        html = map_action_to_html(
+        page = Page(
+            self,
             f'click[{END_BUTTON}]',
             session_id=session_id,
             reward=reward,
@@ -504,7 +632,7 @@ class SimServer:
             options=session["options"],
             instruction_text=session["goal"]["instruction_text"],
         )
-        return html, url, reward
+        return page, url, reward
     
     def receive(self, session_id, current_url, session_int=None, **kwargs):
         """Map action to the corresponding page"""
@@ -525,14 +653,18 @@ class SimServer:
             if self.assigned_instruction_text is not None:
                 print(f"---------------3----------------")
                 instruction_text = self.assigned_instruction_text  # TODO: very hacky, should remove
-                self.user_sessions[session_id]['goal']['instruction_text'] = instruction_text
+                # goals are shared with other servers, so the session gets its own copy
+                self.user_sessions[session_id]['goal'] = {
+                    **self.user_sessions[session_id]['goal'],
+                    'instruction_text': instruction_text,
+                }
             session = self.user_sessions[session_id]
 
             if not kwargs:
                 print(f"---------------4----------------")
                 # If no action, reset the session variables
                 kwargs['instruction_text'] = instruction_text
-                html, url = self.index(session_id, **kwargs)
+                page, url = self.index(session_id, **kwargs)
                 self.user_sessions[session_id].update(
                     {
                         'keywords': None,
@@ -545,21 +677,21 @@ class SimServer:
                 )
             elif 'keywords' in kwargs:
                 # If search keywords are available, run a search
-                html, url = self.search_results(session_id, **kwargs)
+                page, url = self.search_results(session_id, **kwargs)
             elif 'clickable_name' in kwargs:
                 clickable_name = kwargs['clickable_name'].lower()
                 if clickable_name == END_BUTTON.lower():
                     # If "buy now" clicked, calculate reward and flag session as terminated
-                    html, url, reward = self.done(session_id, **kwargs)
+                    page, url, reward = self.done(session_id, **kwargs)
                     status['reward'] = reward
                     status['done'] = True
                 elif clickable_name == BACK_TO_SEARCH.lower():
                     # If "back to search" clicked, recursively reset the session back to search page
-                    html, url, status = self.receive(session_id, current_url)
+                    page, url, status = self.receive(session_id, current_url)
                 elif (clickable_name == NEXT_PAGE.lower() and 
                       self.get_page_name(current_url) == 'search_results'):
                     # If "next page" clicked from search results, re-render with `page` enumerated
-                    html, url, status = self.receive(
+                    page, url, status = self.receive(
                         session_id,
                         current_url,
                         keywords=session["keywords"],
@@ -568,7 +700,7 @@ class SimServer:
                 elif (clickable_name == PREV_PAGE.lower() and 
                       self.get_page_name(current_url) == 'search_results'):
                     # If "prev page" clicked from search results, re-render with `page` denumerated
-                    html, url, status = self.receive(
+                    page, url, status = self.receive(
                         session_id,
                         current_url,
                         keywords=session["keywords"],
@@ -577,11 +709,11 @@ class SimServer:
                 elif (clickable_name == PREV_PAGE.lower() and 
                       self.get_page_name(current_url) == 'item_sub_page'):
                     # If "prev page" clicked from sub page, return to corresponding item page
-                    html, url = self.item_page(session_id, **kwargs)
+                    page, url = self.item_page(session_id, **kwargs)
                 elif (clickable_name == PREV_PAGE.lower() and 
                       self.get_page_name(current_url) == 'item_page'):
                     # If "prev page" clicked from item page, return to search results page
-                    html, url = self.search_results(
+                    page, url = self.search_results(
                         session_id,
                         keywords=session["keywords"],
                         page=session["page"],
@@ -589,11 +721,11 @@ class SimServer:
                     )
                 elif clickable_name in [k.lower() for k in ACTION_TO_TEMPLATE]:
                     # Render item_sub_page if clickable is description, features, or reviews
-                    html, url = self.item_sub_page(session_id, **kwargs)
+                    page, url = self.item_sub_page(session_id, **kwargs)
                 else:
                     # Otherwise, render current item page
-                    html, url = self.item_page(session_id, **kwargs)
-            return html, url, status
+                    page, url = self.item_page(session_id, **kwargs)
+            return page, url, status
     
     def get_page_name(self, url):
         """Determine which page (i.e. item_page, search_results) the given URL is pointing at"""
@@ -616,19 +748,24 @@ class SimBrowser:
     def __init__(self, server):
         self.server = server
         self.current_url = None
-        self.page_source = None
+        self.page = None
         self.session_id = None
 
+    @property
+    def page_source(self):
+        """HTML of the current page"""
+        return self.page.html if self.page is not None else None
+
     def get(self, url, session_id=None, session_int=None):
         """Set browser variables to corresponding link, page HTML for URL"""
         self.session_id = url.split('/')[-1] if session_id is None else session_id
-        self.page_source, _, _ = \
+        self.page, _, _ = \
             self.server.receive(self.session_id, self.current_url, session_int=session_int)
         self.current_url = url
     
     def click(self, clickable_name, text_to_clickable):
         """Wrapper for `receive` handler for performing click action on current page"""
-        self.page_source, self.current_url, status = \
+        self.page, self.current_url, status = \
             self.server.receive(
                 self.session_id,
                 current_url=self.current_url,
@@ -641,7 +778,7 @@ class SimBrowser:
         """Wrapper for `receive` handler for performing search action on current page"""
         if isinstance(keywords, str):
             keywords = keywords.split(' ')
-        self.page_source, self.current_url, status = \
+        self.page, self.current_url, status = \
             self.server.receive(
                 self.session_id,
                 current_url=self.current_url,
@@ -2,10 +2,13 @@ import bisect
 import hashlib
 import logging
 import random
+from os import environ
 from os.path import dirname, abspath, join
 
 BASE_DIR = dirname(abspath(__file__))
 DEBUG_PROD_SIZE = None  # set to `None` to disable
+# 'lucene' (pyserini indexes, needs a JVM) or 'bm25' (NumPy, see `engine/bm25.py`)
+SEARCH_ENGINE = environ.get('WEBSHOP_SEARCH_ENGINE', 'lucene')
 
 DEFAULT_ATTR_PATH = join(BASE_DIR, '../data/items_ins_v2_1000.json')
 DEFAULT_FILE_PATH = join(BASE_DIR, '../data/items_shuffle_1000.json')
@@ -1,6 +1,7 @@
 from .agent import (
     Agent,
     APIAgent,
+    AsyncAPIAgent,
     BaseChatTemplate,
     ChatGLM4Template,
     ChatMLTemplate,
@@ -8,7 +9,21 @@ from .agent import (
     Llama3Template,
 )
 from .env import BaseEnvClient, StepOutput
+from .local import LocalEnvSession
+from .replicas import EnvServerPool
+from .response_cache import ResponseCache
+from .rollout_workers import RolloutWorkerPool
 from .task import BaseTask
+from .tracing import RolloutTracer
+from .transport import (
+    AsyncEnvTransport,
+    EnvServerError,
+    EnvTransport,
+    WebSocketEnvSession,
+    configure_env_transport,
+    get_async_env_transport,
+    get_env_transport,
+)
 from .types import ActionFormat, ActionWithTought, ConversationMessage
 from .utils import (
     BaseAdapter,
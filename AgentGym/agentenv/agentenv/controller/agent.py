@@ -3,19 +3,34 @@ import math
 import os
 import random
 import shutil
+import threading
+import weakref
 from abc import ABCMeta, abstractmethod
 from pathlib import Path
+from typing import Sequence
 
 import torch
 from torch.nn.parallel import DistributedDataParallel
 from transformers import GenerationConfig, PreTrainedModel, PreTrainedTokenizerBase
+from transformers import __version__ as transformers_version
 from transformers.generation.utils import GenerateOutput
 
+try:
+    from transformers import DynamicCache
+except ImportError:  # transformers < 4.36
+    DynamicCache = None
+
+from .response_cache import ResponseCache
+from .tracing import trace_span
 from .types import ConversationMessage, APIConversationMessage, InferenceEngine, TokenizedConversationOutput
 
+import asyncio
 import time
 from typing import Tuple
-from openai import OpenAI
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
 
 try:
     import torch_npu
@@ -24,6 +39,18 @@ except ImportError:
 
 
 class BaseChatTemplate(metaclass=ABCMeta):
+    # bodies used to check that a header/footer pair can be encoded separately from the message body
+    _split_probes = (
+        "",
+        "a",
+        " a ",
+        "\n",
+        "\n\nThought:\nI think ...\n\nAction:\nclick[Buy Now]\n",
+        "  \t indented\r\n",
+        "é 中文 🙂",
+        "[/INST] <|",
+    )
+
     @abstractmethod
     def tokenize_conversation_one(
         self,
@@ -58,6 +85,126 @@ class BaseChatTemplate(metaclass=ABCMeta):
             }
         )
 
+    def tokenize_conversation_start(
+        self,
+        conversation_start: Sequence[ConversationMessage],
+        tokenizer: PreTrainedTokenizerBase,
+    ) -> TokenizedConversationOutput:
+        """
+        Same as `tokenize_conversation(conversation_start, tokenizer)`, but the result is cached,
+        since every episode of a task starts with the same (long) instruction messages.
+        A new copy is returned, so the caller may extend it.
+        """
+        # per tokenizer, created here so that subclasses need not call `super().__init__()`
+        cache = self.__dict__.setdefault(
+            "_conversation_start_cache", weakref.WeakKeyDictionary()
+        ).setdefault(tokenizer, {})
+        key = tuple(
+            (message["from"], message["loss"], message["value"])
+            for message in conversation_start
+        )
+        cached = cache.get(key)
+        if cached is None:
+            cached = self.tokenize_conversation(list(conversation_start), tokenizer)
+            cache[key] = cached
+        return TokenizedConversationOutput(
+            {
+                "text": cached["text"],
+                "input_ids": list(cached["input_ids"]),
+                "action_mask": list(cached["action_mask"]),
+            }
+        )
+
+    def _encode_wrapped(
+        self,
+        tokenizer: PreTrainedTokenizerBase,
+        header: str,
+        body: str,
+        footer: str,
+    ) -> list[int]:
+        """
+        Equivalent to `tokenizer.encode(header + body + footer, add_special_tokens=False)`.
+        The parts of the header before its last special token and of the footer from its first special
+        token are encoded once per tokenizer, so only the message body is encoded on every call.
+        Tokenizers for which the split changes the result fall back to encoding the whole text.
+        """
+        # pre-tokenized role wrappers per tokenizer, created lazily like the conversation start cache
+        wrappers = self.__dict__.setdefault(
+            "_wrapper_cache", weakref.WeakKeyDictionary()
+        ).setdefault(tokenizer, {})
+        wrapper = wrappers.get((header, footer), False)
+        if wrapper is False:
+            wrapper = self._split_wrapper(tokenizer, header, footer)
+            wrappers[(header, footer)] = wrapper
+        if wrapper is None:
+            return tokenizer.encode(header + body + footer, add_special_tokens=False)
+        header_ids, body_prefix, body_suffix, footer_ids = wrapper
+        return (
+            header_ids
+            + tokenizer.encode(body_prefix + body + body_suffix, add_special_tokens=False)
+            + footer_ids
+        )
+
+    def _split_wrapper(
+        self,
+        tokenizer: PreTrainedTokenizerBase,
+        header: str,
+        footer: str,
+    ) -> tuple[list[int], str, str, list[int]] | None:
+        special_tokens = set(tokenizer.all_special_tokens)
+        special_tokens.update(getattr(tokenizer, "added_tokens_encoder", {}).keys())
+        special_tokens.discard("")
+
+        header_end = 0
+        for token in special_tokens:
+            position = header.rfind(token)
+            if position != -1:
+                header_end = max(header_end, position + len(token))
+        footer_start = len(footer)
+        for token in special_tokens:
+            position = footer.find(token)
+            if position != -1:
+                footer_start = min(footer_start, position)
+        if header_end == 0 and footer_start == len(footer):
+            return None  # nothing to save
+
+        header_ids = tokenizer.encode(header[:header_end], add_special_tokens=False)
+        footer_ids = tokenizer.encode(footer[footer_start:], add_special_tokens=False)
+        body_prefix, body_suffix = header[header_end:], footer[:footer_start]
+        for probe in self._split_probes:
+            expected = tokenizer.encode(header + probe + footer, add_special_tokens=False)
+            split = (
+                header_ids
+                + tokenizer.encode(
+                    body_prefix + probe + body_suffix, add_special_tokens=False
+                )
+                + footer_ids
+            )
+            if split != expected:
+                return None
+        return header_ids, body_prefix, body_suffix, footer_ids
+
+
+class KVCache:
+    """
+    Key/value cache of one episode, kept between rounds by the default inference engine
+    so that only the tokens appended since the last round are prefilled.
+    """
+
+    def __init__(self) -> None:
+        self.past_key_values = None
+        # token ids whose keys and values are held in past_key_values
+        self.token_ids: list[int] = []
+
+    def reusable_length(self, input_ids: list[int]) -> int:
+        n = 0
+        for cached_id, input_id in zip(self.token_ids, input_ids):
+            if cached_id != input_id:
+                break
+            n += 1
+        # the model has to be fed at least one token
+        return min(n, len(input_ids) - 1)
+
 
 class Agent:
     def __init__(
@@ -66,19 +213,62 @@ class Agent:
         tokenizer: PreTrainedTokenizerBase,
         chat_template: BaseChatTemplate | None = None,
         inference_engine: InferenceEngine = "default",
+        reuse_kv_cache: bool = False,
     ) -> None:
         self.model = model
         self.tokenizer = tokenizer
         self.chat_template = chat_template or Llama2Template()
         self.inference_engine = InferenceEngine(inference_engine)
+        if (
+            reuse_kv_cache
+            and self.inference_engine == InferenceEngine.DEFAULT
+            and not hasattr(DynamicCache, "crop")
+        ):
+            raise ImportError(
+                "reuse_kv_cache needs a transformers release whose DynamicCache has crop(), "
+                f"transformers {transformers_version} is installed. Upgrade it or pass reuse_kv_cache=False."
+            )
+        self.reuse_kv_cache = reuse_kv_cache
         self._vllm = None
+        # concurrent rollouts share one model, so generation calls are serialized
+        self._generate_lock = threading.Lock()
+        # number of prompt tokens run through the model by the default inference engine
+        self.prefilled_tokens = 0
+
+    def new_kv_cache(self) -> KVCache | None:
+        """
+        Create the per-episode cache, or None if caching is disabled.
+        vLLM manages its own prefix cache.
+        """
+        if self.reuse_kv_cache and self.inference_engine == InferenceEngine.DEFAULT:
+            return KVCache()
+        return None
 
-    @torch.no_grad()
     def generate(
         self,
-        input_ids: list[int],
+        input_ids: list[list[int]],
         generation_config: GenerationConfig,
         refresh_engine: bool = False,
+        kv_caches: list[KVCache | None] | None = None,
+    ) -> torch.Tensor:
+        with self._generate_lock, trace_span(
+            "generate",
+            batch_size=len(input_ids),
+            prompt_tokens=sum(len(ids) for ids in input_ids),
+        ) as span:
+            outputs = self._generate(
+                input_ids, generation_config, refresh_engine, kv_caches
+            )
+            span.set(generated_tokens=sum(len(ids) for ids in outputs))
+            return outputs
+
+    @torch.no_grad()
+    def _generate(
+        self,
+        input_ids: list[list[int]],
+        generation_config: GenerationConfig,
+        refresh_engine: bool = False,
+        kv_caches: list[KVCache | None] | None = None,
     ) -> torch.Tensor:
         if isinstance(self.model, DistributedDataParallel):
             model = self.model.module
@@ -142,35 +332,40 @@ class Agent:
                 shutil.rmtree(shm_path)
 
             INF = float("inf")
-            max_tokens = generation_config.max_new_tokens or INF
-            if generation_config.max_length:
-                max_length = generation_config.max_length - len(input_ids)
-            else:
-                max_length = INF
-            max_tokens = min(max_tokens, max_length)
-            if max_tokens == INF:
-                max_tokens = None
-
-            generation_config = {
-                "repetition_penalty": generation_config.repetition_penalty,
-                "temperature": generation_config.temperature,
-                "top_p": generation_config.top_p,
-                "top_k": generation_config.top_k,
-                "min_p": generation_config.min_p,
-                # "length_penalty": generation_config.length_penalty,
-                "early_stopping": generation_config.early_stopping,
-                "max_tokens": max_tokens,
-                "min_new_tokens": generation_config.min_new_tokens,
-                "stop_token_ids": [self.tokenizer.eos_token_id],
-            }
-            generation_config = {k: v for k, v in generation_config.items() if v}
+            sampling_params = []
+            for prompt_ids in input_ids:
+                max_tokens = generation_config.max_new_tokens or INF
+                if generation_config.max_length:
+                    max_length = generation_config.max_length - len(prompt_ids)
+                else:
+                    max_length = INF
+                max_tokens = min(max_tokens, max_length)
+                if max_tokens == INF:
+                    max_tokens = None
+
+                sampling_config = {
+                    "repetition_penalty": generation_config.repetition_penalty,
+                    "temperature": generation_config.temperature,
+                    "top_p": generation_config.top_p,
+                    "top_k": generation_config.top_k,
+                    "min_p": generation_config.min_p,
+                    # "length_penalty": generation_config.length_penalty,
+                    "early_stopping": generation_config.early_stopping,
+                    "max_tokens": max_tokens,
+                    "min_new_tokens": generation_config.min_new_tokens,
+                    "stop_token_ids": [self.tokenizer.eos_token_id],
+                }
+                sampling_config = {k: v for k, v in sampling_config.items() if v}
+                sampling_params.append(
+                    SamplingParams.from_optional(
+                        **sampling_config,
+                        detokenize=False,
+                    )
+                )
             output = llm.generate(
                 # prompts=TokensPrompt(prompt_token_ids=input_ids),
                 prompt_token_ids=input_ids,
-                sampling_params=SamplingParams.from_optional(
-                    **generation_config,
-                    detokenize=False,
-                ),
+                sampling_params=sampling_params,
                 use_tqdm=False,
             )
 
@@ -179,19 +374,98 @@ class Agent:
             for o in output:
                 generated_tokens.append(list(o.outputs[0].token_ids))
 
+        elif kv_caches is not None and len(input_ids) == 1 and kv_caches[0] is not None:
+            generated_tokens = [
+                self._generate_with_kv_cache(
+                    model, list(input_ids[0]), generation_config, kv_caches[0]
+                )
+            ]
+
         else:
+            # left-pad the prompts so that every row generates from the same position
+            pad_token_id = generation_config.pad_token_id
+            if pad_token_id is None:
+                pad_token_id = self.tokenizer.pad_token_id
+            if pad_token_id is None:
+                pad_token_id = self.tokenizer.eos_token_id
+            max_input_length = max(len(prompt_ids) for prompt_ids in input_ids)
+            padded_input_ids = []
+            attention_mask = []
+            for prompt_ids in input_ids:
+                n_pad = max_input_length - len(prompt_ids)
+                padded_input_ids.append([pad_token_id] * n_pad + list(prompt_ids))
+                attention_mask.append([0] * n_pad + [1] * len(prompt_ids))
+
             output = model.generate(
-                inputs=torch.tensor(input_ids, device=model.device),
+                inputs=torch.tensor(padded_input_ids, device=model.device),
+                attention_mask=torch.tensor(attention_mask, device=model.device),
                 generation_config=generation_config,
             )
             if isinstance(output, GenerateOutput):
                 output = output.sequences
             generated_tokens = [
-                o[len(input_ids[0]) :].cpu().numpy().tolist() for o in output
+                self._strip_padding(o[max_input_length:].cpu().numpy().tolist())
+                for o in output
             ]
+            self.prefilled_tokens += sum(len(prompt_ids) for prompt_ids in input_ids)
 
         return generated_tokens
 
+    def _generate_with_kv_cache(
+        self,
+        model: PreTrainedModel,
+        input_ids: list[int],
+        generation_config: GenerationConfig,
+        kv_cache: KVCache,
+    ) -> list[int]:
+        n_cached = kv_cache.reusable_length(input_ids)
+        past_key_values = kv_cache.past_key_values
+        if past_key_values is None or n_cached == 0:
+            past_key_values = DynamicCache()
+            n_cached = 0
+        elif past_key_values.get_seq_length() > n_cached:
+            past_key_values.crop(n_cached)
+
+        output = model.generate(
+            inputs=torch.tensor([input_ids], device=model.device),
+            attention_mask=torch.ones(
+                (1, len(input_ids)), dtype=torch.long, device=model.device
+            ),
+            generation_config=generation_config,
+            past_key_values=past_key_values,
+            return_dict_in_generate=True,
+        )
+        generated_tokens = self._strip_padding(
+            output.sequences[0][len(input_ids) :].cpu().numpy().tolist()
+        )
+        self.prefilled_tokens += len(input_ids) - n_cached
+
+        # the last generated token has not been fed to the model yet
+        kv_cache.past_key_values = output.past_key_values
+        kv_cache.token_ids = (input_ids + generated_tokens)[
+            : kv_cache.past_key_values.get_seq_length()
+        ]
+        return generated_tokens
+
+    def _strip_padding(self, tokens: list[int]) -> list[int]:
+        """
+        Rows that finish early in a batch are filled with padding after the eos token.
+        """
+        eos_token_id = self.tokenizer.eos_token_id
+        if eos_token_id in tokens:
+            return tokens[: tokens.index(eos_token_id) + 1]
+        return tokens
+
+
+def _usage_args(response) -> dict:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "generated_tokens": usage.completion_tokens,
+    }
+
 
 class APIAgent:
     def __init__(
@@ -202,6 +476,7 @@ class APIAgent:
         max_tokens: int = 4096,
         temperature: float = 1,
         top_p: float = 1,
+        response_cache: ResponseCache | str | None = None,
     ) -> None:
         self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.model = model
@@ -209,28 +484,241 @@ class APIAgent:
         self.temperature = temperature
         self.top_p = top_p
         # self.role = {"system": "system", "human": "user", "gpt": "assistant"}
+        if isinstance(response_cache, str):
+            response_cache = ResponseCache(response_cache)
+        self.response_cache = response_cache
+
+    def _cache_key(self, conversation: list[APIConversationMessage]) -> str:
+        return ResponseCache.make_key(
+            self.model,
+            [{"role": c["role"], "content": c["content"]} for c in conversation],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            top_p=self.top_p,
+        )
 
     def generate(
         self,
         conversation: list[APIConversationMessage],
+    ) -> Tuple[str, str | None]:
+        if self.response_cache is None:
+            return self._generate(conversation)
+        key = self._cache_key(conversation)
+        with trace_span("generate.cache_lookup") as span:
+            cached = self.response_cache.get(key)
+            span.set(hit=cached is not None)
+        if cached is not None:
+            return cached
+        content, reasoning_content = self._generate(conversation)
+        self.response_cache.put(key, content, reasoning_content)
+        return content, reasoning_content
+
+    def _generate(
+        self,
+        conversation: list[APIConversationMessage],
     ) -> Tuple[str, str | None]:
         while True:
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    # messages=[{"role": self.role[c["from"]], "content": c["value"]} for c in conversation],
-                    # messages=conversation,
-                    messages=[{"role": c["role"], "content": c["content"]} for c in conversation],
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    top_p=self.top_p
-                )
+                with trace_span("generate", messages=len(conversation)) as span:
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        # messages=[{"role": self.role[c["from"]], "content": c["value"]} for c in conversation],
+                        # messages=conversation,
+                        messages=[{"role": c["role"], "content": c["content"]} for c in conversation],
+                        max_tokens=self.max_tokens,
+                        temperature=self.temperature,
+                        top_p=self.top_p
+                    )
+                    span.set(**_usage_args(response))
                 return response.choices[0].message.content, response.choices[0].message.reasoning_content if hasattr(response.choices[0].message, "reasoning_content") else None
             except Exception as e:
                 print(e)
                 time.sleep(1)
 
 
+class _TokenBucket:
+    """
+    Asyncio token bucket: `rate` requests per second, with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncAPIAgent(APIAgent):
+    """
+    APIAgent with an asyncio-native `agenerate`, meant to drive many episodes from one process
+    (see `BaseTask.agenerate_experience`). All requests share one pooled HTTP client, at most
+    `max_concurrency` of them are in flight, `requests_per_second` optionally rate-limits them,
+    and 429 / 5xx / timeout / connection errors are retried with jittered exponential backoff.
+    The HTTP client belongs to the event loop of the first request: `await aclose()` in that loop
+    before using the agent in another one. The blocking `generate` of APIAgent is still available.
+    """
+
+    _retryable_errors = (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+    )
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        max_tokens: int = 4096,
+        temperature: float = 1,
+        top_p: float = 1,
+        max_concurrency: int = 64,
+        requests_per_second: float | None = None,
+        burst: int | None = None,
+        request_timeout: float = 600,
+        max_retries: int = 8,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        response_cache: ResponseCache | str | None = None,
+    ) -> None:
+        super().__init__(
+            api_key=api_key,
+            base_url=base_url,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            response_cache=response_cache,
+        )
+        if burst is not None and burst < 1:
+            raise ValueError(f"burst must be at least 1, got {burst}")
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # created in the event loop that uses them
+        self._loop = None
+        self.async_client = None
+        self._semaphore = None
+        self._token_bucket = None
+
+    def _setup_async_client(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self.async_client is not None:
+            # its connections belong to the other loop and cannot be closed from this one
+            raise RuntimeError(
+                "AsyncAPIAgent is already used in another event loop, await its aclose() there first"
+            )
+        self._loop = loop
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=self.request_timeout,
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=http_client,
+            max_retries=0,  # retried below, with backoff shared by all requests
+            timeout=self.request_timeout,
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.requests_per_second:
+            # below one token a request could never be let through
+            self._token_bucket = _TokenBucket(
+                self.requests_per_second, max(1.0, self.burst or self.requests_per_second)
+            )
+        else:
+            self._token_bucket = None
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(self.backoff_max, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def agenerate(
+        self,
+        conversation: list[APIConversationMessage],
+    ) -> Tuple[str, str | None]:
+        if self.response_cache is None:
+            return await self._agenerate(conversation)
+        key = self._cache_key(conversation)
+        with trace_span("generate.cache_lookup") as span:
+            cached = await asyncio.to_thread(self.response_cache.get, key)
+            span.set(hit=cached is not None)
+        if cached is not None:
+            return cached
+        content, reasoning_content = await self._agenerate(conversation)
+        await asyncio.to_thread(self.response_cache.put, key, content, reasoning_content)
+        return content, reasoning_content
+
+    async def _agenerate(
+        self,
+        conversation: list[APIConversationMessage],
+    ) -> Tuple[str, str | None]:
+        self._setup_async_client()
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                if self._token_bucket is not None:
+                    await self._token_bucket.acquire()
+                try:
+                    with trace_span("generate", messages=len(conversation)) as span:
+                        response = await self.async_client.chat.completions.create(
+                            model=self.model,
+                            messages=[{"role": c["role"], "content": c["content"]} for c in conversation],
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature,
+                            top_p=self.top_p,
+                            timeout=self.request_timeout,
+                        )
+                        span.set(**_usage_args(response))
+                    message = response.choices[0].message
+                    return message.content, getattr(message, "reasoning_content", None)
+                except self._retryable_errors as e:
+                    if attempt == self.max_retries:
+                        raise
+                    error_name = type(e).__name__
+                    delay = self._backoff(attempt, e)
+            # back off without holding a concurrency slot
+            print(f"{error_name}: retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        if self.async_client is not None:
+            await self.async_client.close()
+        self._loop = None
+        self.async_client = None
+
+
 class Llama2Template(BaseChatTemplate):
     def tokenize_conversation_one(
         self,
@@ -244,11 +732,13 @@ class Llama2Template(BaseChatTemplate):
         You can provide your own _tokenize_conversation_one to adapt to your own task.
         """
         if message["from"] == "human":
-            text = f"<s>[INST] {message['value']} [/INST]"
-            input_ids = tokenizer.encode(text, add_special_tokens=False)
+            header, footer = "<s>[INST] ", " [/INST]"
+            text = f"{header}{message['value']}{footer}"
+            input_ids = self._encode_wrapped(tokenizer, header, message["value"], footer)
         else:
-            text = f"{message['value']}</s>"
-            input_ids = tokenizer.encode(text, add_special_tokens=False)
+            header, footer = "", "</s>"
+            text = f"{header}{message['value']}{footer}"
+            input_ids = self._encode_wrapped(tokenizer, header, message["value"], footer)
             text = f" {text}"
         if message["loss"]:
             action_mask = [1] * len(input_ids)
@@ -277,25 +767,26 @@ class ChatMLTemplate(BaseChatTemplate):
         You can provide your own _tokenize_conversation_one to adapt to your own task.
         """
         if idx == 0 and message["from"] != "system":
-            text = "<|im_start|>system\nYou are a helpful assistant<|im_end|>\n"
+            header = "<|im_start|>system\nYou are a helpful assistant<|im_end|>\n"
         else:
-            text = ""
+            header = ""
         if add_generation_prompt:
             if message["from"] == "human":
-                text += f"<|im_start|>user\n{message['value']}<|im_end|>\n<|im_start|>assistant\n"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
+                header += "<|im_start|>user\n"
+                footer = "<|im_end|>\n<|im_start|>assistant\n"
             else:
-                text += f"{message['value']}<|im_end|>"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
+                footer = "<|im_end|>"
                 # text = f" {text}"
         else:
             if message["from"] == "human":
-                text += f"<|im_start|>user\n{message['value']}<|im_end|>\n"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
+                header += "<|im_start|>user\n"
+                footer = "<|im_end|>\n"
             else:
-                text += f"<|im_start|>assistant\n{message['value']}<|im_end|>"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
+                header += "<|im_start|>assistant\n"
+                footer = "<|im_end|>"
                 # text = f" {text}"
+        text = f"{header}{message['value']}{footer}"
+        input_ids = self._encode_wrapped(tokenizer, header, message["value"], footer)
 
         if message["loss"]:
             action_mask = [1] * len(input_ids)
@@ -326,24 +817,30 @@ class Llama3Template(BaseChatTemplate):
         if add_generation_prompt:
             mfrom = message["from"]
             if idx == 0:
-                text = f"<|begin_of_text|>"
+                header = f"<|begin_of_text|>"
             else:
-                text = ""
+                header = ""
             if mfrom == "human":
-                text += f"<|start_header_id|>user<|end_header_id|>\n\n{val}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+                header += f"<|start_header_id|>user<|end_header_id|>\n\n"
+                footer = f"<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
             elif mfrom == "gpt":
-                text += f"{val}<|eot_id|>"
+                footer = f"<|eot_id|>"
+            else:
+                # other roles are not rendered in a generation prompt
+                val, footer = "", ""
         else:
             if mfrom == "human":
                 mfrom = "user"
             elif mfrom == "gpt":
                 mfrom = "assistant"
             if idx == 0:
-                text = f"<|begin_of_text|><|start_header_id|>{mfrom}<|end_header_id|>\n\n{val}<|eot_id|>"
+                header = f"<|begin_of_text|><|start_header_id|>{mfrom}<|end_header_id|>\n\n"
             else:
-                text = f"<|start_header_id|>{mfrom}<|end_header_id|>\n\n{val}<|eot_id|>"
+                header = f"<|start_header_id|>{mfrom}<|end_header_id|>\n\n"
+            footer = f"<|eot_id|>"
 
-        input_ids = tokenizer.encode(text, add_special_tokens=False)
+        text = f"{header}{val}{footer}"
+        input_ids = self._encode_wrapped(tokenizer, header, val, footer)
         if message["loss"]:
             action_mask = [1] * len(input_ids)
         else:
@@ -369,13 +866,15 @@ class ChatGLM4Template(BaseChatTemplate):
         if add_generation_prompt:
             mfrom = message["from"]
             if idx == 0:
-                text = "[gMASK]<sop>"
+                header = "[gMASK]<sop>"
             else:
-                text = ""
+                header = ""
             if mfrom == "human":
-                text += f"<|user|>\n{val}<|assistant|>"
+                header += "<|user|>\n"
+                footer = "<|assistant|>"
             else:
-                text += f"\n{val}"
+                header += "\n"
+                footer = ""
         else:
             mfrom = message["from"]
             if mfrom == "human":
@@ -383,10 +882,12 @@ class ChatGLM4Template(BaseChatTemplate):
             elif mfrom == "gpt":
                 mfrom = "assistant"
             if idx == 0:
-                text = f"[gMASK]<sop><|{mfrom}|>\n{val}"
+                header = f"[gMASK]<sop><|{mfrom}|>\n"
             else:
-                text = f"<|{mfrom}|>\n{val}"
-        input_ids = tokenizer.encode(text, add_special_tokens=False)
+                header = f"<|{mfrom}|>\n"
+            footer = ""
+        text = f"{header}{val}{footer}"
+        input_ids = self._encode_wrapped(tokenizer, header, val, footer)
         if message["loss"]:
             action_mask = [1] * len(input_ids)
         else:
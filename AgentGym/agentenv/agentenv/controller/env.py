@@ -1,13 +1,68 @@
 from abc import ABCMeta, abstractmethod
+from typing import Any, Callable, Sequence
 
+from .local import LocalEnvSession
+from .transport import (
+    EnvServerError,
+    EnvTransport,
+    WebSocketEnvSession,
+    get_env_transport,
+)
 from .types import ActionFormat, ConversationMessage, StepOutput
 
 
 class BaseEnvClient(metaclass=ABCMeta):
     _conversation_start: dict[ActionFormat, tuple[ConversationMessage]]
+    # Clients whose server has `/step_batch` and `/reset_batch` set this, together with the
+    # `_prepare_step`, `_apply_step`, `_reset_data` and `_apply_reset` hooks used by `step_many`.
+    batch_endpoints: bool = False
+    _id_key: str = "id"
+    # "module:attribute" of the env server's session ops, for clients that support backend="local"
+    local_ops: str | None = None
 
-    def __init__(self, action_format: ActionFormat = "react") -> None:
+    def __init__(
+        self,
+        action_format: ActionFormat = "react",
+        transport: str = "http",
+        backend: str = "server",
+        local_processes: int = 0,
+    ) -> None:
+        """
+        Args:
+            action_format (ActionFormat, optional): Format of the actions generated by the agent.
+            transport (str, optional): "http" for the REST endpoints of the env server, or "ws" for
+                one long-lived WebSocket per client to its `/ws` endpoint (see `WebSocketEnvSession`).
+            backend (str, optional): "server" for an env server, or "local" to run the env in this
+                process without HTTP, for clients with `local_ops` (see `LocalEnvSession`).
+                `env_server_base` is then unused, e.g. "local".
+            local_processes (int, optional): With backend="local", run the envs in this many worker
+                processes instead of this process.
+        """
         self.action_format = ActionFormat(action_format)
+        if transport not in ("http", "ws"):
+            raise ValueError(f"Unsupported env transport: {transport}")
+        if backend not in ("server", "local"):
+            raise ValueError(f"Unsupported env backend: {backend}")
+        self.transport_kind = transport
+        self.backend = backend
+        if backend == "local":
+            if self.local_ops is None:
+                raise ValueError(f'{type(self).__name__} does not support backend="local"')
+            self._session = LocalEnvSession(self.local_ops, processes=local_processes)
+        elif transport == "ws":
+            self._session = WebSocketEnvSession()
+        else:
+            self._session = None
+
+    @property
+    def transport(self) -> EnvTransport | WebSocketEnvSession | LocalEnvSession:
+        """
+        The client's own session with `transport="ws"` or `backend="local"`, otherwise the pooled
+        keep-alive HTTP transport shared by the env clients of this process.
+        """
+        if self._session is not None:
+            return self._session
+        return get_env_transport()
 
     @abstractmethod
     def __len__(self) -> int:
@@ -32,3 +87,155 @@ class BaseEnvClient(metaclass=ABCMeta):
         """
         Reset the environment.
         """
+
+    @property
+    def uses_batch_endpoints(self) -> bool:
+        """Whether `step_many` batches this client, which it only does over the shared HTTP transport."""
+        return self.batch_endpoints and self._session is None
+
+    def _prepare_step(self, action: str) -> str | StepOutput:
+        """
+        Action sent to the server, or the StepOutput when the client answers without the server.
+        """
+        raise NotImplementedError
+
+    def _apply_step(self, response: Any) -> StepOutput:
+        """
+        Update the client from a `/step` response.
+        """
+        raise NotImplementedError
+
+    def _reset_data(self, idx: int) -> dict[str, Any]:
+        """
+        Body of a `/reset` request, without the env id.
+        """
+        raise NotImplementedError
+
+    def _apply_reset(self, response: Any) -> Any:
+        """
+        Update the client from a `/reset` response.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def step_many(
+        cls,
+        clients: Sequence["BaseEnvClient"],
+        actions: Sequence[str],
+        return_exceptions: bool = False,
+    ) -> list[StepOutput | Exception]:
+        """
+        Step each client with its action, in one `/step_batch` request per server for clients with
+        `batch_endpoints` and one `step` call per client otherwise. Results are in the order of `clients`.
+        A failed item gives its exception with `return_exceptions`, otherwise the first failure is raised
+        once every item has been applied.
+        """
+        results = [None] * len(clients)
+        batches = {}
+        for position, (client, action) in enumerate(zip(clients, actions)):
+            try:
+                if not client.uses_batch_endpoints:
+                    results[position] = client.step(action)
+                    continue
+                prepared = client._prepare_step(action)
+            except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                results[position] = e
+                continue
+            if isinstance(prepared, StepOutput):
+                results[position] = prepared
+            else:
+                batches.setdefault(client.env_server_base, []).append(
+                    (position, client, {"action": prepared})
+                )
+        for items in batches.values():
+            _call_batch("step", items, lambda client, r: client._apply_step(r), results)
+        return _raise_or_return(results, return_exceptions)
+
+    @classmethod
+    def reset_many(
+        cls,
+        clients: Sequence["BaseEnvClient"],
+        idxs: Sequence[int],
+        return_exceptions: bool = False,
+    ) -> list[Any]:
+        """
+        Reset each client to its index, batched like `step_many`.
+        """
+        results = [None] * len(clients)
+        batches = {}
+        for position, (client, idx) in enumerate(zip(clients, idxs)):
+            try:
+                if not client.uses_batch_endpoints:
+                    results[position] = client.reset(idx)
+                    continue
+                data = client._reset_data(idx)
+            except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                results[position] = e
+                continue
+            batches.setdefault(client.env_server_base, []).append(
+                (position, client, data)
+            )
+        for items in batches.values():
+            _call_batch("reset", items, lambda client, r: client._apply_reset(r), results)
+        return _raise_or_return(results, return_exceptions)
+
+
+# servers answering 404 to the batch endpoints, which predate them
+_unbatched_urls: set[str] = set()
+
+
+def _call_batch(
+    path: str,
+    items: list[tuple[int, BaseEnvClient, dict[str, Any]]],
+    apply: Callable[[BaseEnvClient, Any], Any],
+    results: list,
+) -> None:
+    """
+    Send the items of one server as a single `/{path}_batch` request and apply each response
+    to its client, storing results (or per-item exceptions) at the items' positions.
+    """
+    client = items[0][1]
+    url = f"{client.env_server_base}/{path}_batch"
+    responses = None
+    if url not in _unbatched_urls:
+        try:
+            responses = client.transport.post(
+                url,
+                json={
+                    "items": [
+                        {**data, item_client._id_key: item_client.env_id}
+                        for _, item_client, data in items
+                    ]
+                },
+                timeout=max(getattr(c, "timeout", 300) for _, c, _ in items),
+            )
+        except EnvServerError as e:
+            if e.status_code != 404:
+                for position, _, _ in items:
+                    results[position] = e
+                return
+            _unbatched_urls.add(url)
+    for i, (position, item_client, data) in enumerate(items):
+        try:
+            if responses is None:
+                response = item_client._post(path, dict(data))
+            else:
+                response = responses[i]
+            if isinstance(response, dict) and "error" in response:
+                raise EnvServerError(
+                    f"{path} of env {item_client.env_id} failed: {response['error']}",
+                    method="POST",
+                    url=url,
+                    detail=str(response["error"]),
+                )
+            results[position] = apply(item_client, response)
+        except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+            results[position] = e
+
+
+def _raise_or_return(results: list, return_exceptions: bool) -> list:
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    return results
@@ -0,0 +1,109 @@
+import functools
+import importlib
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from .transport import EnvServerError
+
+
+@functools.lru_cache(maxsize=None)
+def _load_ops(ops_path: str) -> dict:
+    module_name, _, attribute = ops_path.partition(":")
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        raise ImportError(
+            f'backend="local" runs the env server in this process and requires its package: {e}'
+        ) from e
+    return getattr(module, attribute)
+
+
+def _dispatch(ops_path: str, op: str, body: dict) -> tuple[int, Any]:
+    """
+    Run one op and return `(status, body_or_detail)` like the server's `/ws` endpoint.
+    Top-level so that it also runs in the worker processes of `LocalEnvSession`.
+    """
+    ops = _load_ops(ops_path)
+    if op not in ops:
+        return 404, f"Unknown op: {op}"
+    try:
+        return 200, ops[op](body)
+    except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+        return 500, str(e)
+
+
+class LocalEnvSession:
+    """
+    Transport of an env client with `backend="local"`. Requests keep the REST paths and bodies, like
+    `WebSocketEnvSession`, and are dispatched to the `session_ops` of the env server module in this
+    process, so the client sees the observations, rewards and done flags of the server without HTTP.
+
+    With `processes > 0`, ops run in one of `processes` single-worker processes shared by the clients
+    of the same env, to sidestep the GIL. A client is pinned to one worker, since its env lives there.
+    Workers are spawned, so they import the env server package afresh.
+    """
+
+    _executors: dict[tuple, list[ProcessPoolExecutor]] = {}
+    _executors_lock = threading.Lock()
+    _next_worker = itertools.count()
+
+    def __init__(self, ops_path: str, processes: int = 0) -> None:
+        self.ops_path = ops_path
+        if processes > 0:
+            self.executor = self._worker(ops_path, processes)
+        else:
+            self.executor = None
+            _load_ops(ops_path)  # fail early when the env package is missing
+
+    @classmethod
+    def _worker(cls, ops_path: str, processes: int) -> ProcessPoolExecutor:
+        key = (ops_path, processes, os.getpid())
+        with cls._executors_lock:
+            if key not in cls._executors:
+                context = multiprocessing.get_context("spawn")
+                cls._executors[key] = [
+                    ProcessPoolExecutor(max_workers=1, mp_context=context)
+                    for _ in range(processes)
+                ]
+            workers = cls._executors[key]
+            return workers[next(cls._next_worker) % len(workers)]
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        json: Any = None,
+        params: Any = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        parts = urlsplit(url)
+        op = parts.path.rpartition("/")[2]
+        body = dict(parse_qsl(parts.query))
+        body.update(params or {})
+        body.update(json or {})
+        if self.executor is None:
+            status, result = _dispatch(self.ops_path, op, body)
+        else:
+            future = self.executor.submit(_dispatch, self.ops_path, op, body)
+            try:
+                status, result = future.result(timeout)
+            except (FutureTimeoutError, BrokenProcessPool) as e:
+                raise EnvServerError(
+                    f"{method} {url} failed: {e!r}", method=method, url=url
+                ) from e
+        if status != 200:
+            raise EnvServerError.from_status(method, url, status, result)
+        return result
+
+    def post(self, url: str, json: Any = None, **kwargs) -> Any:
+        return self.request("POST", url, json=json, **kwargs)
+
+    def get(self, url: str, params: Any = None, **kwargs) -> Any:
+        return self.request("GET", url, params=params, **kwargs)
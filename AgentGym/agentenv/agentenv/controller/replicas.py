@@ -0,0 +1,170 @@
+import bisect
+import contextlib
+import hashlib
+import threading
+import time
+import weakref
+from typing import Any, Callable, Iterator, Mapping, Optional, Sequence
+
+import requests
+
+from .transport import EnvServerError
+
+
+class EnvServerPool:
+    """
+    Spreads env clients over several replicas of the same env server.
+
+    A client is placed when it is created: "least_loaded" picks the healthy replica with the fewest
+    placed envs (then requests in flight), "consistent_hash" maps the client's key to a replica on a
+    hash ring, so a key keeps its replica while the set of healthy replicas is unchanged.
+    Replicas are health-checked against `/` at most every `health_check_interval` seconds, lazily on
+    placement so that the pool also works in forked worker processes. A replica that cannot be
+    reached, times out or answers 503 on a create is marked down and the create fails over to the
+    next one; other errors are raised as they are. A placed client is released when it is garbage
+    collected, or with `release`.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        policy: str = "least_loaded",
+        health_check_interval: float = 30,
+        health_check_timeout: float = 5,
+        virtual_nodes: int = 64,
+    ) -> None:
+        if not urls:
+            raise ValueError("EnvServerPool needs at least one server url")
+        if policy not in ("least_loaded", "consistent_hash"):
+            raise ValueError(f"Unsupported placement policy: {policy}")
+        self.urls = [url.rstrip("/") for url in urls]
+        self.policy = policy
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.healthy = {url: True for url in self.urls}
+        self.placed = {url: 0 for url in self.urls}
+        self.in_flight = {url: 0 for url in self.urls}
+        self._last_health_check = float("-inf")
+        self._lock = threading.Lock()
+        self._health_lock = threading.Lock()
+        self._placements = weakref.WeakKeyDictionary()  # client -> finalizer that unplaces it
+        self._ring = sorted(
+            (self._hash(f"{url}#{i}"), url)
+            for url in self.urls
+            for i in range(virtual_nodes)
+        )
+        self._ring_keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def check_health(self) -> dict[str, bool]:
+        for url in self.urls:
+            try:
+                ok = requests.get(f"{url}/", timeout=self.health_check_timeout).status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok != self.healthy[url]:
+                print(f"[EnvServerPool] {url} is {'up' if ok else 'down'}")
+            self.healthy[url] = ok
+        self._last_health_check = time.monotonic()
+        return dict(self.healthy)
+
+    def _maybe_check_health(self) -> None:
+        if time.monotonic() - self._last_health_check < self.health_check_interval:
+            return
+        # a single thread checks, the others wait for it and use its result
+        with self._health_lock:
+            if time.monotonic() - self._last_health_check >= self.health_check_interval:
+                self.check_health()
+
+    @staticmethod
+    def _is_unavailable(error: Exception) -> bool:
+        """Whether `error` means the replica is unreachable or overloaded, rather than the request being bad."""
+        if isinstance(error, EnvServerError):
+            # no status: the transport could not reach the server or timed out
+            return error.status_code in (None, 503)
+        if isinstance(error, requests.RequestException):
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    def mark_down(self, url: str) -> None:
+        print(f"[EnvServerPool] {url} is down")
+        self.healthy[url] = False
+
+    def candidates(self, key: Optional[str] = None) -> list[str]:
+        """Healthy replicas in the order they should be tried."""
+        self._maybe_check_health()
+        alive = [url for url in self.urls if self.healthy[url]]
+        if self.policy == "least_loaded":
+            with self._lock:
+                return sorted(alive, key=lambda url: (self.placed[url], self.in_flight[url]))
+        # walk the ring clockwise from the key's position
+        start = bisect.bisect(self._ring_keys, self._hash(key or ""))
+        ordered = []
+        for i in range(len(self._ring)):
+            url = self._ring[(start + i) % len(self._ring)][1]
+            if url not in ordered and self.healthy[url]:
+                ordered.append(url)
+        return ordered
+
+    def create_client(
+        self,
+        client_cls: Callable,
+        client_args: Mapping[str, Any],
+        key: Optional[str] = None,
+    ) -> Any:
+        """
+        Construct `client_cls(**client_args)` with `env_server_base` set to a replica chosen by the policy,
+        failing over to the next candidate when the replica is unreachable, times out or answers 503.
+        """
+        errors = []
+        for url in self.candidates(key):
+            try:
+                client = client_cls(**{**client_args, "env_server_base": url})
+            except (requests.RequestException, OSError) as e:
+                if not self._is_unavailable(e):
+                    raise
+                errors.append(f"{url}: {e}")
+                self.mark_down(url)
+                continue
+            with self._lock:
+                self.placed[url] += 1
+            self._placements[client] = weakref.finalize(client, self._unplace, url)
+            return client
+        raise RuntimeError(
+            "No env server replica could create an environment. " + "; ".join(errors)
+        )
+
+    def _unplace(self, url: str) -> None:
+        with self._lock:
+            self.placed[url] -= 1
+
+    def release(self, client: Any) -> None:
+        """Stop counting `client` on its replica, e.g. once it is closed. Done on garbage collection otherwise."""
+        finalizer = self._placements.pop(client, None)
+        if finalizer is not None:
+            finalizer()
+
+    @contextlib.contextmanager
+    def track(self, url: str) -> Iterator[None]:
+        """Count a request to `url` as in flight while the block runs."""
+        with self._lock:
+            self.in_flight[url] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight[url] -= 1
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                url: {
+                    "healthy": self.healthy[url],
+                    "placed": self.placed[url],
+                    "in_flight": self.in_flight[url],
+                }
+                for url in self.urls
+            }
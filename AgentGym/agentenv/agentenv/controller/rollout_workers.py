@@ -0,0 +1,229 @@
+import gc
+import multiprocessing
+import os
+import queue
+import random
+import time
+import traceback
+from typing import Any, Iterator, Optional, Sequence
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, GenerationConfig
+
+from .agent import Agent
+from .task import BaseTask
+
+
+def _rollout_worker(
+    worker_id: int,
+    device: str,
+    num_threads: int,
+    seed: int,
+    task_specs: list[tuple],
+    agent_spec: tuple,
+    generation_config: GenerationConfig,
+    max_rounds: Optional[int],
+    task_queue,
+    result_queue,
+) -> None:
+    """
+    Main loop of a rollout worker: take `(weights_path, task_index, idxs)` items from `task_queue`,
+    roll the episodes out with the model at `weights_path` (loaded when it changes), and put one
+    record per episode on `result_queue`, until a None item.
+    """
+    if device == "cpu":
+        torch.set_num_threads(num_threads)
+    random.seed(seed + worker_id)
+    np.random.seed(seed + worker_id)
+    torch.manual_seed(seed + worker_id)
+    try:
+        tasks = [
+            task_cls(
+                client_args=client_args,
+                n_clients=n_clients,
+                rollout_mode=rollout_mode,
+                env_server_policy=env_server_policy,
+            )
+            for task_cls, client_args, n_clients, rollout_mode, env_server_policy in task_specs
+        ]
+    except Exception:  # pylint: disable=W0718:broad-exception-caught
+        result_queue.put({"error": traceback.format_exc(), "worker": worker_id})
+        return
+    tokenizer, chat_template_cls, inference_engine, reuse_kv_cache = agent_spec
+
+    agent, loaded_weights = None, None
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        weights_path, task_index, idxs = item
+        start = time.perf_counter()
+        try:
+            if weights_path != loaded_weights:
+                agent = None
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                model = AutoModelForCausalLM.from_pretrained(weights_path, torch_dtype="auto")
+                agent = Agent(
+                    model.to(device).eval(),
+                    tokenizer,
+                    chat_template=chat_template_cls(),
+                    inference_engine=inference_engine,
+                    reuse_kv_cache=reuse_kv_cache,
+                )
+                loaded_weights = weights_path
+            with torch.no_grad():
+                exps = tasks[task_index].generate_experience(
+                    agent, idxs, generation_config, max_rounds
+                )
+        except Exception:  # pylint: disable=W0718:broad-exception-caught
+            result_queue.put({"error": traceback.format_exc(), "worker": worker_id})
+            continue
+        seconds = (time.perf_counter() - start) / len(idxs)
+        for idx, exp in zip(idxs, exps):
+            result_queue.put(
+                {
+                    "task_index": task_index,
+                    "data_idx": idx,
+                    "conversation": exp.conversation,
+                    "reward": exp.reward,
+                    "failed": exp.failed,
+                    "worker": worker_id,
+                    "weights_path": weights_path,
+                    "seconds": seconds,
+                }
+            )
+
+
+class RolloutWorkerPool:
+    """
+    Rollout worker processes, separate from the trainer ranks, that pull task indices from a shared
+    queue and stream back one record per episode, so that exploration neither runs on the training
+    ranks nor is limited to their dataloader shards.
+
+    Workers recreate `tasks` (with their own env clients) and the agent's tokenizer and chat template
+    in their own process. The model is loaded from the weights directory given with each `submit`,
+    e.g. the one `save_pretrained` wrote at an iteration boundary, so publishing new weights is
+    saving them and submitting with their path. Workers are spawned on `devices` round-robin
+    ("cpu", or e.g. "cuda:6,cuda:7"), and are daemonic, so they cannot start processes of their own.
+
+        pool = RolloutWorkerPool(agent, tasks, generation_config, max_rounds=10, n_workers=4)
+        pool.submit(range(200), weights_path="outputs/iter_0/model")
+        for record in pool.results():
+            ...  # {"task_index", "data_idx", "conversation", "reward", "worker", ...}
+        pool.close()
+    """
+
+    def __init__(
+        self,
+        agent: Agent,
+        tasks: Sequence[BaseTask],
+        generation_config: GenerationConfig,
+        max_rounds: Optional[int] = None,
+        n_workers: int = 1,
+        devices: str | Sequence[str] = "cpu",
+        seed: int = 0,
+    ) -> None:
+        if isinstance(devices, str):
+            devices = devices.split(",")
+        context = multiprocessing.get_context("spawn")
+        self.task_queue = context.Queue()
+        self.result_queue = context.Queue()
+        # a chunk fills the clients of a task, so that its episodes are batched
+        self.chunk_sizes = [len(task.clients) for task in tasks]
+        task_specs = [
+            (
+                type(task),
+                task.client_args,
+                len(task.clients),
+                task.rollout_mode,
+                task.env_server_policy,
+            )
+            for task in tasks
+        ]
+        agent_spec = (
+            agent.tokenizer,
+            type(agent.chat_template),
+            agent.inference_engine.value,
+            agent.reuse_kv_cache,
+        )
+        num_threads = max(1, (os.cpu_count() or 1) // n_workers)
+        self.workers = [
+            context.Process(
+                target=_rollout_worker,
+                args=(
+                    i,
+                    devices[i % len(devices)],
+                    num_threads,
+                    seed,
+                    task_specs,
+                    agent_spec,
+                    generation_config,
+                    max_rounds,
+                    self.task_queue,
+                    self.result_queue,
+                ),
+                daemon=True,
+            )
+            for i in range(n_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.pending = 0
+        # per worker: episodes rolled out and seconds spent on them
+        self.worker_episodes = [0] * n_workers
+        self.worker_busy_time = [0.0] * n_workers
+
+    def submit(self, idxs: Sequence[int], weights_path: str, task_index: int = 0) -> None:
+        """Queue the episodes `idxs` of `tasks[task_index]`, to be rolled out with the weights at `weights_path`."""
+        idxs = list(idxs)
+        chunk_size = self.chunk_sizes[task_index]
+        for start in range(0, len(idxs), chunk_size):
+            self.task_queue.put((weights_path, task_index, idxs[start : start + chunk_size]))
+        self.pending += len(idxs)
+
+    def results(self) -> Iterator[dict[str, Any]]:
+        """
+        Yield the records of the submitted episodes as workers finish them, until none is pending.
+        Raises RuntimeError when a worker fails or dies.
+        """
+        while self.pending > 0:
+            try:
+                record = self.result_queue.get(timeout=1.0)
+            except queue.Empty:
+                dead = [i for i, worker in enumerate(self.workers) if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Rollout workers {dead} exited")
+                continue
+            if "error" in record:
+                raise RuntimeError(
+                    f"Rollout worker {record['worker']} failed:\n{record['error']}"
+                )
+            self.pending -= 1
+            self.worker_episodes[record["worker"]] += 1
+            self.worker_busy_time[record["worker"]] += record["seconds"]
+            yield record
+
+    def close(self) -> None:
+        # drop the episodes no worker started yet
+        try:
+            while True:
+                self.task_queue.get_nowait()
+        except queue.Empty:
+            pass
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+        self.task_queue.close()
+        self.result_queue.close()
+
+    def __enter__(self) -> "RolloutWorkerPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
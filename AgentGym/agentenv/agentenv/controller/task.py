@@ -1,9 +1,47 @@
+import asyncio
+import collections
+import contextlib
+import queue
+import time
+import traceback
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Any, Callable, Mapping, Optional, Sequence
 
 from transformers import GenerationConfig
 
-from . import Agent, APIAgent, BaseEnvClient
-from .types import ConversationMessage, APIConversationMessage, ExperienceOutput, APIExperienceOutput
+from . import Agent, APIAgent, AsyncAPIAgent, BaseEnvClient
+from .agent import KVCache
+from .replicas import EnvServerPool
+from .tracing import trace_span
+from .types import (
+    ConversationMessage,
+    APIConversationMessage,
+    ExperienceOutput,
+    APIExperienceOutput,
+    RolloutMode,
+    RolloutStats,
+    StepOutput,
+    TokenizedConversationOutput,
+)
+
+
+@dataclass
+class RolloutEpisode:
+    """
+    State of one episode in progress, shared by the sequential and batched rollout loops.
+    """
+
+    client: BaseEnvClient
+    idx: int
+    conversation: list[ConversationMessage] | list[APIConversationMessage]
+    conversation_tokenized: TokenizedConversationOutput | None = None
+    reward: float = 0.0
+    done: bool = False
+    stopped: bool = False
+    rounds: int = 0
+    kv_cache: KVCache | None = None
 
 
 class BaseTask:
@@ -14,126 +52,272 @@ class BaseTask:
         self,
         client_args: Mapping[str, Any],
         n_clients: int = 1,
+        rollout_mode: RolloutMode | str | None = None,
+        env_server_policy: str = "least_loaded",
     ) -> None:
         """
         Initializes the Task object.
 
         Args:
             client_args (Mapping[str, Any]): A mapping of client arguments.
-            n_clients (int, optional): The number of clients. Defaults to 1. Larger than 1 for batch generation. Batch generation is not implemented yet.
+            n_clients (int, optional): The number of clients. Defaults to 1. Larger than 1 for batch generation.
+            rollout_mode (RolloutMode | str, optional): How episodes are spread over the clients.
+                By default, "lockstep" for `Agent` and "concurrent" for `APIAgent` when n_clients > 1.
+                "pipelined" overlaps env steps with generation for envs whose steps are slow.
+            env_server_policy (str, optional): How clients are placed when `client_args["env_server_base"]`
+                lists several server replicas (a list, or urls separated by commas): "least_loaded" or
+                "consistent_hash". See `EnvServerPool`.
         """
         if self.env_client_cls is None or self.env_name is None:
             raise NotImplementedError
-        self.clients = [self.env_client_cls(**client_args) for _ in range(n_clients)]
+        # kept so that rollout workers can create the same task in their own process
+        self.client_args = client_args
+        self.env_server_policy = env_server_policy
+        env_server_base = client_args.get("env_server_base")
+        if isinstance(env_server_base, str) and "," in env_server_base:
+            env_server_base = env_server_base.split(",")
+        if isinstance(env_server_base, (list, tuple)):
+            self.env_server_pool = EnvServerPool(env_server_base, policy=env_server_policy)
+            self.clients = [
+                self.env_server_pool.create_client(
+                    self.env_client_cls, client_args, key=f"{self.env_name}-{i}"
+                )
+                for i in range(n_clients)
+            ]
+        else:
+            self.env_server_pool = None
+            self.clients = [self.env_client_cls(**client_args) for _ in range(n_clients)]
         self.len = len(self.clients[0])
+        self.rollout_mode = (
+            RolloutMode(rollout_mode) if rollout_mode is not None else None
+        )
+        self.last_rollout_stats: RolloutStats | None = None
 
-    def _generate_experience_one(
+    def _resolve_rollout_mode(self, agent: Agent | APIAgent) -> RolloutMode:
+        if len(self.clients) == 1:
+            return RolloutMode.SEQUENTIAL
+        if self.rollout_mode is None:
+            # a local model benefits from batching, API calls from plain concurrency
+            if isinstance(agent, Agent):
+                return RolloutMode.LOCKSTEP
+            return RolloutMode.CONCURRENT
+        if self.rollout_mode in (
+            RolloutMode.LOCKSTEP,
+            RolloutMode.PIPELINED,
+        ) and not isinstance(agent, Agent):
+            return RolloutMode.CONCURRENT
+        return self.rollout_mode
+
+    def _env_call(self, client: BaseEnvClient):
+        """Counts the call as in flight on the client's replica, when clients are spread over several."""
+        if self.env_server_pool is None:
+            return contextlib.nullcontext()
+        return self.env_server_pool.track(client.env_server_base)
+
+    def _start_episode(
         self,
         agent: Agent | APIAgent,
         client: BaseEnvClient,
         idx: int,
-        generation_config: Optional[GenerationConfig] = None,
-        max_rounds: Optional[int] = None,
-    ) -> ExperienceOutput:
-        client.reset(idx)
-        reward = 0.0
-        done = False
-        state = client.observe()
+    ) -> RolloutEpisode:
+        with self._env_call(client):
+            with trace_span("env.reset", episode=idx, round=0):
+                client.reset(idx)
+            with trace_span("env.observe", episode=idx, round=0):
+                state = client.observe()
+        conversation_tokenized = None
+        kv_cache = None
         if isinstance(agent, Agent):
-            tokenizer = agent.tokenizer
             conversation = list(client.conversation_start)
-            conversation.append(
-                ConversationMessage({"from": "human", "loss": None, "value": state})
-            )
-            conversation_tokenized = agent.chat_template.tokenize_conversation(
-                conversation, tokenizer, add_generation_prompt=True
+            state_message = ConversationMessage(
+                {"from": "human", "loss": None, "value": state}
             )
+            conversation.append(state_message)
+            with trace_span("tokenize.encode", episode=idx, round=0):
+                conversation_tokenized = agent.chat_template.tokenize_conversation_start(
+                    client.conversation_start, agent.tokenizer
+                )
+                state_tokenized = agent.chat_template.tokenize_conversation_one(
+                    state_message,
+                    agent.tokenizer,
+                    len(client.conversation_start),
+                    add_generation_prompt=True,
+                )
+            conversation_tokenized["text"] += state_tokenized["text"]
+            conversation_tokenized["input_ids"] += state_tokenized["input_ids"]
+            conversation_tokenized["action_mask"] += state_tokenized["action_mask"]
+            kv_cache = agent.new_kv_cache()
         elif isinstance(agent, APIAgent):
             conversation = [APIConversationMessage({"role": "user", "content": client.conversation_start[0]["value"], "reasoning_content": None}),
                             APIConversationMessage({"role": "assistant", "content": client.conversation_start[1]["value"], "reasoning_content": None}),
                             APIConversationMessage({"role": "user", "content": state, "reasoning_content": None})]
         else:
             raise NotImplementedError
-        rounds = 0
+        return RolloutEpisode(
+            client=client,
+            idx=idx,
+            conversation=conversation,
+            conversation_tokenized=conversation_tokenized,
+            kv_cache=kv_cache,
+        )
 
-        while not done:
-            if isinstance(agent, Agent):
-                input_length = len(conversation_tokenized["input_ids"])
-                # if input_length exceeds max_length, break
-                if input_length >= (generation_config.max_length or 4096):
-                    break
-                try:
-                    generated_tokens = agent.generate(
-                        [conversation_tokenized["input_ids"]], generation_config
-                    )[0]
-                except Exception as e:  # pylint: disable=W0718:broad-exception-caught
-                    print(e)
-                    break  # break if generate method raises exceptions
+    @staticmethod
+    def _needs_generation(
+        agent: Agent | APIAgent,
+        episode: RolloutEpisode,
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> bool:
+        if episode.done or episode.stopped:
+            return False
+        if max_rounds is not None and episode.rounds >= max_rounds:
+            return False
+        if isinstance(agent, Agent):
+            input_length = len(episode.conversation_tokenized["input_ids"])
+            # if input_length exceeds max_length, stop
+            if input_length >= (generation_config.max_length or 4096):
+                return False
+        return True
 
-                if generated_tokens[-1] != tokenizer.eos_token_id:
-                    generated_tokens += [tokenizer.eos_token_id]
+    @staticmethod
+    def _add_generation(
+        agent: Agent | APIAgent,
+        episode: RolloutEpisode,
+        generated: list[int] | tuple[str, str | None],
+    ) -> str:
+        """
+        Append the model output to the episode and return the text to send to the env.
+        `generated` is a list of token ids for `Agent` and a (content, reasoning_content) pair for `APIAgent`.
+        """
+        if isinstance(agent, Agent):
+            tokenizer = agent.tokenizer
+            generated_tokens = generated
+            if generated_tokens[-1] != tokenizer.eos_token_id:
+                generated_tokens += [tokenizer.eos_token_id]
 
+            with trace_span("tokenize.decode", episode=episode.idx, round=episode.rounds):
                 generated_text = tokenizer.decode(generated_tokens)
-                conversation_tokenized["text"] += f" {generated_text}"
-                conversation_tokenized["input_ids"] += generated_tokens
-                conversation_tokenized["action_mask"] += [1] * len(generated_tokens)
-
-                generated_text = generated_text[
-                    : -len(tokenizer.eos_token)
-                ]  # not endswith eos_token
-                conversation.append(
-                    ConversationMessage(
-                        {"from": "gpt", "loss": True, "value": generated_text}
-                    )
+            conversation_tokenized = episode.conversation_tokenized
+            conversation_tokenized["text"] += f" {generated_text}"
+            conversation_tokenized["input_ids"] += generated_tokens
+            conversation_tokenized["action_mask"] += [1] * len(generated_tokens)
+
+            generated_text = generated_text[
+                : -len(tokenizer.eos_token)
+            ]  # not endswith eos_token
+            episode.conversation.append(
+                ConversationMessage(
+                    {"from": "gpt", "loss": True, "value": generated_text}
                 )
-            elif isinstance(agent, APIAgent):
-                generated_text, generated_reasoning_text = agent.generate(conversation)
-                conversation.append(
-                    APIConversationMessage(
-                        {"role": "assistant", "content": generated_text, "reasoning_content": generated_reasoning_text}
-                    )
+            )
+        elif isinstance(agent, APIAgent):
+            generated_text, generated_reasoning_text = generated
+            episode.conversation.append(
+                APIConversationMessage(
+                    {"role": "assistant", "content": generated_text, "reasoning_content": generated_reasoning_text}
                 )
-            else:
-                raise NotImplementedError
-
-            step_output = client.step(generated_text)
-            state, reward, done = (
-                step_output.state,
-                step_output.reward,
-                step_output.done,
             )
+        else:
+            raise NotImplementedError
+        return generated_text
 
-            if isinstance(agent, Agent):
-                env_message = ConversationMessage(
-                    {"from": "human", "loss": None, "value": state}
-                )
+    @staticmethod
+    def _add_step_output(
+        agent: Agent | APIAgent,
+        episode: RolloutEpisode,
+        step_output: StepOutput,
+    ) -> None:
+        state = step_output.state
+        episode.reward = step_output.reward
+        episode.done = step_output.done
+
+        if isinstance(agent, Agent):
+            env_message = ConversationMessage(
+                {"from": "human", "loss": None, "value": state}
+            )
+            with trace_span("tokenize.encode", episode=episode.idx, round=episode.rounds):
                 env_message_tokenized = agent.chat_template.tokenize_conversation_one(
-                    env_message, tokenizer, add_generation_prompt=True
+                    env_message, agent.tokenizer, add_generation_prompt=True
                 )
 
-                conversation.append(env_message)
-                conversation_tokenized["text"] += env_message_tokenized["text"]
-                conversation_tokenized["input_ids"] += env_message_tokenized["input_ids"]
-                conversation_tokenized["action_mask"] += env_message_tokenized[
-                    "action_mask"
-                ]
-            elif isinstance(agent, APIAgent):
-                conversation.append(
-                    APIConversationMessage(
-                        {"role": "user", "content": state, "reasoning_content": None}
-                    )
+            episode.conversation.append(env_message)
+            conversation_tokenized = episode.conversation_tokenized
+            conversation_tokenized["text"] += env_message_tokenized["text"]
+            conversation_tokenized["input_ids"] += env_message_tokenized["input_ids"]
+            conversation_tokenized["action_mask"] += env_message_tokenized[
+                "action_mask"
+            ]
+        elif isinstance(agent, APIAgent):
+            episode.conversation.append(
+                APIConversationMessage(
+                    {"role": "user", "content": state, "reasoning_content": None}
                 )
-            else:
-                raise NotImplementedError
+            )
+        else:
+            raise NotImplementedError
+
+        episode.rounds += 1
 
-            rounds += 1
-            if max_rounds is not None and rounds >= max_rounds:
-                break
+    def _step_env(self, episode: RolloutEpisode, generated_text: str) -> StepOutput:
+        with self._env_call(episode.client), trace_span(
+            "env.step", episode=episode.idx, round=episode.rounds
+        ):
+            return episode.client.step(generated_text)
 
+    def _step_envs_batched(
+        self,
+        agent: Agent,
+        episodes: Sequence[RolloutEpisode],
+        generated: Sequence[list[int]],
+    ) -> list[bool]:
+        """
+        Step the episodes of one lockstep round with `step_many`, i.e. one `/step_batch` request per
+        server instead of one `/step` per episode. Returns whether each episode is still healthy.
+        """
+        ok = [True] * len(episodes)
+        texts = []
+        for i, (episode, output) in enumerate(zip(episodes, generated)):
+            try:
+                texts.append(self._add_generation(agent, episode, output))
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {episode.idx} failed:")
+                traceback.print_exc()
+                ok[i] = False
+        stepping = [episode for episode, good in zip(episodes, ok) if good]
+        with contextlib.ExitStack() as stack, trace_span(
+            "env.step_batch", batch_size=len(stepping)
+        ):
+            for episode in stepping:
+                stack.enter_context(self._env_call(episode.client))
+            step_outputs = self.env_client_cls.step_many(
+                [episode.client for episode in stepping], texts, return_exceptions=True
+            )
+        step_outputs = iter(step_outputs)
+        for i, episode in enumerate(episodes):
+            if not ok[i]:
+                continue
+            step_output = next(step_outputs)
+            try:
+                if isinstance(step_output, Exception):
+                    raise step_output
+                self._add_step_output(agent, episode, step_output)
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {episode.idx} failed:")
+                traceback.print_exc()
+                ok[i] = False
+        return ok
+
+    @staticmethod
+    def _finish_episode(
+        agent: Agent | APIAgent,
+        episode: RolloutEpisode,
+    ) -> ExperienceOutput | APIExperienceOutput:
+        episode.kv_cache = None  # release the cached keys and values
         if isinstance(agent, Agent):
+            conversation_tokenized = episode.conversation_tokenized
             return ExperienceOutput(
-                conversation=conversation,
-                reward=reward,
+                conversation=episode.conversation,
+                reward=episode.reward,
                 text=conversation_tokenized["text"],
                 seq_ids=conversation_tokenized["input_ids"],
                 attention_mask=[1] * len(conversation_tokenized["input_ids"]),
@@ -141,12 +325,325 @@ class BaseTask:
             )
         elif isinstance(agent, APIAgent):
             return APIExperienceOutput(
-                conversation=conversation,
-                reward=reward,
+                conversation=episode.conversation,
+                reward=episode.reward,
+            )
+        else:
+            raise NotImplementedError
+
+    def _generate_experience_one(
+        self,
+        agent: Agent | APIAgent,
+        client: BaseEnvClient,
+        idx: int,
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> ExperienceOutput:
+        episode = self._start_episode(agent, client, idx)
+
+        while self._needs_generation(agent, episode, generation_config, max_rounds):
+            with trace_span("round", episode=idx, round=episode.rounds):
+                if isinstance(agent, Agent):
+                    try:
+                        generated = agent.generate(
+                            [episode.conversation_tokenized["input_ids"]],
+                            generation_config,
+                            kv_caches=[episode.kv_cache],
+                        )[0]
+                    except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                        print(e)
+                        break  # break if generate method raises exceptions
+                elif isinstance(agent, APIAgent):
+                    generated = agent.generate(episode.conversation)
+                else:
+                    raise NotImplementedError
+
+                generated_text = self._add_generation(agent, episode, generated)
+                step_output = self._step_env(episode, generated_text)
+                self._add_step_output(agent, episode, step_output)
+
+        return self._finish_episode(agent, episode)
+
+    @staticmethod
+    def _failed_experience(
+        agent: Agent | APIAgent,
+    ) -> ExperienceOutput | APIExperienceOutput:
+        """
+        Placeholder for an episode that raised, so that the other episodes of the batch survive.
+        It is marked `failed`, for evaluations and trainers to leave it out of scores and data files.
+        """
+        if isinstance(agent, Agent):
+            return ExperienceOutput(
+                conversation=[],
+                reward=0.0,
+                text="",
+                seq_ids=[],
+                attention_mask=[],
+                action_mask=[],
+                failed=True,
             )
+        elif isinstance(agent, APIAgent):
+            return APIExperienceOutput(conversation=[], reward=0.0, failed=True)
         else:
             raise NotImplementedError
 
+    def _generate_experience_concurrent(
+        self,
+        agent: Agent | APIAgent,
+        idxs: Sequence[int],
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[ExperienceOutput]:
+        """
+        Run the episodes on all clients at once, one worker thread per client.
+        Each worker pulls the next index from a shared queue, so a slow episode does not hold back the others.
+        Results are returned in the order of `idxs`. An episode that raises is reported and replaced by
+        `_failed_experience`, the remaining episodes are unaffected.
+        """
+        result = [None] * len(idxs)
+        pending = queue.SimpleQueue()
+        for position, idx in enumerate(idxs):
+            pending.put((position, idx))
+
+        def worker(client: BaseEnvClient) -> None:
+            while True:
+                try:
+                    position, idx = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    result[position] = self._generate_experience_one(
+                        agent=agent,
+                        client=client,
+                        idx=idx,
+                        generation_config=generation_config,
+                        max_rounds=max_rounds,
+                    )
+                except Exception:  # pylint: disable=W0718:broad-exception-caught
+                    print(f"[{self.env_name}] Episode {idx} failed:")
+                    traceback.print_exc()
+                    result[position] = self._failed_experience(agent)
+
+        clients = self.clients[: len(idxs)]
+        with ThreadPoolExecutor(
+            max_workers=len(clients), thread_name_prefix=f"{self.env_name}-rollout"
+        ) as executor:
+            list(executor.map(worker, clients))
+        return result
+
+    def _generate_experience_lockstep(
+        self,
+        agent: Agent,
+        idxs: Sequence[int],
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[ExperienceOutput]:
+        """
+        Keep up to `n_clients` episodes alive and advance them in lockstep.
+        Every round, all episodes waiting on the model are generated with a single `agent.generate` call,
+        then each output is stepped on the episode's own client in parallel, or with one batched request
+        per server for clients with `batch_endpoints`. Finished episodes leave the
+        batch and free their client for the next queued index. Results are returned in the order of `idxs`.
+        """
+        result = [None] * len(idxs)
+        pending = collections.deque(enumerate(idxs))
+        free_clients = list(reversed(self.clients))
+        live: list[tuple[int, RolloutEpisode]] = []
+
+        def start(position: int, idx: int, client: BaseEnvClient):
+            try:
+                return position, self._start_episode(agent, client, idx)
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {idx} failed:")
+                traceback.print_exc()
+                return position, None
+
+        def step(episode: RolloutEpisode, generated: list[int]) -> bool:
+            try:
+                generated_text = self._add_generation(agent, episode, generated)
+                step_output = self._step_env(episode, generated_text)
+                self._add_step_output(agent, episode, step_output)
+                return True
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {episode.idx} failed:")
+                traceback.print_exc()
+                return False
+
+        with ThreadPoolExecutor(
+            max_workers=len(self.clients), thread_name_prefix=f"{self.env_name}-rollout"
+        ) as executor:
+            while pending or live:
+                # refill the batch with queued indices
+                starting = []
+                while pending and free_clients:
+                    position, idx = pending.popleft()
+                    starting.append((position, idx, free_clients.pop()))
+                for (position, episode), (_, _, client) in zip(
+                    executor.map(lambda args: start(*args), starting), starting
+                ):
+                    if episode is None:
+                        result[position] = self._failed_experience(agent)
+                        free_clients.append(client)
+                    else:
+                        live.append((position, episode))
+
+                # retire finished episodes
+                waiting = []
+                for position, episode in live:
+                    if self._needs_generation(
+                        agent, episode, generation_config, max_rounds
+                    ):
+                        waiting.append((position, episode))
+                    else:
+                        result[position] = self._finish_episode(agent, episode)
+                        free_clients.append(episode.client)
+                live = waiting
+                if not live:
+                    continue
+
+                try:
+                    generated = agent.generate(
+                        [
+                            episode.conversation_tokenized["input_ids"]
+                            for _, episode in live
+                        ],
+                        generation_config,
+                        kv_caches=[episode.kv_cache for _, episode in live],
+                    )
+                except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                    print(e)
+                    for _, episode in live:
+                        episode.stopped = True  # stop if generate method raises exceptions
+                    continue
+
+                if self.clients[0].uses_batch_endpoints:
+                    stepped = self._step_envs_batched(
+                        agent, [episode for _, episode in live], generated
+                    )
+                else:
+                    stepped = list(
+                        executor.map(
+                            step, [episode for _, episode in live], generated
+                        )
+                    )
+                survivors = []
+                for (position, episode), ok in zip(live, stepped):
+                    if ok:
+                        survivors.append((position, episode))
+                    else:
+                        result[position] = self._failed_experience(agent)
+                        free_clients.append(episode.client)
+                live = survivors
+
+        return result
+
+    def _generate_experience_pipelined(
+        self,
+        agent: Agent,
+        idxs: Sequence[int],
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[ExperienceOutput]:
+        """
+        Like the lockstep loop, but without a barrier between generation and env steps.
+        Env resets and steps run in background workers and hand their episode back through a queue;
+        the generator batches whatever episodes are ready and only blocks when none are, so slow steps
+        of one episode overlap with generation for the others. Utilization of both sides is stored
+        in `self.last_rollout_stats`.
+        """
+        result = [None] * len(idxs)
+        pending = collections.deque(enumerate(idxs))
+        free_clients = list(reversed(self.clients))
+        ready = queue.SimpleQueue()
+        stats = RolloutStats(env_workers=len(self.clients))
+        in_flight = 0
+
+        def start(position: int, idx: int, client: BaseEnvClient) -> None:
+            start_time = time.perf_counter()
+            try:
+                episode = self._start_episode(agent, client, idx)
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {idx} failed:")
+                traceback.print_exc()
+                episode = None
+            ready.put((position, client, episode, time.perf_counter() - start_time))
+
+        def step(position: int, episode: RolloutEpisode, generated: list[int]) -> None:
+            start_time = time.perf_counter()
+            try:
+                generated_text = self._add_generation(agent, episode, generated)
+                step_output = self._step_env(episode, generated_text)
+                self._add_step_output(agent, episode, step_output)
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {episode.idx} failed:")
+                traceback.print_exc()
+                ready.put((position, episode.client, None, time.perf_counter() - start_time))
+                return
+            ready.put((position, episode.client, episode, time.perf_counter() - start_time))
+
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(
+            max_workers=len(self.clients), thread_name_prefix=f"{self.env_name}-env"
+        ) as executor:
+            while pending or in_flight:
+                while pending and free_clients:
+                    position, idx = pending.popleft()
+                    executor.submit(start, position, idx, free_clients.pop())
+                    in_flight += 1
+
+                # block for one episode, then take every other one that is ready
+                returned = [ready.get()]
+                while True:
+                    try:
+                        returned.append(ready.get_nowait())
+                    except queue.Empty:
+                        break
+
+                batch: list[tuple[int, RolloutEpisode]] = []
+                for position, client, episode, env_time in returned:
+                    stats.env_time += env_time
+                    if episode is None:
+                        result[position] = self._failed_experience(agent)
+                    elif not self._needs_generation(
+                        agent, episode, generation_config, max_rounds
+                    ):
+                        result[position] = self._finish_episode(agent, episode)
+                    else:
+                        batch.append((position, episode))
+                        continue
+                    free_clients.append(client)
+                    in_flight -= 1
+                if not batch:
+                    continue
+
+                generation_start = time.perf_counter()
+                try:
+                    generated = agent.generate(
+                        [
+                            episode.conversation_tokenized["input_ids"]
+                            for _, episode in batch
+                        ],
+                        generation_config,
+                        kv_caches=[episode.kv_cache for _, episode in batch],
+                    )
+                except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                    print(e)
+                    for position, episode in batch:
+                        episode.stopped = True  # stop if generate method raises exceptions
+                        ready.put((position, episode.client, episode, 0.0))
+                    continue
+                finally:
+                    stats.generation_time += time.perf_counter() - generation_start
+                stats.generate_calls += 1
+                stats.generated_sequences += len(batch)
+
+                for (position, episode), output in zip(batch, generated):
+                    executor.submit(step, position, episode, output)
+
+        stats.wall_time = time.perf_counter() - wall_start
+        self.last_rollout_stats = stats
+        return result
+
     def _generate_experience_batch(
         self,
         agent: Agent | APIAgent,
@@ -154,6 +651,35 @@ class BaseTask:
         generation_config: Optional[GenerationConfig] = None,
         max_rounds: Optional[int] = None,
     ) -> list[ExperienceOutput]:
+        rollout_mode = self._resolve_rollout_mode(agent)
+        if rollout_mode == RolloutMode.PIPELINED and len(idxs) > 1:
+            return self._generate_experience_pipelined(
+                agent=agent,
+                idxs=idxs,
+                generation_config=generation_config,
+                max_rounds=max_rounds,
+            )
+        if rollout_mode == RolloutMode.LOCKSTEP and len(idxs) > 1:
+            if agent.reuse_kv_cache:
+                warnings.warn(
+                    "reuse_kv_cache is skipped by lockstep rollouts while they generate for several "
+                    "episodes at once; use rollout_mode='concurrent' to reuse the cache with n_clients > 1",
+                    stacklevel=2,
+                )
+            return self._generate_experience_lockstep(
+                agent=agent,
+                idxs=idxs,
+                generation_config=generation_config,
+                max_rounds=max_rounds,
+            )
+        if rollout_mode == RolloutMode.CONCURRENT and len(idxs) > 1:
+            return self._generate_experience_concurrent(
+                agent=agent,
+                idxs=idxs,
+                generation_config=generation_config,
+                max_rounds=max_rounds,
+            )
+
         client = self.clients[0]
         result = [
             self._generate_experience_one(
@@ -167,6 +693,69 @@ class BaseTask:
         ]
         return result
 
+    async def _agenerate_experience_one(
+        self,
+        agent: AsyncAPIAgent,
+        client: BaseEnvClient,
+        idx: int,
+        max_rounds: Optional[int],
+        executor: ThreadPoolExecutor,
+    ) -> APIExperienceOutput:
+        # env clients are blocking, so their calls run in the executor
+        loop = asyncio.get_running_loop()
+        episode = await loop.run_in_executor(
+            executor, self._start_episode, agent, client, idx
+        )
+        while self._needs_generation(agent, episode, max_rounds=max_rounds):
+            with trace_span("round", episode=idx, round=episode.rounds):
+                generated = await agent.agenerate(episode.conversation)
+                generated_text = self._add_generation(agent, episode, generated)
+                step_output = await loop.run_in_executor(
+                    executor, self._step_env, episode, generated_text
+                )
+                self._add_step_output(agent, episode, step_output)
+        return self._finish_episode(agent, episode)
+
+    async def agenerate_experience(
+        self,
+        agent: AsyncAPIAgent,
+        idxs: Sequence[int] | int,
+        max_rounds: Optional[int] = None,
+    ) -> list[APIExperienceOutput]:
+        """
+        Asyncio rollout loop: every index becomes a coroutine that borrows a free client,
+        so up to `n_clients` episodes are in flight while the agent bounds the API requests.
+        Results are returned in the order of `idxs`, and an episode that raises is replaced
+        by `_failed_experience`.
+        """
+        if isinstance(idxs, int):
+            idxs = [idxs]
+
+        free_clients = asyncio.Queue()
+        for client in self.clients:
+            free_clients.put_nowait(client)
+        executor = ThreadPoolExecutor(
+            max_workers=len(self.clients), thread_name_prefix=f"{self.env_name}-env"
+        )
+
+        async def run(idx: int) -> APIExperienceOutput:
+            client = await free_clients.get()
+            try:
+                return await self._agenerate_experience_one(
+                    agent, client, idx, max_rounds, executor
+                )
+            except Exception:  # pylint: disable=W0718:broad-exception-caught
+                print(f"[{self.env_name}] Episode {idx} failed:")
+                traceback.print_exc()
+                return self._failed_experience(agent)
+            finally:
+                free_clients.put_nowait(client)
+
+        try:
+            return list(await asyncio.gather(*(run(idx) for idx in idxs)))
+        finally:
+            executor.shutdown(wait=False)
+
     def generate_experience(
         self,
         agent: Agent | APIAgent,
@@ -0,0 +1,174 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+# (episode, round) of the innermost open span, inherited by nested spans
+_current_episode = contextvars.ContextVar("agentenv_trace_episode", default=(None, None))
+_active_tracer: Optional["RolloutTracer"] = None
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def set(self, **args: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start", "token")
+
+    def __init__(self, tracer: "RolloutTracer", name: str, args: dict) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        parent_episode, parent_round = _current_episode.get()
+        episode = self.args.setdefault("episode", parent_episode)
+        round_ = self.args.setdefault("round", parent_round)
+        self.token = _current_episode.set((episode, round_))
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        end = time.perf_counter_ns()
+        _current_episode.reset(self.token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record(self.name, self.start, end, self.args)
+
+    def set(self, **args: Any) -> None:
+        self.args.update(args)
+
+
+class RolloutTracer:
+    """
+    Opt-in recorder of where rollout time goes. While a tracer is active (`with RolloutTracer() as tracer:`),
+    the controller records spans for env calls, tokenization, generation and action parsing, tagged with
+    the episode index and round. Results can be exported as Chrome-trace JSON (chrome://tracing, Perfetto)
+    or summarized as per-phase percentiles. When no tracer is active, `trace_span` returns a shared no-op.
+    """
+
+    def __init__(self) -> None:
+        self.events: list[tuple[str, int, int, int, dict]] = []
+        self._previous: Optional[RolloutTracer] = None
+
+    def __enter__(self) -> "RolloutTracer":
+        global _active_tracer
+        self._previous = _active_tracer
+        _active_tracer = self
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _active_tracer
+        _active_tracer = self._previous
+        self._previous = None
+
+    def span(self, name: str, **args: Any) -> _Span:
+        return _Span(self, name, args)
+
+    def _record(self, name: str, start: int, end: int, args: dict) -> None:
+        # list.append is atomic, so spans from env worker threads need no lock
+        self.events.append((name, start, end, threading.get_ident(), args))
+
+    def clear(self) -> None:
+        self.events = []
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Complete ("X") events in microseconds. Spans that belong to an episode are drawn on that episode's
+        row, other spans (e.g. batched generation) on the row of the thread that ran them.
+        """
+        pid = os.getpid()
+        origin = min((start for _, start, _, _, _ in self.events), default=0)
+        trace_events = []
+        rows = {}
+        for name, start, end, thread_id, args in self.events:
+            episode = args.get("episode")
+            if episode is not None:
+                tid = int(episode)
+                rows.setdefault(tid, f"episode {episode}")
+            else:
+                tid = thread_id
+                rows.setdefault(tid, f"thread {thread_id}")
+            trace_events.append(
+                {
+                    "name": name,
+                    "cat": name.split(".")[0],
+                    "ph": "X",
+                    "ts": (start - origin) / 1000,
+                    "dur": (end - start) / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        for tid, row_name in rows.items():
+            trace_events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": row_name},
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def summary(self, percentiles: tuple[float, ...] = (50, 90, 99)) -> dict:
+        """
+        Per span name: count, total seconds and latency percentiles in milliseconds,
+        plus the prompt and generated token counts reported by generation spans.
+        """
+        durations: dict[str, list[float]] = {}
+        prompt_tokens = generated_tokens = 0
+        for name, start, end, _, args in self.events:
+            durations.setdefault(name, []).append((end - start) / 1e6)
+            prompt_tokens += args.get("prompt_tokens") or 0
+            generated_tokens += args.get("generated_tokens") or 0
+
+        phases = {}
+        for name, values in sorted(durations.items()):
+            values = np.array(values)
+            phases[name] = {
+                "count": len(values),
+                "total_s": float(values.sum()) / 1000,
+                "mean_ms": float(values.mean()),
+                **{
+                    f"p{p:g}_ms": float(v)
+                    for p, v in zip(percentiles, np.percentile(values, percentiles))
+                },
+                "max_ms": float(values.max()),
+            }
+        return {
+            "phases": phases,
+            "prompt_tokens": prompt_tokens,
+            "generated_tokens": generated_tokens,
+        }
+
+
+def get_tracer() -> Optional[RolloutTracer]:
+    return _active_tracer
+
+
+def trace_span(name: str, **args: Any) -> _Span | _NullSpan:
+    tracer = _active_tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, **args)
@@ -0,0 +1,302 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import httpx
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+try:
+    import msgpack
+    from websockets.exceptions import WebSocketException
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    msgpack = None
+
+
+class EnvServerError(requests.RequestException):
+    """
+    An env server answered with an error status, or could not be reached after all retries.
+    Subclasses `requests.RequestException`, so existing handlers keep catching it.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        method: str,
+        url: str,
+        status_code: Optional[int] = None,
+        detail: Optional[str] = None,
+    ) -> None:
+        super().__init__(message)
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.detail = detail
+
+    @classmethod
+    def from_status(cls, method: str, url: str, status_code: int, text: str) -> "EnvServerError":
+        detail = text[:500]
+        return cls(
+            f"{method} {url} returned {status_code}: {detail}",
+            method=method,
+            url=url,
+            status_code=status_code,
+            detail=detail,
+        )
+
+
+class _RetryPolicy:
+    """
+    Which failures are retried: statuses in `retry_statuses` (503 by default, the "busy" answer of
+    the env servers, for which the request was not processed) and failures to connect. Errors after
+    the request may have reached the server are not retried, since `/step` is not idempotent.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_base: float = 0.1,
+        backoff_max: float = 5.0,
+        retry_statuses: tuple[int, ...] = (503,),
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(delay / 2, delay)
+
+
+def _is_connect_error(error: Exception) -> bool:
+    if isinstance(error, (requests.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class EnvTransport(_RetryPolicy):
+    """
+    Blocking HTTP transport shared by all env clients of a process (see `get_env_transport`).
+    One keep-alive `requests.Session` pools connections per server, and is recreated after fork
+    so that worker processes never share sockets. Returns the decoded JSON body, or raises
+    `EnvServerError`.
+    """
+
+    def __init__(self, pool_maxsize: int = 256, **retry_kwargs) -> None:
+        super().__init__(**retry_kwargs)
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=16, pool_maxsize=self.pool_maxsize
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                res = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                if not _is_connect_error(e) or attempt == self.max_retries:
+                    raise EnvServerError(
+                        f"{method} {url} failed: {e}", method=method, url=url
+                    ) from e
+            else:
+                if res.status_code == 200:
+                    return res.json()
+                if res.status_code not in self.retry_statuses or attempt == self.max_retries:
+                    raise EnvServerError.from_status(method, url, res.status_code, res.text)
+            time.sleep(self.delay(attempt))
+
+    def post(self, url: str, json: Any = None, **kwargs) -> Any:
+        return self.request("POST", url, json=json, **kwargs)
+
+    def get(self, url: str, params: Any = None, **kwargs) -> Any:
+        return self.request("GET", url, params=params, **kwargs)
+
+
+class AsyncEnvTransport(_RetryPolicy):
+    """
+    Asyncio counterpart of `EnvTransport`, with one pooled `httpx.AsyncClient` per event loop.
+    """
+
+    def __init__(self, max_connections: int = 256, **retry_kwargs) -> None:
+        super().__init__(**retry_kwargs)
+        self.max_connections = max_connections
+        self._client = None
+        self._loop = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=None,
+            )
+            self._loop = loop
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                res = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                if not _is_connect_error(e) or attempt == self.max_retries:
+                    raise EnvServerError(
+                        f"{method} {url} failed: {e!r}", method=method, url=url
+                    ) from e
+            else:
+                if res.status_code == 200:
+                    return res.json()
+                if res.status_code not in self.retry_statuses or attempt == self.max_retries:
+                    raise EnvServerError.from_status(method, url, res.status_code, res.text)
+            await asyncio.sleep(self.delay(attempt))
+
+    async def post(self, url: str, json: Any = None, **kwargs) -> Any:
+        return await self.request("POST", url, json=json, **kwargs)
+
+    async def get(self, url: str, params: Any = None, **kwargs) -> Any:
+        return await self.request("GET", url, params=params, **kwargs)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+
+class WebSocketEnvSession(_RetryPolicy):
+    """
+    Transport of a single env client over one long-lived WebSocket to the `/ws` endpoint of its server,
+    selected with `transport="ws"`. Requests keep the REST paths and bodies, e.g.
+    `post(f"{base}/step", json=...)` is sent as the msgpack frame `{"op": "step", "body": {...}}` and
+    answered with `{"status": 200, "body": ...}`, so the env clients work unchanged.
+    The connection is opened on the first request, and reopened after fork or when it drops.
+    """
+
+    def __init__(self, max_size: int = 64 * 2**20, **retry_kwargs) -> None:
+        if msgpack is None:
+            raise ImportError(
+                'transport="ws" requires websockets and msgpack: `pip install websockets msgpack`'
+            )
+        super().__init__(**retry_kwargs)
+        self.max_size = max_size
+        self._connection = None
+        self._url = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self, ws_url: str):
+        if self._pid == os.getpid() and self._url == ws_url and self._connection is not None:
+            return self._connection
+        self.close()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._connection = ws_connect(
+                    ws_url, compression=None, max_size=self.max_size
+                )
+                self._url = ws_url
+                self._pid = os.getpid()
+                return self._connection
+            except (OSError, WebSocketException) as e:
+                # the handshake is refused by servers without `/ws`, no point in retrying
+                if not isinstance(e, OSError) or attempt == self.max_retries:
+                    raise EnvServerError(
+                        f"WS {ws_url} failed: {e}", method="WS", url=ws_url
+                    ) from e
+            time.sleep(self.delay(attempt))
+
+    def close(self) -> None:
+        # a connection inherited through fork belongs to the parent, leave it alone
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._url = None
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        json: Any = None,
+        params: Any = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        parts = urlsplit(url)
+        base, _, op = parts.path.rpartition("/")
+        ws_url = urlunsplit(
+            ("wss" if parts.scheme == "https" else "ws", parts.netloc, f"{base}/ws", "", "")
+        )
+        body = dict(parse_qsl(parts.query))
+        body.update(params or {})
+        body.update(json or {})
+        with self._lock:
+            connection = self._connect(ws_url)
+            try:
+                connection.send(msgpack.packb({"op": op, "body": body}))
+                reply = msgpack.unpackb(connection.recv(timeout=timeout))
+            except (OSError, TimeoutError, WebSocketException) as e:
+                # the request may have been processed, so it is not retried
+                self.close()
+                raise EnvServerError(
+                    f"{method} {url} failed: {e!r}", method=method, url=url
+                ) from e
+        if reply["status"] != 200:
+            raise EnvServerError.from_status(
+                method, url, reply["status"], str(reply.get("detail"))
+            )
+        return reply["body"]
+
+    def post(self, url: str, json: Any = None, **kwargs) -> Any:
+        return self.request("POST", url, json=json, **kwargs)
+
+    def get(self, url: str, params: Any = None, **kwargs) -> Any:
+        return self.request("GET", url, params=params, **kwargs)
+
+
+_env_transport = EnvTransport()
+_async_env_transport = AsyncEnvTransport()
+
+
+def get_env_transport() -> EnvTransport:
+    return _env_transport
+
+
+def get_async_env_transport() -> AsyncEnvTransport:
+    return _async_env_transport
+
+
+def configure_env_transport(**kwargs) -> None:
+    """
+    Replace the shared transports, e.g. `configure_env_transport(max_retries=10, retry_statuses=(502, 503))`.
+    `pool_maxsize` applies to the blocking transport, other arguments to both.
+    """
+    global _env_transport, _async_env_transport
+    pool_maxsize = kwargs.pop("pool_maxsize", 256)
+    _env_transport = EnvTransport(pool_maxsize=pool_maxsize, **kwargs)
+    _async_env_transport = AsyncEnvTransport(max_connections=pool_maxsize, **kwargs)
@@ -31,6 +31,13 @@ class InferenceEngine(Enum):
     VLLM = "vllm"
 
 
+class RolloutMode(Enum):
+    SEQUENTIAL = "sequential"
+    CONCURRENT = "concurrent"
+    LOCKSTEP = "lockstep"
+    PIPELINED = "pipelined"
+
+
 @dataclass
 class StepOutput:
     state: str
@@ -46,12 +53,43 @@ class ExperienceOutput:
     seq_ids: list[int]
     attention_mask: list[int]
     action_mask: list[int]
+    # the episode raised and was replaced by an empty one, see `BaseTask._failed_experience`
+    failed: bool = False
 
 
 @dataclass
 class APIExperienceOutput:
     conversation: list[ConversationMessage]
     reward: float
+    failed: bool = False
+
+
+@dataclass
+class RolloutStats:
+    wall_time: float = 0.0
+    generation_time: float = 0.0
+    env_time: float = 0.0
+    env_workers: int = 1
+    generate_calls: int = 0
+    generated_sequences: int = 0
+
+    @property
+    def generation_utilization(self) -> float:
+        """Fraction of the wall time the model spent generating."""
+        return self.generation_time / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def env_utilization(self) -> float:
+        """Fraction of the env workers' wall time spent in env calls."""
+        if not self.wall_time:
+            return 0.0
+        return self.env_time / (self.wall_time * self.env_workers)
+
+    @property
+    def mean_batch_size(self) -> float:
+        if not self.generate_calls:
+            return 0.0
+        return self.generated_sequences / self.generate_calls
 
 
 @dataclass
@@ -65,6 +103,8 @@ class EvaluationOutput:
     experiences: list[ExperienceOutput]
     score: float
     success: float
+    # failed episodes are kept in `experiences`, but not counted in `score` and `success`
+    failed: int = 0
 
 
 @dataclass
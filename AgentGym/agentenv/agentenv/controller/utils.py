@@ -1,3 +1,4 @@
+import asyncio
 import json
 import re
 from typing import Optional, Sequence
@@ -5,7 +6,8 @@ from typing import Optional, Sequence
 import numpy as np
 from transformers import GenerationConfig
 
-from . import Agent, APIAgent, BaseTask
+from . import Agent, APIAgent, AsyncAPIAgent, BaseTask
+from .tracing import trace_span
 from .types import (
     ActionFormat,
     ActionWithTought,
@@ -194,14 +196,15 @@ class BaseAdapter:
 
     @classmethod
     def action_parser(cls, action: str, action_format: ActionFormat) -> str:
-        if action_format == ActionFormat.REACT:
-            return cls.parse_react(action).action
-        elif action_format == ActionFormat.FUNCTION_CALLING:
-            return cls.parse_function_calling(action).action
-        elif action_format == ActionFormat.CODE_AS_ACTION:
-            return cls.parse_code_as_action(action).action
-        else:
-            raise NotImplementedError
+        with trace_span("action_parser", action_format=action_format.value):
+            if action_format == ActionFormat.REACT:
+                return cls.parse_react(action).action
+            elif action_format == ActionFormat.FUNCTION_CALLING:
+                return cls.parse_function_calling(action).action
+            elif action_format == ActionFormat.CODE_AS_ACTION:
+                return cls.parse_code_as_action(action).action
+            else:
+                raise NotImplementedError
 
 
 class BaseAgentEnvController:
@@ -236,6 +239,41 @@ class BaseAgentEnvController:
 
         return experience
 
+    async def agenerate_experience(
+        self,
+        idxs: Sequence[int] | Sequence[Sequence[int]] | None = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[APIExperienceOutput]:
+        if not isinstance(self.agent, AsyncAPIAgent):
+            raise TypeError("Async rollouts require an AsyncAPIAgent.")
+        if isinstance(idxs[0], int):
+            return await self.tasks[0].agenerate_experience(
+                self.agent, idxs, max_rounds
+            )
+        elif isinstance(idxs[0], Sequence):
+            experiences = await asyncio.gather(
+                *(
+                    task.agenerate_experience(self.agent, idxs[idx], max_rounds)
+                    for idx, task in enumerate(self.tasks)
+                )
+            )
+            return [exp for task_experiences in experiences for exp in task_experiences]
+        else:
+            raise ValueError("Incorrect Format for idxs")
+
+
+def _evaluation_output(
+    exps: list[ExperienceOutput | APIExperienceOutput],
+) -> EvaluationOutput:
+    """Score and success over the episodes that completed; failed ones are only counted."""
+    rewards = np.array([exp.reward for exp in exps if not exp.failed])
+    return EvaluationOutput(
+        experiences=exps,
+        score=rewards.mean(),
+        success=((rewards == 1) | (rewards == 100)).mean(),
+        failed=sum(exp.failed for exp in exps),
+    )
+
 
 class Evaluator(BaseAgentEnvController):
     def eval(
@@ -253,10 +291,22 @@ class Evaluator(BaseAgentEnvController):
             generation_config=generation_config,
             max_rounds=max_rounds,
         )
-        rewards = np.array([exp.reward for exp in exps])
-        return EvaluationOutput(
-            experiences=exps, score=rewards.mean(), success=(rewards == 1 or rewards == 100).mean()
+        return _evaluation_output(exps)
+
+    async def aeval(
+        self,
+        max_rounds: Optional[int] = None,
+        idxs: Sequence[int] | Sequence[Sequence[int]] | None = None,
+    ) -> EvaluationOutput:
+        exps = await self.agenerate_experience(
+            idxs=(
+                idxs
+                if idxs is not None
+                else [list(range(len(task.clients[0]))) for task in self.tasks]
+            ),
+            max_rounds=max_rounds,
         )
+        return _evaluation_output(exps)
 
 
 class BaseTrainer(BaseAgentEnvController):
@@ -277,10 +327,7 @@ class BaseTrainer(BaseAgentEnvController):
             generation_config=generation_config,
             max_rounds=max_rounds,
         )
-        rewards = np.array([exp.reward for exp in exps])
-        return EvaluationOutput(
-            experiences=exps, score=rewards.mean(), success=(rewards == 1 or rewards == 100).mean()
-        )
+        return _evaluation_output(exps)
 
     def save_model(self):
         pass
@@ -2,9 +2,6 @@ import json
 from typing import Any, Mapping
 import re
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import (
     BaseAdapter,
     BaseEnvClient,
@@ -528,15 +525,11 @@ class AlfWorldEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise requests.RequestException(f"Failed to create environment: {ok}")
+        ok = self.transport.post(f"{self.env_server_base}/create", timeout=self.timeout)
         
         self.conversation_start = self.adapter_cls.conversation_start_dict[
             self.action_format
         ]
-        
-        ok = ok.json()
         # print(ok)
         self.env_id = ok["id"]
         self.info = None
@@ -546,21 +539,17 @@ class AlfWorldEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?id={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return f"{self.info['observation']}\nAVAILABLE ACTIONS: {','.join(self.info['available_actions'])}"
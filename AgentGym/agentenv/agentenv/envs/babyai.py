@@ -1,12 +1,12 @@
 from typing import Any, Mapping
-import requests
 import re
-from requests.exceptions import RequestException
 from agentenv.controller import BaseEnvClient, BaseTask
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
 class BabyAIEnvClient(BaseEnvClient):
+    batch_endpoints = True
+    local_ops = "agentenv_babyai.server:session_ops"
     conversation_start = (
         ConversationMessage(
             {
@@ -32,11 +32,7 @@ class BabyAIEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
-
-        ok = ok.json()
+        ok = self.transport.post(f"{self.env_server_base}/create", timeout=self.timeout)
         self.env_id = ok["id"]
 
     def __len__(self):
@@ -44,26 +40,22 @@ class BabyAIEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?id={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
 
-    def step(self, action: str) -> StepOutput:
+    def _prepare_step(self, action: str) -> str | StepOutput:
         action_matches = re.findall(r"Action:\s*(.*?)(?=\n|$)", action, re.DOTALL)
         if len(action_matches) > 1:
             return StepOutput(
@@ -73,8 +65,15 @@ class BabyAIEnvClient(BaseEnvClient):
             )
         action = action_matches[-1] if action_matches else ""
         action = re.sub(r"[^A-Za-z0-9, ]+", "", action)
-        action = " ".join(action.split()).strip()
-        response = self._post("step", {"action": action})
+        return " ".join(action.split()).strip()
+
+    def step(self, action: str) -> StepOutput:
+        action = self._prepare_step(action)
+        if isinstance(action, StepOutput):
+            return action
+        return self._apply_step(self._post("step", {"action": action}))
+
+    def _apply_step(self, response: dict[str, Any]) -> StepOutput:
         self.info = {
             "observation": response["observation"],
             "reward": response["reward"],
@@ -88,7 +87,12 @@ class BabyAIEnvClient(BaseEnvClient):
         )
 
     def reset(self, data_idx: int = 0) -> dict[str, Any]:
-        response = self._post("reset", {"data_idx": data_idx})
+        return self._apply_reset(self._post("reset", self._reset_data(data_idx)))
+
+    def _reset_data(self, idx: int) -> dict[str, Any]:
+        return {"data_idx": idx}
+
+    def _apply_reset(self, response: dict[str, Any]) -> dict[str, Any]:
         self.info = {
             "observation": response["observation"],
             "reward": response["reward"],
@@ -1,7 +1,5 @@
 from typing import Any, Mapping, Dict
 import re
-import requests
-from requests.exceptions import RequestException
 from agentenv.controller import BaseEnvClient, BaseTask
 from agentenv.controller.types import ConversationMessage, StepOutput
 
@@ -30,24 +28,18 @@ class IwaEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
-        self.env_id = ok.json()["env_idx"]
+        ok = self.transport.post(f"{self.env_server_base}/create", timeout=self.timeout)
+        self.env_id = ok["env_idx"]
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         data["env_idx"] = self.env_id
-        res = requests.post(f"{self.env_server_base}/{path}", json=data, timeout=self.timeout)
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(f"{self.env_server_base}/{path}", json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> Dict[str, Any]:
-        res = requests.get(f"{self.env_server_base}/{path}", params={"env_idx": self.env_id}, timeout=self.timeout)
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.get(f"{self.env_server_base}/{path}", params={"env_idx": self.env_id}, timeout=self.timeout)
 
     def observe(self) -> str:
         response = self._get("observation")
@@ -1,9 +1,6 @@
 import json
 from typing import Any, Mapping
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import BaseEnvClient, BaseTask
 from agentenv.controller.types import ConversationMessage, StepOutput
 
@@ -15,6 +12,8 @@ from agentenv.controller.types import ConversationMessage, StepOutput
 
 
 class MazeEnvClient(BaseEnvClient):
+    batch_endpoints = True
+    local_ops = "agentenv_lmrlgym.server:maze_session_ops"
     conversation_start = (
         ConversationMessage(
             {"from": "human", "loss": None, "value": "You are an expert maze solver."}
@@ -125,11 +124,7 @@ Now let's start a new game. Return your action and your thought in the format ab
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
-
-        ok = ok.json()
+        ok = self.transport.post(f"{self.env_server_base}/create", timeout=self.timeout)
         print(ok)
         self.env_id = ok["id"]
         self.info = {
@@ -142,26 +137,22 @@ Now let's start a new game. Return your action and your thought in the format ab
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?id={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
 
-    def step(self, action: str) -> StepOutput:
+    def _prepare_step(self, action: str) -> str:
         print(action)
         if action.endswith("</s>"):
             action = action[:-5]
@@ -171,7 +162,13 @@ Now let's start a new game. Return your action and your thought in the format ab
         else:
             action = _action[0].strip()
         print(f"Action: {action}")
-        response = self._post("step", {"action": action})
+        return action
+
+    def step(self, action: str) -> StepOutput:
+        action = self._prepare_step(action)
+        return self._apply_step(self._post("step", {"action": action}))
+
+    def _apply_step(self, response: dict[str, Any]) -> StepOutput:
         print(response)
         self.info.update(
             {
@@ -187,7 +184,12 @@ Now let's start a new game. Return your action and your thought in the format ab
         )
 
     def reset(self, idx: int = 0) -> dict[str, Any]:
-        response = self._post("reset", {"game": idx})
+        return self._apply_reset(self._post("reset", self._reset_data(idx)))
+
+    def _reset_data(self, idx: int) -> dict[str, Any]:
+        return {"game": idx}
+
+    def _apply_reset(self, response: dict[str, Any]) -> dict[str, Any]:
         print(response)
         self.first_observation = self._fully_first_observation
         response["observation"] = (
@@ -219,6 +221,8 @@ class MazeTask(BaseTask):
 
 
 class WordleEnvClient(BaseEnvClient):
+    batch_endpoints = True
+    local_ops = "agentenv_lmrlgym.server:wordle_session_ops"
     conversation_start = (
         ConversationMessage(
             {"from": "human", "loss": None, "value": "You are an expert wordle player."}
@@ -276,11 +280,7 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
-
-        ok = ok.json()
+        ok = self.transport.post(f"{self.env_server_base}/create", timeout=self.timeout)
         print(ok)
         self.env_id = ok["id"]
         vocab = self._get("filtered_vocab")
@@ -299,26 +299,22 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?id={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
 
-    def step(self, action: str) -> StepOutput:
+    def _prepare_step(self, action: str) -> str:
         print(action)
         if action.endswith("</s>"):
             action = action[:-5]
@@ -328,7 +324,13 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
         else:
             action = _action[0].strip()
         print(f"Action: {action}")
-        response = self._post("step", {"action": action})
+        return action
+
+    def step(self, action: str) -> StepOutput:
+        action = self._prepare_step(action)
+        return self._apply_step(self._post("step", {"action": action}))
+
+    def _apply_step(self, response: dict[str, Any]) -> StepOutput:
         print(response)
         self.info.update(
             {
@@ -344,7 +346,12 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
         )
 
     def reset(self, idx: int = 0) -> dict[str, Any]:
-        response = self._post("reset", {"seed": idx})
+        return self._apply_reset(self._post("reset", self._reset_data(idx)))
+
+    def _reset_data(self, idx: int) -> dict[str, Any]:
+        return {"seed": idx}
+
+    def _apply_reset(self, response: dict[str, Any]) -> dict[str, Any]:
         self.info.update(
             {
                 "observation": self.first_observation.replace(
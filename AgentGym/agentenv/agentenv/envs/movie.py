@@ -1,14 +1,13 @@
 from typing import Any, Mapping, Dict
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import BaseEnvClient, BaseTask
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
 
 class MovieEnvClient(BaseEnvClient):
+    batch_endpoints = True
+    _id_key = "env_idx"
     conversation_start = (
         ConversationMessage(
             {
@@ -30,36 +29,30 @@ class MovieEnvClient(BaseEnvClient):
         self.id = 0
         data = dict()
         data["id"] = 0
-        ok = requests.post(
+        ok = self.transport.post(
             f"{self.env_server_base}/create",
             json=data,
             timeout=self.timeout,
         )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
 
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         data["env_idx"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> Dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?env_idx={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> Dict[str, Any]:
         response = self._get("observation")
@@ -67,7 +60,12 @@ class MovieEnvClient(BaseEnvClient):
 
     def step(self, action: str) -> StepOutput:
         # action is the original output of llm
-        response = self._post("step", {"action": action})
+        return self._apply_step(self._post("step", {"action": action}))
+
+    def _prepare_step(self, action: str) -> str:
+        return action
+
+    def _apply_step(self, response: Dict[str, Any]) -> StepOutput:
         return StepOutput(
             state=response["observation"],
             reward=response["reward"],
@@ -75,8 +73,13 @@ class MovieEnvClient(BaseEnvClient):
         )
 
     def reset(self, id: int) -> Dict[str, Any]:
-        self.id = id
-        response = self._post("reset", {"id": self.id})
+        return self._apply_reset(self._post("reset", self._reset_data(id)))
+
+    def _reset_data(self, idx: int) -> Dict[str, Any]:
+        self.id = idx
+        return {"id": self.id}
+
+    def _apply_reset(self, response: str) -> str:
         return response
 
 
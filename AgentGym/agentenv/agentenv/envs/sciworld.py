@@ -2,9 +2,6 @@ import json
 import re
 from typing import Any, Mapping
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import (
     BaseAdapter,
     BaseEnvClient,
@@ -801,13 +798,10 @@ class SciworldEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        ok = self.transport.post(f"{self.env_server_base}/create", timeout=self.timeout)
         self.conversation_start = self.adapter_cls.conversation_start_dict[
             self.action_format
         ]
-        ok = ok.json()
         self.env_id = ok["id"]
 
     def __len__(self):
@@ -815,21 +809,17 @@ class SciworldEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?id={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
@@ -1,7 +1,5 @@
 from typing import Any, Mapping, Dict, List, Optional
 
-import requests
-from requests.exceptions import RequestException
 from agentenv.controller import BaseEnvClient, BaseTask
 from agentenv.controller.types import ConversationMessage, StepOutput
 
@@ -27,36 +25,30 @@ class SearchQAEnvClient(BaseEnvClient):
         self.id = 0
         data = dict()
         data['id'] = 0
-        ok = requests.post(
+        ok = self.transport.post(
             f"{self.env_server_base}/create",
             json=data,
             timeout=self.timeout,
         )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
 
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         data["env_idx"] = self.env_id
-        res = requests.post(
+        return self.transport.post(
             f"{self.env_server_base}/{path}",
             json=data,
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def _get(self, path: str) -> Dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?env_idx={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> Dict[str, Any]:
         question = self._get("observation")
@@ -1,8 +1,5 @@
 from typing import Any, Mapping
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import BaseEnvClient, BaseTask
 from agentenv.controller.types import ConversationMessage, StepOutput
 
@@ -27,47 +24,30 @@ class SqlGymEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(
+        ok = self.transport.post(
             f"{self.env_server_base}/create",
             timeout=self.timeout,
         )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
 
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["env_idx"] = self.env_id
-        max_retries = 5
-        for _ in range(max_retries):
-            res = requests.post(
-                f"{self.env_server_base}/{path}",
-                json=data,
-                timeout=self.timeout,
-            )
-            if res.status_code == 503:
-                import time
-
-                time.sleep(0.1)
-            elif res.status_code == 200:
-                break
-            else:
-                print("---------------------")
-                print(res.status_code)
-                print(data)
-        assert res.status_code == 200
-        return res.json()
+        # the server answers 503 while busy, which the transport retries with backoff
+        return self.transport.post(
+            f"{self.env_server_base}/{path}",
+            json=data,
+            timeout=self.timeout,
+        )
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?env_idx={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def step(self, action: str) -> StepOutput:
         action = action.split("```sql")[-1].split("```")[0].strip()
@@ -1,8 +1,6 @@
 import json
 from typing import Any, Mapping
 
-import requests
-
 from agentenv.controller import (
     BaseAdapter,
     BaseEnvClient,
@@ -158,49 +156,32 @@ class WebshopEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(
+        ok = self.transport.post(
             f"{self.env_server_base}/create",
             timeout=self.timeout,
         )
-        if ok.status_code != 200:
-            raise requests.RequestException(f"Failed to create environment: {ok}")
         self.conversation_start = self.adapter_cls.conversation_start_dict[
             self.action_format
         ]
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["env_idx"] = self.env_id
-        max_retries = 5
-        for attempt in range(max_retries):
-            res = requests.post(
-                f"{self.env_server_base}/{path}",
-                json=data,
-                timeout=self.timeout,
-            )
-            if res.status_code == 503:
-                import time
-
-                time.sleep(0.1)
-            elif res.status_code == 200:
-                break
-            else:
-                print("---------------------")
-                print(res.status_code)
-                print(data)
-        assert res.status_code == 200
-        return res.json()
+        # the server answers 503 while busy, which the transport retries with backoff
+        return self.transport.post(
+            f"{self.env_server_base}/{path}",
+            json=data,
+            timeout=self.timeout,
+        )
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
+        return self.transport.get(
             f"{self.env_server_base}/{path}?env_idx={self.env_id}",
             timeout=self.timeout,
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> dict[str, Any]:
         response = self._get("observation")
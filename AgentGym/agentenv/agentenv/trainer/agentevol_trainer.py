@@ -1,6 +1,8 @@
 import json
 import os
+import time
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import asdict
 from datetime import timedelta
 from functools import partial
@@ -11,10 +13,25 @@ import numpy as np
 import torch
 import wandb
 from accelerate import Accelerator, InitProcessGroupKwargs
-from accelerate.utils import broadcast, gather_object
+from accelerate.utils import broadcast
 from agentenv.controller.agent import Agent
+from agentenv.controller.rollout_workers import RolloutWorkerPool
 from agentenv.controller.task import BaseTask, GenerationConfig
 from agentenv.controller.utils import BaseTrainer
+from agentenv.trainer.packing import (
+    PackedDataset,
+    block_diagonal_mask,
+    packed_collate_fn,
+    padding_efficiency,
+    uses_varlen_attention,
+)
+from agentenv.trainer.sampler import TokenBudgetBatchSampler
+from agentenv.trainer.tokenization import TokenizationCache
+from agentenv.trainer.trajectory_shards import (
+    TrajectoryShardWriter,
+    first_occurrences,
+    read_trajectory_shards,
+)
 from agentenv.trainer.utils import set_seed
 from datasets import Dataset, DatasetDict
 from torch.utils.data import DataLoader
@@ -23,6 +40,9 @@ from transformers import AdamW, GenerationConfig, get_linear_schedule_with_warmu
 
 
 class AgentEvolTrainer(BaseTrainer):
+    # seconds between checks of the non-main ranks for the next iteration's train file
+    rollout_poll_interval = 5.0
+
     def __init__(self, agent: Agent, tasks: Sequence[BaseTask], args) -> None:
         self.agent = agent
         self.tasks = tasks
@@ -46,6 +66,10 @@ class AgentEvolTrainer(BaseTrainer):
         self.best_eval_log_dict = {}
         self.summary_log_dict = {}
 
+        # rollout workers, on the main process
+        self.rollout_pool = None
+        self.rollout_weights_version = 0
+
         self.create_accelerator()
         self.set_seed()
         self.setup_tokenizer()
@@ -95,68 +119,19 @@ class AgentEvolTrainer(BaseTrainer):
         create train_dataset 和 train_dataloader
         """
 
-        def tokenize_fn(batch, args, tokenizer):
-            # tokenizer.chat_template = "{% if messages[0]['role'] == 'system' %}{% set loop_messages = messages[1:] %}{% set system_message = messages[0]['content'] %}{% else %}{% set loop_messages = messages %}{% set system_message = false %}{% endif %}{% for message in loop_messages %}{% if (message['role'] == 'user') != (loop.index0 % 2 == 0) %}{{ raise_exception('Conversation roles must alternate user/assistant/user/assistant/...') }}{% endif %}{% if loop.index0 == 0 and system_message != false %}{% set content = '<<SYS>>\\n' + system_message + '\\n<</SYS>>\\n\\n' + message['content'] %}{% else %}{% set content = message['content'] %}{% endif %}{% if message['role'] == 'user' %}{{ bos_token + '[INST] ' + content | trim + ' [/INST]' }}{% elif message['role'] == 'assistant' %}{{ ' '  + content | trim + ' ' + eos_token }}{% endif %}{% endfor %}"
-            assert tokenizer.eos_token_id is not None, (
-                tokenizer.eos_token_id,
-                tokenizer.eos_token,
+        with self.accelerator.main_process_first():
+            cache = TokenizationCache(
+                self.args.get("tokenization_cache_dir"),
+                self.agent.tokenizer,
+                self.args["max_input_length"],
+            )
+            tokenized_dataset = DatasetDict(
+                {"train": cache.tokenize(self.raw_dataset["train"], num_proc=8)}
+            )
+            self.accelerator.print(
+                f"[Tokenization cache] {cache.n_cached} items cached, "
+                f"{cache.n_tokenized} tokenized ({cache.path})"
             )
-            new_batch = defaultdict(list)
-            all_keys = list(batch.keys())
-            for item_values in zip(*(batch[k] for k in all_keys)):
-                item = {k: item_values[i] for i, k in enumerate(all_keys)}
-                item_id, conversations = (item["item_id"], item["conversations"])
-
-                input_ids = []
-                labels = []
-                for message in conversations:
-                    if message["from"] == "human":
-                        text = f"<s>[INST] {message['value']} [/INST]"
-                        input_encode = tokenizer.encode(text, add_special_tokens=False)
-                        input_ids.extend(input_encode)
-                        labels.extend([-100] * len(input_encode))
-                    else:
-                        # message["from"] == "gpt":
-                        text = f" {message['value']}"
-                        input_encode = tokenizer.encode(text, add_special_tokens=False)
-                        input_encode += [tokenizer.eos_token_id]
-                        input_ids.extend(input_encode)
-                        labels.extend(input_encode)
-
-                attention_mask = [1] * len(input_ids)
-
-                # Truncation
-                input_ids_max_length = len(input_ids)
-                # assert input_ids_max_length <= args['max_input_length'], input_ids_max_length
-                input_ids = input_ids[: args["max_input_length"]]
-                labels = labels[: args["max_input_length"]]
-                attention_mask = attention_mask[: args["max_input_length"]]
-
-                ##
-                new_batch["input_ids"].append(input_ids)
-                new_batch["labels"].append(labels)
-                new_batch["attention_mask"].append(attention_mask)
-                ##
-                new_batch["item_id"].append(item_id)
-                new_batch["input_ids_max_length"].append(input_ids_max_length)
-
-            return new_batch
-
-        tokenized_dataset = DatasetDict(
-            {
-                "train": self.raw_dataset["train"].map(
-                    tokenize_fn,
-                    fn_kwargs={
-                        "args": self.args,
-                        "tokenizer": self.agent.tokenizer,
-                    },
-                    batched=True,
-                    remove_columns=self.raw_dataset["train"].column_names,
-                    num_proc=8,
-                    load_from_cache_file=False,
-                )
-            }
-        )
         self.accelerator.print("Processed data:", tokenized_dataset)
         for mode, dataset in tokenized_dataset.items():
             self.accelerator.print(
@@ -185,17 +160,67 @@ class AgentEvolTrainer(BaseTrainer):
                 "attention_mask": torch.BoolTensor(attention_mask),
                 "labels": torch.LongTensor(labels),
             }
-            return {"forward_kwargs": forward_kwargs}
+            num_tokens = sum(len(item["input_ids"]) for item in batch)
+            return {"forward_kwargs": forward_kwargs, "num_tokens": num_tokens}
 
         self.train_dataset = tokenized_dataset["train"]
-        self.train_dataloader = DataLoader(
-            tokenized_dataset["train"],
-            shuffle=True,
-            batch_size=self.args["batch_size"],
-            num_workers=self.args["num_workers"],
-            pin_memory=True,
-            collate_fn=partial(collate_fn, tokenizer=self.agent.tokenizer),
-        )
+        train_dataset = self.train_dataset
+        train_collate_fn = partial(collate_fn, tokenizer=self.agent.tokenizer)
+        if self.args.get("packing", False):
+            # several conversations per row of max_input_length tokens
+            varlen = uses_varlen_attention(self.agent.model)
+            train_dataset = PackedDataset(
+                self.train_dataset, self.args["max_input_length"]
+            )
+            train_collate_fn = partial(
+                packed_collate_fn, tokenizer=self.agent.tokenizer, varlen=varlen
+            )
+            self.accelerator.print(
+                f"Packed {len(self.train_dataset)} conversations into {len(train_dataset)} rows "
+                f"({'varlen' if varlen else 'block-diagonal'} attention): "
+                f"packing efficiency {train_dataset.efficiency:.1%}, "
+                f"padded batches {padding_efficiency(train_dataset.lengths, self.args['batch_size']):.1%}"
+            )
+        self.train_batch_sampler = None
+        if self.args.get("max_tokens_per_batch"):
+            # batches of similar lengths filled up to a token budget, instead of batch_size samples
+            if isinstance(train_dataset, PackedDataset):
+                lengths = train_dataset.row_lengths
+            else:
+                lengths = [
+                    min(length, self.args["max_input_length"])
+                    for length in self.train_dataset["input_ids_max_length"]
+                ]
+            self.train_batch_sampler = TokenBudgetBatchSampler(
+                lengths, self.args["max_tokens_per_batch"], seed=self.args["seed"]
+            )
+            # tokens of the loss, which the model shifts by one
+            label_tokens = sum(
+                max(len(labels) - 1 - labels[1:].count(-100), 0)
+                for labels in self.train_dataset["labels"]
+            )
+            self.mean_batch_label_tokens = label_tokens / len(self.train_batch_sampler)
+            self.accelerator.print(
+                f"Token budget of {self.args['max_tokens_per_batch']}: "
+                f"{len(train_dataset) / len(self.train_batch_sampler):.1f} samples per batch, "
+                f"padding efficiency {self.train_batch_sampler.efficiency:.1%}"
+            )
+            self.train_dataloader = DataLoader(
+                train_dataset,
+                batch_sampler=self.train_batch_sampler,
+                num_workers=self.args["num_workers"],
+                pin_memory=True,
+                collate_fn=train_collate_fn,
+            )
+        else:
+            self.train_dataloader = DataLoader(
+                train_dataset,
+                shuffle=True,
+                batch_size=self.args["batch_size"],
+                num_workers=self.args["num_workers"],
+                pin_memory=True,
+                collate_fn=train_collate_fn,
+            )
         self.accelerator.print("Number of train batches:", len(self.train_dataloader))
 
     def get_inference_test_dataloader(self):
@@ -328,6 +353,9 @@ class AgentEvolTrainer(BaseTrainer):
         logging_step_freq = self.args.get("logging_step_freq", None)
         self.agent.model.train()
         epoch_result_dict = defaultdict(list)
+        if self.train_batch_sampler is not None:
+            self.train_batch_sampler.set_epoch(epoch)
+        step_tokens, step_start = 0, time.perf_counter()
         with tqdm(
             enumerate(self.train_dataloader),
             total=len(self.train_dataloader),
@@ -335,13 +363,26 @@ class AgentEvolTrainer(BaseTrainer):
             desc=f"Train Loop | Epoch {epoch}",
         ) as t:
             for idx, batch in t:
+                step_tokens += batch["num_tokens"]
                 with self.accelerator.accumulate(self.agent.model):
-                    output = self.agent.model(**batch["forward_kwargs"])
+                    forward_kwargs = batch["forward_kwargs"]
+                    if "segment_ids" in batch:
+                        forward_kwargs["attention_mask"] = block_diagonal_mask(
+                            batch["segment_ids"],
+                            self.accelerator.unwrap_model(self.agent.model).dtype,
+                        )
+                    output = self.agent.model(**forward_kwargs)
                     # Get some metrics
                     loss = output[0]
                     result_dict, extra = {}, None
                     # Update
-                    self.accelerator.backward(loss)
+                    train_loss = loss
+                    if self.train_batch_sampler is not None:
+                        # batches hold varying numbers of tokens: weight their mean losses
+                        # so that every token counts the same across batches
+                        n_label_tokens = (forward_kwargs["labels"][..., 1:] != -100).sum()
+                        train_loss = loss * n_label_tokens / self.mean_batch_label_tokens
+                    self.accelerator.backward(train_loss)
                     if self.accelerator.sync_gradients:
                         if clip_grad_norm is not None:
                             self.accelerator.clip_grad_norm_(self.agent.model.parameters(), clip_grad_norm)
@@ -352,6 +393,14 @@ class AgentEvolTrainer(BaseTrainer):
 
                 if self.accelerator.sync_gradients:
                     global_step += 1
+                    # Token throughput of the step, over all processes
+                    step_tokens = self.accelerator.reduce(
+                        torch.tensor(step_tokens, device=self.accelerator.device), "sum"
+                    ).item()
+                    step_end = time.perf_counter()
+                    result_dict["tokens"] = step_tokens
+                    result_dict["tokens_per_s"] = step_tokens / (step_end - step_start)
+                    step_tokens, step_start = 0, step_end
                     # Step update metric
                     epoch_result_dict["loss"].append(loss.item())
                     for k, v in result_dict.items():
@@ -456,6 +505,7 @@ class AgentEvolTrainer(BaseTrainer):
         self.agent.model.eval()
         all_rewards = []
         all_success = []
+        all_failed = []
         if dataloader is None:
             dataloader = self.test_dataloader
 
@@ -489,13 +539,23 @@ class AgentEvolTrainer(BaseTrainer):
                 cur_batch_success = torch.FloatTensor(
                     [1 if exp.reward == 1 else 0 for exp in exps.experiences]
                 ).to(self.accelerator.device)
+                cur_batch_failed = torch.FloatTensor(
+                    [exp.failed for exp in exps.experiences]
+                ).to(self.accelerator.device)
                 all_device_batch_rewards = self.accelerator.gather(cur_batch_rewards)
                 all_device_batch_success = self.accelerator.gather(cur_batch_success)
+                all_device_batch_failed = self.accelerator.gather(cur_batch_failed)
                 all_rewards.extend(all_device_batch_rewards.cpu().numpy().tolist())
                 all_success.extend(all_device_batch_success.cpu().numpy().tolist())
+                all_failed.extend(all_device_batch_failed.cpu().numpy().tolist())
         # fix for duplicated data
         all_rewards = all_rewards[: len(dataloader.dataset)]
         all_success = all_success[: len(dataloader.dataset)]
+        all_failed = all_failed[: len(dataloader.dataset)]
+        # episodes that raised are reported, not scored
+        n_failed = int(sum(all_failed))
+        all_rewards = [r for r, failed in zip(all_rewards, all_failed) if not failed]
+        all_success = [s for s, failed in zip(all_success, all_failed) if not failed]
 
         if self.accelerator.is_main_process and self.accelerator.is_local_main_process:
             mean_reward = torch.FloatTensor([np.mean(all_rewards)]).to(self.accelerator.device)
@@ -509,17 +569,26 @@ class AgentEvolTrainer(BaseTrainer):
         self.accelerator.print("\n\n==== Test Evaluation ====\n")
         self.accelerator.print(f"Score: {mean_reward:.5f}")
         self.accelerator.print(f"Success: {mean_success:.5f}")
+        self.accelerator.print(f"Failed: {n_failed}")
 
-        return {"score": mean_reward, "success": mean_success}
+        return {"score": mean_reward, "success": mean_success, "failed": n_failed}
 
     def inference_and_filter(self, dataloader, iter):
         self.agent.model.eval()
         all_rewards = []
         all_success = []
+        all_failed = []
+        all_data_idxs = []
 
         iter_data_file_path = os.path.join(self.args["iter_data_path"], f"webshop_iter_{iter + 1}.jsonl")
+        inference_file_path = os.path.join(
+            self.args["model_save_path"], f"inference_iter_{iter + 1}.jsonl"
+        )
+        shard_writer = TrajectoryShardWriter(
+            inference_file_path, self.accelerator.process_index
+        )
 
-        for _, batch in tqdm(
+        for step, batch in tqdm(
             enumerate(dataloader),
             total=len(dataloader),
             disable=not self.accelerator.is_main_process,
@@ -550,48 +619,66 @@ class AgentEvolTrainer(BaseTrainer):
                 cur_batch_success = torch.FloatTensor(
                     [1 if exp.reward == 1 else 0 for exp in exps.experiences]
                 ).to(self.accelerator.device)
+                cur_batch_failed = torch.FloatTensor(
+                    [exp.failed for exp in exps.experiences]
+                ).to(self.accelerator.device)
                 cur_batch_data_idx = torch.tensor(data_idxs).to(self.accelerator.device)
 
-                # gather operation
+                # gather the scalars only, each rank writes its own trajectories
                 all_device_batch_rewards = self.accelerator.gather(cur_batch_rewards)
                 all_device_batch_success = self.accelerator.gather(cur_batch_success)
-                all_device_batch_exp = gather_object(exps.experiences)
+                all_device_batch_failed = self.accelerator.gather(cur_batch_failed)
                 all_device_data_idx = self.accelerator.gather(cur_batch_data_idx)
                 all_rewards.extend(all_device_batch_rewards.cpu().numpy().tolist())
                 all_success.extend(all_device_batch_success.cpu().numpy().tolist())
-
-                # write inference results to file
-                if self.accelerator.is_main_process:
-                    inference_file_path = os.path.join(
-                        self.args["model_save_path"], f"inference_iter_{iter + 1}.jsonl"
-                    )
-                    with jsonlines.open(inference_file_path, mode="a") as f:
-                        for idx, exp in enumerate(all_device_batch_exp):
-                            cur_idx = all_device_data_idx[idx]
-                            conversation = exp.conversation
-                            cur_reward = exp.reward
-                            cur_success = 1 if exp.reward == 1 else 0
-                            item_id = f"{self.args['task_name']}_{cur_idx}"
-                            f.write(
-                                {
-                                    "conversations": conversation,
-                                    "item_id": item_id,
-                                    "reward": cur_reward,
-                                    "success": cur_success,
-                                }
-                            )
-                    # filter data with high reward
-                    with jsonlines.open(iter_data_file_path, mode="a") as f:
-                        for idx, exp in enumerate(all_device_batch_exp):
-                            if exp.reward > 0.99:
-                                cur_idx = all_device_data_idx[idx]
-                                conversation = exp.conversation
-                                item_id = f"webshop_{cur_idx}"
-                                f.write({"conversations": conversation, "item_id": item_id})
+                all_failed.extend(all_device_batch_failed.cpu().numpy().tolist())
+                all_data_idxs.extend(all_device_data_idx.cpu().numpy().tolist())
+
+                shard_writer.write(
+                    step,
+                    [
+                        {
+                            "conversations": exp.conversation,
+                            "item_id": f"{self.args['task_name']}_{cur_idx}",
+                            "reward": exp.reward,
+                            "success": 1 if exp.reward == 1 else 0,
+                        }
+                        for cur_idx, exp in zip(data_idxs, exps.experiences)
+                        if not exp.failed
+                    ],
+                )
 
         # fix for duplicated data
-        all_rewards = all_rewards[: len(dataloader.dataset)]
-        all_success = all_success[: len(dataloader.dataset)]
+        keep = first_occurrences(all_data_idxs)
+        all_rewards = [all_rewards[i] for i in keep]
+        all_success = [all_success[i] for i in keep]
+        all_failed = [all_failed[i] for i in keep]
+        # episodes that raised are reported, not scored or written
+        n_failed = int(sum(all_failed))
+        all_rewards = [r for r, failed in zip(all_rewards, all_failed) if not failed]
+        all_success = [s for s, failed in zip(all_success, all_failed) if not failed]
+
+        # merge the shards of all ranks into the inference file, and filter data with high reward
+        shard_writer.close()
+        self.accelerator.wait_for_everyone()
+        if self.accelerator.is_main_process:
+            with jsonlines.open(inference_file_path, mode="a") as f, jsonlines.open(
+                iter_data_file_path, mode="a"
+            ) as g:
+                for record in read_trajectory_shards(
+                    inference_file_path, self.accelerator.num_processes
+                ):
+                    f.write(record)
+                    if record["reward"] > 0.99:
+                        # the iter data keeps its historical `webshop_<idx>` ids, like its file name
+                        data_idx = record["item_id"].split("_")[-1]
+                        g.write(
+                            {
+                                "conversations": record["conversations"],
+                                "item_id": f"webshop_{data_idx}",
+                            }
+                        )
+        self.accelerator.wait_for_everyone()
 
         if self.accelerator.is_main_process and self.accelerator.is_local_main_process:
             mean_reward = torch.FloatTensor([np.mean(all_rewards)]).to(self.accelerator.device)
@@ -605,6 +692,7 @@ class AgentEvolTrainer(BaseTrainer):
         self.accelerator.print("\n\n==== Inference Evaluation ====\n")
         self.accelerator.print(f"Score: {mean_reward:.5f}")
         self.accelerator.print(f"Success: {mean_success:.5f}")
+        self.accelerator.print(f"Failed: {n_failed}")
 
         # add original data
         if self.accelerator.is_main_process and self.accelerator.is_local_main_process:
@@ -614,10 +702,159 @@ class AgentEvolTrainer(BaseTrainer):
                     conversations = data_item["conversations"]
                     f.write({"conversations": conversations, "item_id": item_id})
 
-        return {"score": mean_reward, "success": mean_success}
+        return {"score": mean_reward, "success": mean_success, "failed": n_failed}
+
+    def start_rollouts(self) -> Future | None:
+        """
+        Publish the current weights to the rollout workers and queue the whole inference set on them.
+        Called on all ranks, since gathering the weights may need them all; the workers and the
+        collection of their trajectories, in a background thread, run on the main process.
+        """
+        weights_path = os.path.join(
+            self.args["model_save_path"],
+            "rollout_weights",
+            f"v{self.rollout_weights_version}",
+        )
+        self.rollout_weights_version += 1
+        # the other ranks wait for this file in `finish_rollouts`, so a stale one must not be left
+        if self.accelerator.is_main_process and os.path.exists(self.next_iter_file_path()):
+            os.remove(self.next_iter_file_path())
+        self.save_model(self.agent.model, self.agent.tokenizer, weights_path)
+        self.accelerator.wait_for_everyone()
+        if not self.accelerator.is_main_process:
+            return None
+
+        if self.rollout_pool is None:
+            self.rollout_pool = RolloutWorkerPool(
+                self.agent,
+                self.tasks,
+                GenerationConfig(
+                    max_length=4096,
+                    do_sample=True,
+                    temperature=1.2,
+                    eos_token_id=self.agent.tokenizer.eos_token_id,
+                    pad_token_id=(
+                        self.agent.tokenizer.pad_token_id
+                        if self.agent.tokenizer.pad_token_id is not None
+                        else self.agent.tokenizer.unk_token_id
+                    ),
+                ),
+                max_rounds=self.args["max_round"],
+                n_workers=self.args["rollout_workers"],
+                devices=self.args["rollout_devices"],
+                seed=self.args["seed"],
+            )
+        data_idxs = [
+            int(item_id.split("_")[-1]) for item_id in self.raw_dataset["inference"]["item_id"]
+        ]
+        self.rollout_pool.submit(data_idxs, weights_path)
+        executor = ThreadPoolExecutor(1)
+        rollouts = executor.submit(self.collect_rollouts)
+        executor.shutdown(wait=False)
+        return rollouts
+
+    def collect_rollouts(self) -> dict:
+        """
+        Stream the trajectories of the rollout workers to the inference file, and those above the
+        reward threshold to the next iteration's data, as they arrive.
+        """
+        iter_num = self.args["iter_num"]
+        inference_file_path = os.path.join(
+            self.args["model_save_path"], f"inference_iter_{iter_num + 1}.jsonl"
+        )
+        iter_data_file_path = os.path.join(
+            self.args["iter_data_path"], f"{self.args['task_name']}_iter_{iter_num + 1}.jsonl"
+        )
+        os.makedirs(self.args["iter_data_path"], exist_ok=True)
+        rewards = []
+        n_accepted = 0
+        n_failed = 0
+        start = time.perf_counter()
+        with jsonlines.open(inference_file_path, mode="w", flush=True) as inference_f, jsonlines.open(
+            iter_data_file_path, mode="w", flush=True
+        ) as iter_data_f:
+            for record in self.rollout_pool.results():
+                if record["failed"]:
+                    n_failed += 1
+                    continue
+                item_id = f"{self.args['task_name']}_{record['data_idx']}"
+                inference_f.write(
+                    {
+                        "conversations": record["conversation"],
+                        "item_id": item_id,
+                        "reward": record["reward"],
+                        "success": 1 if record["reward"] == 1 else 0,
+                    }
+                )
+                if record["reward"] > self.args["rollout_reward_threshold"]:
+                    iter_data_f.write({"conversations": record["conversation"], "item_id": item_id})
+                    n_accepted += 1
+                rewards.append(record["reward"])
+        return {
+            "score": float(np.mean(rewards)),
+            "success": float(np.mean([reward == 1 for reward in rewards])),
+            "accepted": n_accepted,
+            "failed": n_failed,
+            "episodes_per_s": (len(rewards) + n_failed) / (time.perf_counter() - start),
+            "iter_data_file_path": iter_data_file_path,
+        }
+
+    def next_iter_file_path(self) -> str:
+        return os.path.join(
+            self.args["iter_data_path"], f"train_iter_{self.args['iter_num'] + 1}.json"
+        )
+
+    def finish_rollouts(self, rollouts: Future | None) -> None:
+        """
+        Wait for the rollouts, then write the next iteration's train file: the accepted
+        trajectories followed by the current train data.
+        The other ranks poll for that file instead of waiting in a collective, which would hit the
+        process group timeout when the exploration takes longer. `iter_data_path` must be visible
+        to all ranks, as it already is for the next iteration.
+        """
+        next_iter_file = self.next_iter_file_path()
+        if self.accelerator.is_main_process:
+            result = rollouts.result()
+            with jsonlines.open(result["iter_data_file_path"]) as f:
+                next_iter_data = list(f)
+            next_iter_data += json.load(open(self.args["train_file"], "r"))
+            # written under another name first, so that the file appears complete
+            with open(f"{next_iter_file}.tmp", "w", encoding="utf-8") as f:
+                json.dump(next_iter_data, f, ensure_ascii=False, indent=4)
+            os.replace(f"{next_iter_file}.tmp", next_iter_file)
+
+            self.accelerator.print("\n\n==== Rollout Workers ====\n")
+            self.accelerator.print(f"Score: {result['score']:.5f}")
+            self.accelerator.print(f"Success: {result['success']:.5f}")
+            self.accelerator.print(f"Failed: {result['failed']}")
+            self.accelerator.print(
+                f"Accepted: {result['accepted']}, written with the train data to {next_iter_file}"
+            )
+            self.accelerator.print(
+                f"Episodes/s: {result['episodes_per_s']:.3f}, per worker episodes "
+                f"{self.rollout_pool.worker_episodes}, busy time "
+                f"{[round(t, 1) for t in self.rollout_pool.worker_busy_time]} s"
+            )
+            self.rollout_pool.close()
+            self.rollout_pool = None
+        else:
+            while not os.path.exists(next_iter_file):
+                time.sleep(self.rollout_poll_interval)
+        self.accelerator.wait_for_everyone()
 
     def evol(self):
         self.accelerator.print(f"[Iter {self.args['iter_num']+1}]")
 
+        rollouts = None
+        use_rollout_workers = self.args.get("rollout_workers", 0) > 0
+        if use_rollout_workers and self.args.get("rollout_overlap", False):
+            # explore with the weights this iteration starts from, while training
+            rollouts = self.start_rollouts()
+
         self.accelerator.print("[Agent Evol Trainer] Start training.")
         self.train()
+
+        if use_rollout_workers:
+            if not self.args.get("rollout_overlap", False):
+                rollouts = self.start_rollouts()
+            self.finish_rollouts(rollouts)
@@ -1,5 +1,6 @@
 import json
 import os
+import time
 from dataclasses import asdict
 from datetime import timedelta
 from functools import partial
@@ -8,12 +9,18 @@ from typing import Sequence
 import jsonlines
 import numpy as np
 import torch
+import torch.distributed as dist
 from accelerate import Accelerator, InitProcessGroupKwargs
-from accelerate.utils import broadcast, gather_object
+from accelerate.utils import DistributedType, broadcast, gather_object
 from agentenv.controller import Agent
 from agentenv.controller.agent import Agent
 from agentenv.controller.task import BaseTask, GenerationConfig
 from agentenv.controller.utils import BaseTrainer
+from agentenv.trainer.trajectory_shards import (
+    TrajectoryShardWriter,
+    first_occurrences,
+    read_trajectory_shards,
+)
 from agentenv.trainer.utils import set_seed
 from datasets import Dataset, DatasetDict
 from torch.utils.data import DataLoader
@@ -32,6 +39,8 @@ class DistributedEvaluator(BaseTrainer):
 
         # accelerator
         self.accelerator = None
+        self.work_queue_round = 0
+        self.work_queue_store = None
 
         self.create_accelerator()
         self.set_seed()
@@ -93,26 +102,119 @@ class DistributedEvaluator(BaseTrainer):
                 "Number of inference batches:", len(self.inference_dataloader)
             )
 
+    def shards_parameters(self) -> bool:
+        """
+        Whether the model's parameters are sharded across the ranks (FSDP, Megatron-LM or DeepSpeed
+        ZeRO-3), so that its forward and generate run collectives every rank has to join.
+        """
+        distributed_type = self.accelerator.distributed_type
+        if distributed_type in (DistributedType.FSDP, DistributedType.MEGATRON_LM):
+            return True
+        if distributed_type == DistributedType.DEEPSPEED:
+            return self.accelerator.state.deepspeed_plugin.zero_stage == 3
+        return False
+
+    def connect_work_queue_store(self) -> bool:
+        """
+        Connect to the `TCPStore` holding the work queue counters, served by the main process on
+        `MASTER_PORT + 1`. Returns whether every rank is connected, so that they all use the queue
+        or all fall back to static shards.
+        """
+        if self.work_queue_store is None:
+            try:
+                self.work_queue_store = dist.TCPStore(
+                    os.environ["MASTER_ADDR"],
+                    int(os.environ["MASTER_PORT"]) + 1,
+                    self.accelerator.num_processes,
+                    is_master=self.accelerator.is_main_process,
+                    timeout=timedelta(seconds=60),
+                    wait_for_workers=False,
+                )
+            except (KeyError, ValueError, RuntimeError) as e:
+                # torch's errors carry a C++ stack trace after the message
+                reason = str(e).splitlines()[0] if str(e) else repr(e)
+                print(
+                    f"[Rank {self.accelerator.process_index}] work_queue store is unavailable: {reason}"
+                )
+        return all(gather_object([self.work_queue_store is not None]))
+
+    def work_queue_batches(self, dataset):
+        """
+        Batches of `dataset` claimed from a counter shared by the ranks (in `work_queue_store`),
+        instead of a static shard per rank: a rank done with a batch claims the next one, so
+        ranks that get short episodes run more batches and no rank waits for the others.
+        Yields `(start, batch)`, with `start` the position of the batch in `dataset`.
+        """
+        batch_size = self.args["eval_batch_size"]
+        self.work_queue_round += 1
+        key = f"distributed_evaluator/next_start_{self.work_queue_round}"
+        store = self.work_queue_store if self.accelerator.num_processes > 1 else None
+        next_start = 0
+        while True:
+            if store is None:
+                start, next_start = next_start, next_start + batch_size
+            else:
+                start = store.add(key, batch_size) - batch_size
+            if start >= len(dataset):
+                return
+            item_ids = dataset[start : start + batch_size]["item_id"]
+            yield start, {"data_idxs": [int(item_id.split("_")[-1]) for item_id in item_ids]}
+
     def generate(self, dataloader=None):
+        work_queue = self.args.get("work_queue", False)
+        if work_queue and self.shards_parameters():
+            # ranks run different numbers of batches, and one done early would leave the others
+            # waiting in the collectives of the sharded model
+            self.accelerator.print(
+                "work_queue is not supported with sharded parameters, using static shards"
+            )
+            work_queue = False
+        if (
+            work_queue
+            and self.accelerator.num_processes > 1
+            and not self.connect_work_queue_store()
+        ):
+            self.accelerator.print("work_queue store is unavailable, using static shards")
+            work_queue = False
         self.optimizer = AdamW(self.agent.model.parameters())
-        self.agent.model, self.optimizer, self.inference_dataloader = (
-            self.accelerator.prepare(
-                self.agent.model, self.optimizer, self.inference_dataloader
+        if work_queue and dataloader is None:
+            # batches are claimed from `self.inference_dataloader.dataset`, not sharded by the loader
+            self.agent.model, self.optimizer = self.accelerator.prepare(
+                self.agent.model, self.optimizer
+            )
+        else:
+            self.agent.model, self.optimizer, self.inference_dataloader = (
+                self.accelerator.prepare(
+                    self.agent.model, self.optimizer, self.inference_dataloader
+                )
             )
-        )
         self.agent.model.eval()
         all_rewards = []
         all_success = []
+        all_failed = []
+        all_data_idxs = []
         if dataloader is None:
             dataloader = self.inference_dataloader
+        shard_writer = TrajectoryShardWriter(
+            self.args["output_file"], self.accelerator.process_index
+        )
+        if work_queue:
+            batches = self.work_queue_batches(dataloader.dataset)
+            total = None
+        else:
+            batches = enumerate(dataloader)
+            total = len(dataloader)
+        busy_time = 0.0
+        n_batches = 0
 
-        for _, batch in tqdm(
-            enumerate(dataloader),
-            total=len(dataloader),
+        for step, batch in tqdm(
+            batches,
+            total=total,
             disable=not self.accelerator.is_main_process,
             desc="Inference Gen Loop",
         ):
             data_idxs = batch["data_idxs"]
+            start = time.perf_counter()
             with torch.no_grad():
                 exps = self.eval(
                     generation_config=GenerationConfig(
@@ -129,44 +231,58 @@ class DistributedEvaluator(BaseTrainer):
                     max_rounds=self.args["max_round"],
                     idxs=data_idxs,
                 )
+            busy_time += time.perf_counter() - start
+            n_batches += 1
+
+            all_rewards.extend(exp.reward for exp in exps.experiences)
+            all_success.extend(1 if exp.reward == 1 else 0 for exp in exps.experiences)
+            all_failed.extend(exp.failed for exp in exps.experiences)
+            all_data_idxs.extend(data_idxs)
+            shard_writer.write(
+                step,
+                [
+                    {
+                        "conversations": exp.conversation,
+                        "item_id": f"{self.args['task_name']}_{cur_idx}",
+                        "reward": exp.reward,
+                        "success": 1 if exp.reward == 1 else 0,
+                    }
+                    for cur_idx, exp in zip(data_idxs, exps.experiences)
+                    if not exp.failed
+                ],
+            )
 
-                cur_batch_rewards = torch.FloatTensor(
-                    [exp.reward for exp in exps.experiences]
-                ).to(self.accelerator.device)
-                cur_batch_success = torch.FloatTensor(
-                    [1 if exp.reward == 1 else 0 for exp in exps.experiences]
-                ).to(self.accelerator.device)
-                cur_batch_data_idx = torch.tensor(data_idxs).to(self.accelerator.device)
-                
-                # gather operation
-                all_device_batch_rewards = self.accelerator.gather(cur_batch_rewards)
-                all_device_batch_success = self.accelerator.gather(cur_batch_success)
-                all_device_batch_exp = gather_object(exps.experiences)
-                all_device_data_idx = self.accelerator.gather(cur_batch_data_idx)
-                all_rewards.extend(all_device_batch_rewards.cpu().numpy().tolist())
-                all_success.extend(all_device_batch_success.cpu().numpy().tolist())
-                
-                # write inference results to file
-                if self.accelerator.is_main_process:
-                    with jsonlines.open(self.args["output_file"], mode="a") as f:
-                        for idx, exp in enumerate(all_device_batch_exp):
-                            cur_idx = all_device_data_idx[idx]
-                            conversation = exp.conversation
-                            cur_reward = exp.reward
-                            cur_success = 1 if exp.reward == 1 else 0
-                            item_id = f"{self.args['task_name']}_{cur_idx}"
-                            f.write(
-                                {
-                                    "conversations": conversation,
-                                    "item_id": item_id,
-                                    "reward": cur_reward,
-                                    "success": cur_success,
-                                }
-                            )
+        # gather the scalars only, each rank writes its own trajectories;
+        # ranks may run different numbers of batches, so they are gathered once at the end
+        all_results = gather_object(
+            [list(zip(all_data_idxs, all_rewards, all_success, all_failed))]
+        )
+        all_data_idxs = [idx for results in all_results for idx, _, _, _ in results]
+        all_rewards = [reward for results in all_results for _, reward, _, _ in results]
+        all_success = [success for results in all_results for _, _, success, _ in results]
+        all_failed = [failed for results in all_results for _, _, _, failed in results]
+        rank_stats = gather_object([(busy_time, n_batches)])
 
         # fix for duplicated data
-        all_rewards = all_rewards[: len(dataloader.dataset)]
-        all_success = all_success[: len(dataloader.dataset)]
+        keep = first_occurrences(all_data_idxs)
+        all_rewards = [all_rewards[i] for i in keep]
+        all_success = [all_success[i] for i in keep]
+        all_failed = [all_failed[i] for i in keep]
+        # episodes that raised are reported, not scored or written
+        n_failed = int(sum(all_failed))
+        all_rewards = [r for r, failed in zip(all_rewards, all_failed) if not failed]
+        all_success = [s for s, failed in zip(all_success, all_failed) if not failed]
+
+        # merge the shards of all ranks into the output file
+        shard_writer.close()
+        self.accelerator.wait_for_everyone()
+        if self.accelerator.is_main_process:
+            with jsonlines.open(self.args["output_file"], mode="a") as f:
+                for record in read_trajectory_shards(
+                    self.args["output_file"], self.accelerator.num_processes
+                ):
+                    f.write(record)
+        self.accelerator.wait_for_everyone()
 
         if self.accelerator.is_main_process and self.accelerator.is_local_main_process:
             mean_reward = torch.FloatTensor([np.mean(all_rewards)]).to(
@@ -184,4 +300,12 @@ class DistributedEvaluator(BaseTrainer):
         self.accelerator.print("\n\n==== Inference Evaluation ====\n")
         self.accelerator.print(f"Score: {mean_reward:.5f}")
         self.accelerator.print(f"Success: {mean_success:.5f}")
-
+        self.accelerator.print(f"Failed: {n_failed}")
+        for rank, (rank_busy_time, rank_batches) in enumerate(rank_stats):
+            self.accelerator.print(
+                f"[Rank {rank}] busy {rank_busy_time:.1f}s over {rank_batches} batches"
+            )
+        busy_times = [rank_busy_time for rank_busy_time, _ in rank_stats]
+        self.accelerator.print(
+            f"Busy time imbalance (max / mean): {max(busy_times) / max(np.mean(busy_times), 1e-9):.3f}"
+        )
@@ -0,0 +1,140 @@
+import bisect
+import random
+from typing import Sequence
+
+import torch
+from torch.utils.data import Dataset
+
+
+def pack_lengths(lengths: Sequence[int], max_length: int) -> list[list[int]]:
+    """
+    Group sample indices into rows of at most `max_length` tokens (best-fit decreasing).
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    rows = []
+    free = []  # free space of the rows that still have some, sorted
+    free_rows = []  # row of each entry of `free`
+    for i in order:
+        length = min(lengths[i], max_length)
+        j = bisect.bisect_left(free, length)
+        if j == len(free):
+            rows.append([i])
+            row, space = len(rows) - 1, max_length - length
+        else:
+            row, space = free_rows.pop(j), free.pop(j) - length
+            rows[row].append(i)
+        if space > 0:
+            k = bisect.bisect_left(free, space)
+            free.insert(k, space)
+            free_rows.insert(k, row)
+    return rows
+
+
+def padding_efficiency(lengths: Sequence[int], batch_size: int, seed: int = 0) -> float:
+    """
+    Share of real tokens in shuffled batches padded to their longest sample, for comparison.
+    """
+    order = list(range(len(lengths)))
+    random.Random(seed).shuffle(order)
+    padded = sum(
+        max(lengths[i] for i in order[start : start + batch_size])
+        * len(order[start : start + batch_size])
+        for start in range(0, len(order), batch_size)
+    )
+    return sum(lengths) / max(padded, 1)
+
+
+class PackedDataset(Dataset):
+    """
+    Rows of a tokenized dataset packed by `pack_lengths`; an item is the list of samples of a row.
+    """
+
+    def __init__(self, dataset, max_length: int) -> None:
+        self.dataset = dataset
+        self.max_length = max_length
+        self.lengths = [len(input_ids) for input_ids in dataset["input_ids"]]
+        self.rows = pack_lengths(self.lengths, max_length)
+        self.num_tokens = sum(self.lengths)
+
+    @property
+    def row_lengths(self) -> list[int]:
+        return [sum(self.lengths[i] for i in row) for row in self.rows]
+
+    @property
+    def efficiency(self) -> float:
+        """Share of real tokens in the packed rows."""
+        return self.num_tokens / max(len(self.rows) * self.max_length, 1)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, idx: int) -> list[dict]:
+        return [self.dataset[i] for i in self.rows[idx]]
+
+
+def packed_collate_fn(batch, tokenizer, varlen: bool):
+    """
+    Concatenate the samples of each row, with position ids restarting at every sample and the label
+    of every sample's first token masked, so that no token is trained to predict across a boundary.
+
+    With `varlen`, all rows of the batch become one padding-free sequence and flash attention finds
+    the sample boundaries from the position ids. Otherwise rows are padded to the longest one and
+    `segment_ids` are returned, from which `block_diagonal_mask` builds the attention mask.
+    """
+    rows = []
+    for row in batch:
+        input_ids, labels, position_ids, segment_ids = [], [], [], []
+        for segment, item in enumerate(row):
+            input_ids += item["input_ids"]
+            labels += [-100] + item["labels"][1:]
+            position_ids += range(len(item["input_ids"]))
+            segment_ids += [segment] * len(item["input_ids"])
+        rows.append((input_ids, labels, position_ids, segment_ids))
+
+    if varlen:
+        forward_kwargs = {
+            "input_ids": torch.LongTensor([[t for row in rows for t in row[0]]]),
+            "labels": torch.LongTensor([[t for row in rows for t in row[1]]]),
+            "position_ids": torch.LongTensor([[t for row in rows for t in row[2]]]),
+        }
+        return {"forward_kwargs": forward_kwargs, "num_tokens": forward_kwargs["input_ids"].shape[1]}
+
+    max_length = max(len(row[0]) for row in rows)
+    input_ids, labels, position_ids, segment_ids = [], [], [], []
+    for row_input_ids, row_labels, row_position_ids, row_segment_ids in rows:
+        n_pad = max_length - len(row_input_ids)
+        input_ids.append(row_input_ids + [tokenizer.pad_token_id] * n_pad)
+        labels.append(row_labels + [-100] * n_pad)
+        position_ids.append(row_position_ids + list(range(n_pad)))
+        # padding is a segment of its own, so that no attention row is empty
+        segment_ids.append(row_segment_ids + [row_segment_ids[-1] + 1] * n_pad)
+    forward_kwargs = {
+        "input_ids": torch.LongTensor(input_ids),
+        "labels": torch.LongTensor(labels),
+        "position_ids": torch.LongTensor(position_ids),
+    }
+    return {
+        "forward_kwargs": forward_kwargs,
+        "segment_ids": torch.LongTensor(segment_ids),
+        "num_tokens": sum(len(row[0]) for row in rows),
+    }
+
+
+def block_diagonal_mask(segment_ids: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """
+    Additive causal attention mask of shape (batch, 1, length, length) in which tokens only attend
+    to earlier tokens of their own segment.
+    """
+    length = segment_ids.shape[1]
+    allowed = segment_ids[:, :, None] == segment_ids[:, None, :]
+    allowed &= torch.ones(
+        length, length, dtype=torch.bool, device=segment_ids.device
+    ).tril()
+    mask = torch.zeros(allowed.shape, dtype=dtype, device=segment_ids.device)
+    mask.masked_fill_(~allowed, torch.finfo(dtype).min)
+    return mask[:, None]
+
+
+def uses_varlen_attention(model) -> bool:
+    """Whether the model runs flash attention, which can attend within packed samples without a mask."""
+    return getattr(model.config, "_attn_implementation", "").startswith("flash_attention")
@@ -0,0 +1,65 @@
+import random
+from typing import Iterator, Sequence
+
+from torch.utils.data import Sampler
+
+
+class TokenBudgetBatchSampler(Sampler[list[int]]):
+    """
+    Batches of samples of similar length, each holding at most `max_tokens` tokens once padded to
+    its longest sample (a longer sample gets a batch of its own), instead of a fixed number of samples.
+
+    Batches are cut once from the samples sorted by length, with ties broken at random, and are
+    shuffled at every epoch (see `set_epoch`). Their order only depends on `seed` and the epoch, so all
+    processes agree on it and accelerate can shard the batches between processes; `batch_size` is
+    None to tell it that batches vary in size.
+    """
+
+    batch_size = None
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        max_tokens: int,
+        shuffle: bool = True,
+        seed: int = 0,
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+        rng = random.Random(seed)
+        order = sorted(range(len(lengths)), key=lambda i: (lengths[i], rng.random()))
+        self.batches = []
+        batch = []
+        for i in order:
+            # lengths are increasing, so the sample is the longest of its batch
+            if batch and lengths[i] * (len(batch) + 1) > max_tokens:
+                self.batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            self.batches.append(batch)
+        self.num_tokens = sum(lengths)
+        self.num_padded_tokens = sum(
+            max(lengths[i] for i in batch) * len(batch) for batch in self.batches
+        )
+
+    @property
+    def efficiency(self) -> float:
+        """Share of real tokens in the padded batches."""
+        return self.num_tokens / max(self.num_padded_tokens, 1)
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[list[int]]:
+        order = list(range(len(self.batches)))
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(order)
+        for i in order:
+            yield self.batches[i]
+
+    def __len__(self) -> int:
+        return len(self.batches)
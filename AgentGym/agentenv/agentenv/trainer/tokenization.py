@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import uuid
+from collections import defaultdict
+from glob import glob
+from typing import Optional
+
+import datasets
+import pyarrow as pa
+from datasets import Dataset, Features, Sequence, Value, concatenate_datasets
+
+# prompt format of the trainers, part of the cache fingerprint
+HUMAN_TEMPLATE = "<s>[INST] {} [/INST]"
+GPT_TEMPLATE = " {}"
+# bump when the tokenization below changes
+TOKENIZATION_VERSION = 1
+
+TOKENIZED_FEATURES = Features(
+    {
+        "input_ids": Sequence(Value("int64")),
+        "labels": Sequence(Value("int64")),
+        "attention_mask": Sequence(Value("int64")),
+        "item_id": Value("string"),
+        "input_ids_max_length": Value("int64"),
+    }
+)
+
+
+def tokenize_fn(batch, args, tokenizer):
+    """
+    Tokenize a batch of `{"item_id", "conversations"}` items for `Dataset.map(batched=True)`:
+    human turns are prompts with labels -100, gpt turns are targets ending with eos.
+    """
+    assert tokenizer.eos_token_id is not None, (
+        tokenizer.eos_token_id,
+        tokenizer.eos_token,
+    )
+    new_batch = defaultdict(list)
+    for item_id, conversations in zip(batch["item_id"], batch["conversations"]):
+        input_ids = []
+        labels = []
+        for message in conversations:
+            if message["from"] == "human":
+                text = HUMAN_TEMPLATE.format(message["value"])
+                input_encode = tokenizer.encode(text, add_special_tokens=False)
+                input_ids.extend(input_encode)
+                labels.extend([-100] * len(input_encode))
+            else:
+                # message["from"] == "gpt":
+                text = GPT_TEMPLATE.format(message["value"])
+                input_encode = tokenizer.encode(text, add_special_tokens=False)
+                input_encode += [tokenizer.eos_token_id]
+                input_ids.extend(input_encode)
+                labels.extend(input_encode)
+
+        attention_mask = [1] * len(input_ids)
+
+        # Truncation
+        input_ids_max_length = len(input_ids)
+        input_ids = input_ids[: args["max_input_length"]]
+        labels = labels[: args["max_input_length"]]
+        attention_mask = attention_mask[: args["max_input_length"]]
+
+        new_batch["input_ids"].append(input_ids)
+        new_batch["labels"].append(labels)
+        new_batch["attention_mask"].append(attention_mask)
+        new_batch["item_id"].append(item_id)
+        new_batch["input_ids_max_length"].append(input_ids_max_length)
+
+    return new_batch
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash of what the tokenizer encodes to: its vocabulary, merges, normalizers and special tokens."""
+    if getattr(tokenizer, "is_fast", False):
+        state = json.loads(tokenizer.backend_tokenizer.to_str())
+        # runtime settings, changed by calls with padding=... or truncation=...
+        state.pop("padding", None)
+        state.pop("truncation", None)
+    else:
+        state = sorted(tokenizer.get_vocab().items())
+    return hashlib.sha256(
+        json.dumps(
+            [
+                type(tokenizer).__name__,
+                state,
+                [str(t) for t in tokenizer.all_special_tokens],
+                tokenizer.eos_token_id,
+            ],
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+
+def item_key(item_id: str, conversations: list[dict]) -> str:
+    """Content address of an item: its id and the turns that are tokenized."""
+    content = [item_id, [(m["from"], m["value"]) for m in conversations]]
+    return hashlib.sha256(
+        json.dumps(content, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+class TokenizationCache:
+    """
+    Persistent cache of tokenized items, for trainers that start over and over from (mostly) the
+    same data, like successive AgentEvol iterations.
+
+    Rows are stored as Arrow files under `cache_dir/<fingerprint>/`, where the fingerprint covers the
+    tokenizer, the prompt templates and `max_input_length`, and are looked up by `item_key`. Only
+    items missing from the cache are tokenized, and written to a new file. The files are memory-mapped,
+    so the ranks of a node share the rows through the page cache. After `tokenize`, `n_cached` and
+    `n_tokenized` tell how many items were found in the cache and how many were tokenized.
+    """
+
+    def __init__(self, cache_dir: Optional[str], tokenizer, max_input_length: int) -> None:
+        if cache_dir is None:
+            cache_dir = os.path.join(str(datasets.config.HF_DATASETS_CACHE), "agentenv_tokenized")
+        self.tokenizer = tokenizer
+        self.max_input_length = max_input_length
+        self.fingerprint = hashlib.sha256(
+            json.dumps(
+                [
+                    TOKENIZATION_VERSION,
+                    tokenizer_fingerprint(tokenizer),
+                    HUMAN_TEMPLATE,
+                    GPT_TEMPLATE,
+                    max_input_length,
+                ]
+            ).encode()
+        ).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, self.fingerprint)
+
+    def _load(self) -> Optional[Dataset]:
+        shards = sorted(glob(os.path.join(self.path, "*.arrow")))
+        if not shards:
+            return None
+        return concatenate_datasets([Dataset.from_file(shard) for shard in shards])
+
+    def _write(self, table: pa.Table) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        name = uuid.uuid4().hex
+        tmp_path = os.path.join(self.path, f".{name}.tmp")
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        # readers only glob complete files
+        os.replace(tmp_path, os.path.join(self.path, f"{name}.arrow"))
+
+    def tokenize(self, raw_dataset: Dataset, num_proc: int = 8) -> Dataset:
+        """
+        The tokenized rows of `raw_dataset`, in its order, with the columns of `tokenize_fn`.
+        """
+        keys = [
+            item_key(item_id, conversations)
+            for item_id, conversations in zip(
+                raw_dataset["item_id"], raw_dataset["conversations"]
+            )
+        ]
+        cached = self._load()
+        index = {} if cached is None else {k: i for i, k in enumerate(cached["key"])}
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in index and key not in missing:
+                missing[key] = i
+        n_cached = len(keys) - len(missing)
+        if missing:
+            tokenized = raw_dataset.select(list(missing.values())).map(
+                tokenize_fn,
+                fn_kwargs={
+                    "args": {"max_input_length": self.max_input_length},
+                    "tokenizer": self.tokenizer,
+                },
+                batched=True,
+                remove_columns=raw_dataset.column_names,
+                features=TOKENIZED_FEATURES,
+                num_proc=min(num_proc, len(missing)),
+                load_from_cache_file=False,
+            )
+            self._write(tokenized.data.table.append_column("key", pa.array(list(missing))))
+            cached = self._load()
+            index = {k: i for i, k in enumerate(cached["key"])}
+        self.n_cached, self.n_tokenized = n_cached, len(missing)
+        return cached.select([index[key] for key in keys]).remove_columns("key")
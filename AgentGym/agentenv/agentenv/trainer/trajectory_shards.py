@@ -0,0 +1,109 @@
+import heapq
+import os
+import queue
+import threading
+from typing import Any, Hashable, Iterator, Optional, Sequence
+
+import jsonlines
+
+
+def shard_path(output_path: str, process_index: int) -> str:
+    return f"{output_path}.rank{process_index}.shard"
+
+
+class TrajectoryShardWriter:
+    """
+    Per-rank shard of the trajectories written to `output_path`, so that ranks do not send their
+    conversations to the main process: each rank writes its records to
+    `<output_path>.rank<process_index>.shard` from a background thread, and the main process merges
+    the shards with `read_trajectory_shards` once every rank closed its writer. The shards live next
+    to `output_path`, which must be on a filesystem shared by the ranks.
+
+    Records are written with the step (batch number) they were produced at, so that the merge
+    restores the order in which the ranks produced them.
+    """
+
+    def __init__(self, output_path: str, process_index: int) -> None:
+        self.path = shard_path(output_path, process_index)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.queue = queue.Queue()
+        self.error: Optional[BaseException] = None
+        # truncate the shard of an earlier, interrupted run
+        self.writer = jsonlines.open(self.path, mode="w", flush=True)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                step, records = item
+                for record in records:
+                    self.writer.write({"step": step, **record})
+            except BaseException as e:  # pylint: disable=W0718:broad-exception-caught
+                self.error = e
+        self.writer.close()
+
+    def write(self, step: int, records: Sequence[dict[str, Any]]) -> None:
+        """Queue the records of a step, to be written by the background thread."""
+        if self.error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self.error
+        self.queue.put((step, list(records)))
+
+    def close(self) -> None:
+        """Write the queued records and close the shard."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Writing {self.path} failed") from self.error
+
+
+def _keyed_records(
+    reader: jsonlines.Reader, rank: int
+) -> Iterator[tuple[int, int, dict[str, Any]]]:
+    for record in reader:
+        yield record["step"], rank, record
+
+
+def read_trajectory_shards(
+    output_path: str, num_processes: int, remove: bool = True
+) -> Iterator[dict[str, Any]]:
+    """
+    Yield the records of the shards of `output_path`, merged in (step, rank) order, keeping the
+    first record of each `item_id` (the padding items of the last batches repeat earlier ones).
+    The shards are streamed rather than loaded, and removed after the merge if `remove`.
+    """
+    paths = [shard_path(output_path, i) for i in range(num_processes)]
+    readers = {
+        rank: jsonlines.open(path, mode="r")
+        for rank, path in enumerate(paths)
+        if os.path.exists(path)
+    }
+    try:
+        shards = [_keyed_records(reader, rank) for rank, reader in readers.items()]
+        seen = set()
+        for _, _, record in heapq.merge(*shards, key=lambda x: x[:2]):
+            if record["item_id"] in seen:
+                continue
+            seen.add(record["item_id"])
+            del record["step"]
+            yield record
+    finally:
+        for reader in readers.values():
+            reader.close()
+    if remove:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def first_occurrences(keys: Sequence[Hashable]) -> list[int]:
+    """Positions of the first occurrence of each key, in order."""
+    first = {}
+    for i, key in enumerate(keys):
+        first.setdefault(key, i)
+    return list(first.values())
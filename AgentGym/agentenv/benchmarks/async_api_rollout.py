@@ -0,0 +1,116 @@
+"""
+Drive many API episodes from one process with `AsyncAPIAgent` and
+`Evaluator.aeval`, against the stub server in `stub_openai_server.py`:
+
+    python benchmarks/stub_openai_server.py --latency 0.2 --error_rate 0.05 &
+    python benchmarks/async_api_rollout.py --n_episodes 400 --n_clients 200
+
+The env is a scripted in-process client, so only the stub server is needed.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+
+import requests
+import transformers
+
+from agentenv.controller import AsyncAPIAgent, BaseEnvClient, BaseTask, Evaluator
+from agentenv.controller.types import ConversationMessage, StepOutput
+
+
+@dataclass
+class BenchmarkArguments:
+    base_url: str = field(default="http://127.0.0.1:8765/v1")
+    model: str = field(default="stub")
+    n_episodes: int = field(default=400)
+    n_clients: int = field(default=200)
+    max_round: int = field(default=5)
+    max_concurrency: int = field(default=64)
+    requests_per_second: float = field(default=None)
+    max_retries: int = field(default=8)
+    backoff_base: float = field(default=0.1)
+
+
+class ScriptedEnvClient(BaseEnvClient):
+    conversation_start = (
+        ConversationMessage(
+            {"from": "human", "loss": None, "value": "You are playing a text game."}
+        ),
+        ConversationMessage({"from": "gpt", "loss": False, "value": "Ok."}),
+    )
+
+    def __init__(self, max_round: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.max_round = max_round
+        self.round = 0
+
+    def __len__(self) -> int:
+        return 1000000
+
+    def observe(self) -> str:
+        return f"Round {self.round}. Nothing happens."
+
+    def step(self, action: str) -> StepOutput:
+        self.round += 1
+        done = self.round >= self.max_round
+        return StepOutput(state=self.observe(), reward=1.0 if done else 0.0, done=done)
+
+    def reset(self, idx: int) -> None:
+        self.round = 0
+
+
+class ScriptedTask(BaseTask):
+    env_client_cls = ScriptedEnvClient
+    env_name = "Scripted"
+
+
+def main():
+    parser = transformers.HfArgumentParser(BenchmarkArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+
+    agent = AsyncAPIAgent(
+        api_key="EMPTY",
+        base_url=args.base_url,
+        model=args.model,
+        max_concurrency=args.max_concurrency,
+        requests_per_second=args.requests_per_second,
+        max_retries=args.max_retries,
+        backoff_base=args.backoff_base,
+    )
+    task = ScriptedTask(
+        client_args={"max_round": args.max_round}, n_clients=args.n_clients
+    )
+    evaluator = Evaluator(agent, [task])
+    stats_url = args.base_url.rsplit("/v1", 1)[0] + "/stats"
+
+    async def run():
+        try:
+            return await evaluator.aeval(
+                max_rounds=args.max_round, idxs=list(range(args.n_episodes))
+            )
+        finally:
+            await agent.aclose()
+
+    start_time = time.time()
+    exps = asyncio.run(run())
+    seconds = time.time() - start_time
+    server_stats = requests.get(stats_url, timeout=10).json()
+    print(
+        json.dumps(
+            {
+                "episodes": len(exps.experiences),
+                "score": exps.score,
+                "success": exps.success,
+                "seconds": seconds,
+                "episodes_per_second": len(exps.experiences) / seconds,
+                "server": server_stats,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-step transport overhead of env clients against the in-process mock env server (zero simulated
+latency): module-level `requests.post`, as the env clients did before, versus the shared pooled
+`EnvTransport`, `AsyncEnvTransport` from one event loop, and one `WebSocketEnvSession` per client
+(`transport="ws"`).
+
+    python -m benchmarks.env_transport --steps 2000 --threads 1,8
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import requests
+import transformers
+
+from agentenv.controller.transport import (
+    AsyncEnvTransport,
+    EnvTransport,
+    WebSocketEnvSession,
+)
+
+from . import mock_env
+
+
+@dataclass
+class BenchmarkArguments:
+    steps: int = field(default=2000, metadata={"help": "Steps per thread"})
+    threads: str = field(default="1,8")
+    observation_words: int = field(default=100)
+
+
+def requests_module_post(url: str, data: dict) -> dict:
+    res = requests.post(url, json=data, timeout=30)
+    assert res.status_code == 200
+    return res.json()
+
+
+def run_threads(make_post, base_url: str, steps: int, n_threads: int) -> dict:
+    """`make_post()` gives the post function of one client thread."""
+
+    def worker(_):
+        post = make_post()
+        env_id = post(f"{base_url}/create", {})["id"]
+        post(f"{base_url}/reset", {"id": env_id, "data_idx": 0})
+        durations = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            post(f"{base_url}/step", {"id": env_id, "action": "step"})
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_threads) as executor:
+        durations = [d for ds in executor.map(worker, range(n_threads)) for d in ds]
+    return summarize(durations, time.perf_counter() - start)
+
+
+async def run_async(transport: AsyncEnvTransport, base_url: str, steps: int, n_tasks: int) -> dict:
+    async def worker():
+        env_id = (await transport.post(f"{base_url}/create", {}))["id"]
+        await transport.post(f"{base_url}/reset", {"id": env_id, "data_idx": 0})
+        durations = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            await transport.post(f"{base_url}/step", {"id": env_id, "action": "step"})
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(worker() for _ in range(n_tasks)))
+    seconds = time.perf_counter() - start
+    await transport.aclose()
+    return summarize([d for ds in results for d in ds], seconds)
+
+
+def summarize(durations: list[float], seconds: float) -> dict:
+    ms = np.array(durations) * 1000
+    return {
+        "steps": len(ms),
+        "steps_per_s": len(ms) / seconds,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def main():
+    parser = transformers.HfArgumentParser(BenchmarkArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+    mock_env.configure(observation_words=args.observation_words)
+    base_url = mock_env.serve_in_thread()
+
+    results = []
+    for n_threads in [int(n) for n in args.threads.split(",")]:
+        transport = EnvTransport()
+        for name, run in (
+            ("requests_module", lambda: run_threads(lambda: requests_module_post, base_url, args.steps, n_threads)),
+            ("env_transport", lambda: run_threads(lambda: lambda url, data: transport.post(url, data, timeout=30), base_url, args.steps, n_threads)),
+            ("async_env_transport", lambda: asyncio.run(run_async(AsyncEnvTransport(), base_url, args.steps, n_threads))),
+            ("websocket_session", lambda: run_threads(lambda: WebSocketEnvSession().post, base_url, args.steps, n_threads)),
+        ):
+            results.append({"transport": name, "concurrency": n_threads, **run()})
+            print(json.dumps(results[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
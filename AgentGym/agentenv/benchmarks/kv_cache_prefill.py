@@ -0,0 +1,152 @@
+"""
+Compare the number of prompt tokens prefilled per episode with and without
+reusing the KV cache between rounds (`Agent(reuse_kv_cache=True)`).
+
+The env is a scripted in-process client, so no env server is needed:
+
+    python benchmarks/kv_cache_prefill.py --model_path HuggingFaceTB/SmolLM2-135M-Instruct
+"""
+
+import json
+import time
+from dataclasses import dataclass, field
+
+import torch
+import transformers
+from transformers import AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+
+from agentenv.controller import (
+    Agent,
+    BaseEnvClient,
+    BaseTask,
+    ChatMLTemplate,
+    Llama2Template,
+    Llama3Template,
+)
+from agentenv.controller.types import ConversationMessage, StepOutput
+
+
+@dataclass
+class BenchmarkArguments:
+    model_path: str = field(default="HuggingFaceTB/SmolLM2-135M-Instruct")
+    chat_template: str = field(default="chatml")
+    n_episodes: int = field(default=4)
+    max_round: int = field(default=20)
+    max_new_tokens: int = field(default=32)
+    observation_words: int = field(default=40)
+
+
+class ScriptedEnvClient(BaseEnvClient):
+    conversation_start = (
+        ConversationMessage(
+            {
+                "from": "human",
+                "loss": None,
+                "value": "You are playing a text game. Reply with one action per round.",
+            }
+        ),
+        ConversationMessage({"from": "gpt", "loss": False, "value": "Ok."}),
+    )
+
+    def __init__(self, max_round: int, observation_words: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.max_round = max_round
+        self.observation_words = observation_words
+        self.idx = 0
+        self.round = 0
+
+    def __len__(self) -> int:
+        return 1000
+
+    def observe(self) -> str:
+        words = [f"item{(self.idx + self.round + i) % 97}" for i in range(self.observation_words)]
+        return f"Round {self.round}. You see: " + " ".join(words)
+
+    def step(self, action: str) -> StepOutput:
+        self.round += 1
+        return StepOutput(
+            state=self.observe(), reward=0.0, done=self.round >= self.max_round
+        )
+
+    def reset(self, idx: int) -> None:
+        self.idx = idx
+        self.round = 0
+
+
+class ScriptedTask(BaseTask):
+    env_client_cls = ScriptedEnvClient
+    env_name = "Scripted"
+
+
+def run(agent: Agent, task: BaseTask, args: BenchmarkArguments, generation_config):
+    prefilled = []
+    experiences = []
+    start_time = time.time()
+    for idx in range(args.n_episodes):
+        before = agent.prefilled_tokens
+        experiences += task.generate_experience(
+            agent, [idx], generation_config, max_rounds=args.max_round
+        )
+        prefilled.append(agent.prefilled_tokens - before)
+    return experiences, prefilled, time.time() - start_time
+
+
+def main():
+    parser = transformers.HfArgumentParser(BenchmarkArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = AutoModelForCausalLM.from_pretrained(args.model_path).eval()
+    if torch.cuda.is_available():
+        model.to("cuda")
+    template_classes = {
+        "chatml": ChatMLTemplate,
+        "llama2": Llama2Template,
+        "llama3": Llama3Template,
+    }
+    chat_template = template_classes[args.chat_template]()
+
+    task = ScriptedTask(
+        client_args={
+            "max_round": args.max_round,
+            "observation_words": args.observation_words,
+        }
+    )
+    generation_config = GenerationConfig(
+        max_length=4096,
+        max_new_tokens=args.max_new_tokens,
+        do_sample=False,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=(
+            tokenizer.pad_token_id
+            if tokenizer.pad_token_id is not None
+            else tokenizer.eos_token_id
+        ),
+    )
+
+    results = {}
+    outputs = {}
+    for reuse_kv_cache in (False, True):
+        agent = Agent(
+            model, tokenizer, chat_template=chat_template, reuse_kv_cache=reuse_kv_cache
+        )
+        experiences, prefilled, seconds = run(agent, task, args, generation_config)
+        name = "kv_cache" if reuse_kv_cache else "no_cache"
+        outputs[name] = [exp.seq_ids for exp in experiences]
+        results[name] = {
+            "prefilled_tokens_per_episode": sum(prefilled) / len(prefilled),
+            "final_sequence_length": sum(len(exp.seq_ids) for exp in experiences)
+            / len(experiences),
+            "seconds_per_episode": seconds / len(experiences),
+        }
+
+    results["prefill_reduction"] = (
+        results["no_cache"]["prefilled_tokens_per_episode"]
+        / results["kv_cache"]["prefilled_tokens_per_episode"]
+    )
+    results["identical_outputs"] = outputs["no_cache"] == outputs["kv_cache"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Mock agents with configurable generation latency and length, so rollouts can be benchmarked on a CPU.
+
+`MockAgent` goes through the local `Agent` code paths (chat template tokenization, batched
+lockstep / pipelined rollouts) with a byte-level tokenizer and no model. `MockAPIAgent` goes
+through the `APIAgent` paths without sending requests. Both reply with a fixed-length ReAct action.
+"""
+
+import time
+
+from agentenv.controller import Agent, APIAgent, BaseChatTemplate
+from agentenv.controller.types import (
+    APIConversationMessage,
+    ConversationMessage,
+    TokenizedConversationOutput,
+)
+
+
+class MockTokenizer:
+    """Byte-level tokenizer: token id = byte + 3, with 0 / 1 / 2 as pad / bos / eos."""
+
+    pad_token_id = 0
+    bos_token_id = 1
+    eos_token_id = 2
+    eos_token = "</s>"
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> list[int]:
+        ids = [b + 3 for b in text.encode("utf-8")]
+        return [self.bos_token_id] + ids if add_special_tokens else ids
+
+    def decode(self, ids: list[int], skip_special_tokens: bool = False) -> str:
+        text = bytes(i - 3 for i in ids if i >= 3).decode("utf-8", errors="replace")
+        if not skip_special_tokens and ids and ids[-1] == self.eos_token_id:
+            text += self.eos_token
+        return text
+
+
+class MockChatTemplate(BaseChatTemplate):
+    def tokenize_conversation_one(
+        self,
+        message: ConversationMessage,
+        tokenizer: MockTokenizer,
+        idx: int = -1,
+        add_generation_prompt: bool = False,
+    ) -> TokenizedConversationOutput:
+        text = f"{message['from']}: {message['value']}\n"
+        if add_generation_prompt:
+            text += "gpt: "
+        input_ids = tokenizer.encode(text)
+        return TokenizedConversationOutput(
+            {
+                "text": text,
+                "input_ids": input_ids,
+                "action_mask": [1 if message["from"] == "gpt" else 0] * len(input_ids),
+            }
+        )
+
+
+def mock_reply(generation_tokens: int) -> str:
+    reply = "Thought:\nI should keep going.\n\nAction:\nstep"
+    return reply + " " + "x" * max(0, generation_tokens - len(reply) - 1)
+
+
+class MockAgent(Agent):
+    """
+    Every `generate` call sleeps `generation_latency + per_sequence_latency * batch_size`,
+    a rough model of one batched decode, and returns `generation_tokens` tokens per sequence.
+    """
+
+    def __init__(
+        self,
+        generation_latency: float = 0.05,
+        per_sequence_latency: float = 0.0,
+        generation_tokens: int = 64,
+    ) -> None:
+        super().__init__(None, MockTokenizer(), chat_template=MockChatTemplate())
+        self.generation_latency = generation_latency
+        self.per_sequence_latency = per_sequence_latency
+        self.reply_ids = self.tokenizer.encode(mock_reply(generation_tokens - 1)) + [
+            self.tokenizer.eos_token_id
+        ]
+
+    def _generate(
+        self,
+        input_ids: list[list[int]],
+        generation_config=None,
+        refresh_engine: bool = False,
+        kv_caches=None,
+    ) -> list[list[int]]:
+        time.sleep(
+            self.generation_latency + self.per_sequence_latency * len(input_ids)
+        )
+        return [list(self.reply_ids) for _ in input_ids]
+
+
+class MockAPIAgent(APIAgent):
+    """Sleeps `generation_latency` per request and replies with `generation_tokens` characters."""
+
+    def __init__(
+        self,
+        generation_latency: float = 0.05,
+        generation_tokens: int = 64,
+    ) -> None:
+        super().__init__(api_key="EMPTY", base_url="http://127.0.0.1:1/v1", model="mock")
+        self.generation_latency = generation_latency
+        self.reply = mock_reply(generation_tokens)
+
+    def _generate(
+        self,
+        conversation: list[APIConversationMessage],
+    ) -> tuple[str, str | None]:
+        time.sleep(self.generation_latency)
+        return self.reply, None
@@ -0,0 +1,339 @@
+"""
+Deterministic mock env server speaking the same `/create`, `/reset`, `/step`, `/observation`
+protocol as the real env servers, with `/step_batch` and `/reset_batch`, plus the matching
+clients and tasks.
+
+Episode `idx` lasts `1 + idx % max_steps` steps and ends with reward 1, whatever the actions are.
+Latencies are simulated with `time.sleep` in sync endpoints, so they overlap across requests
+like blocking simulators do in the real servers' thread pools.
+
+    python -m benchmarks.mock_env --port 36001 --step_latency 0.05
+"""
+
+import argparse
+import socket
+import threading
+import time
+from typing import Any, Mapping, Optional
+
+import uvicorn
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller.types import ConversationMessage, StepOutput
+
+
+class CreateRequestBody(BaseModel):
+    pass
+
+
+class StepRequestBody(BaseModel):
+    id: int
+    action: str
+
+
+class ResetRequestBody(BaseModel):
+    id: int
+    data_idx: Optional[int] = 0
+
+
+class StepBatchRequestBody(BaseModel):
+    items: list[StepRequestBody]
+
+
+class ResetBatchRequestBody(BaseModel):
+    items: list[ResetRequestBody]
+
+
+class MockEnv_Wrapper:
+    def __init__(
+        self,
+        create_latency: float = 0.0,
+        reset_latency: float = 0.0,
+        step_latency: float = 0.0,
+        observation_words: int = 100,
+        max_steps: int = 5,
+    ):
+        self.create_latency = create_latency
+        self.reset_latency = reset_latency
+        self.step_latency = step_latency
+        self.observation_words = observation_words
+        self.max_steps = max_steps
+        self._max_id = 0
+        self.info = {}  # dict[id, env_info]
+        self._lock = threading.Lock()
+
+    def _observation(self, data_idx: int, steps: int) -> str:
+        words = (
+            f"w{(data_idx * 31 + steps * 7 + i) % 1000}"
+            for i in range(self.observation_words)
+        )
+        return f"Step {steps}. " + " ".join(words)
+
+    def create(self):
+        time.sleep(self.create_latency)
+        with self._lock:
+            id = self._max_id
+            self._max_id += 1
+        self.info[id] = {"data_idx": 0, "steps": 0, "observation": "", "done": False}
+        return {"id": id}
+
+    def reset(self, id: int, data_idx: int):
+        time.sleep(self.reset_latency)
+        observation = self._observation(data_idx, 0)
+        self.info[id] = {
+            "data_idx": data_idx,
+            "steps": 0,
+            "observation": observation,
+            "done": False,
+        }
+        return {"id": id, "observation": observation, "reward": 0, "done": False}
+
+    def step(self, id: int, action: str):
+        time.sleep(self.step_latency)
+        if id not in self.info:
+            return {"error": f"The id {id} is not valid."}
+        info = self.info[id]
+        info["steps"] += 1
+        info["done"] = info["steps"] >= 1 + info["data_idx"] % self.max_steps
+        info["observation"] = self._observation(info["data_idx"], info["steps"])
+        return {
+            "observation": info["observation"],
+            "reward": 1 if info["done"] else 0,
+            "done": info["done"],
+        }
+
+    def get_observation(self, id: int):
+        return self.info[id]["observation"]
+
+
+app = FastAPI()
+server = MockEnv_Wrapper()
+
+
+@app.get("/")
+def hello():
+    return "This is environment Mock."
+
+
+@app.post("/create")
+def create(body: CreateRequestBody):
+    return server.create()
+
+
+@app.post("/step")
+def step(body: StepRequestBody):
+    return server.step(body.id, body.action)
+
+
+@app.post("/reset")
+def reset(body: ResetRequestBody):
+    return server.reset(body.id, body.data_idx)
+
+
+@app.post("/step_batch")
+def step_batch(body: StepBatchRequestBody):
+    return [server.step(item.id, item.action) for item in body.items]
+
+
+@app.post("/reset_batch")
+def reset_batch(body: ResetBatchRequestBody):
+    return [server.reset(item.id, item.data_idx) for item in body.items]
+
+
+@app.get("/observation")
+def get_observation(id: int):
+    return server.get_observation(id)
+
+
+async def serve_session(websocket: WebSocket, ops: dict[str, Any]) -> None:
+    """
+    Serve `ops` over one long-lived WebSocket: msgpack frames `{"op": ..., "body": {...}}` with the
+    bodies of the REST routes, answered with `{"status": 200, "body": ...}` or an error status.
+    """
+    if msgpack is None:
+        await websocket.close(code=1011, reason="msgpack is not installed")
+        return
+    await websocket.accept()
+    try:
+        while True:
+            request = msgpack.unpackb(await websocket.receive_bytes())
+            op = ops.get(request["op"])
+            if op is None:
+                reply = {"status": 404, "detail": f"Unknown op: {request['op']}"}
+            else:
+                try:
+                    body = await run_in_threadpool(op, request["body"])
+                    reply = {"status": 200, "body": body}
+                except Exception as e:
+                    reply = {"status": 500, "detail": str(e)}
+            await websocket.send_bytes(msgpack.packb(reply))
+    except WebSocketDisconnect:
+        pass
+
+
+# ops of the `/ws` endpoint, also called directly by env clients with backend="local"
+session_ops = {
+    "create": lambda body: server.create(),
+    "step": lambda body: server.step(body["id"], body["action"]),
+    "reset": lambda body: server.reset(body["id"], body.get("data_idx", 0)),
+    "observation": lambda body: server.get_observation(int(body["id"])),
+}
+
+
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket):
+    await serve_session(websocket, session_ops)
+
+
+def configure(**kwargs) -> None:
+    """Change latencies / observation size / episode lengths of the running server."""
+    for key, value in kwargs.items():
+        if not hasattr(server, key):
+            raise ValueError(f"Unknown mock env setting: {key}")
+        setattr(server, key, value)
+
+
+def serve_in_thread(host: str = "127.0.0.1", port: int = 0) -> str:
+    """Start the server in a daemon thread of this process and return its base url."""
+    if port == 0:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+    uvicorn_server = uvicorn.Server(
+        uvicorn.Config(app, host=host, port=port, log_level="warning")
+    )
+    threading.Thread(target=uvicorn_server.run, daemon=True).start()
+    base_url = f"http://{host}:{port}"
+    for _ in range(100):
+        if uvicorn_server.started:
+            return base_url
+        time.sleep(0.05)
+    raise RuntimeError(f"Mock env server did not start on {base_url}")
+
+
+class MockEnvClient(BaseEnvClient):
+    local_ops = "benchmarks.mock_env:session_ops"
+    conversation_start = (
+        ConversationMessage(
+            {
+                "from": "human",
+                "loss": None,
+                "value": 'You are in a mock environment. Your output must strictly follow this format:"Thought:\nyour thoughts.\n\nAction:\nyour next action"',
+            }
+        ),
+        ConversationMessage(
+            {
+                "from": "gpt",
+                "loss": False,
+                "value": "OK. I'll follow your instructions and try my best to solve the task.",
+            }
+        ),
+    )
+
+    def __init__(
+        self,
+        env_server_base: str,
+        data_len: int,
+        *args,
+        timeout: int = 300,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.env_server_base = env_server_base
+        self.timeout = timeout
+        self.data_len = data_len
+
+        ok = self.transport.post(f"{self.env_server_base}/create", json={}, timeout=self.timeout)
+        self.env_id = ok["id"]
+        self.info = {"observation": "", "reward": 0, "done": False}
+
+    def __len__(self):
+        return self.data_len
+
+    def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
+        data["id"] = self.env_id
+        return self.transport.post(
+            f"{self.env_server_base}/{path}",
+            json=data,
+            timeout=self.timeout,
+        )
+
+    def observe(self) -> str:
+        return self.info["observation"]
+
+    def step(self, action: str) -> StepOutput:
+        return self._apply_step(self._post("step", {"action": action}))
+
+    def _prepare_step(self, action: str) -> str:
+        return action
+
+    def _apply_step(self, response: dict[str, Any]) -> StepOutput:
+        self.info = response
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    def reset(self, idx: int = 0) -> dict[str, Any]:
+        return self._apply_reset(self._post("reset", self._reset_data(idx)))
+
+    def _reset_data(self, idx: int) -> dict[str, Any]:
+        return {"data_idx": idx}
+
+    def _apply_reset(self, response: dict[str, Any]) -> dict[str, Any]:
+        self.info = response
+        return response
+
+
+class BatchedMockEnvClient(MockEnvClient):
+    """Steps with `/step_batch` in lockstep rollouts."""
+
+    batch_endpoints = True
+
+
+class MockTask(BaseTask):
+    env_client_cls = MockEnvClient
+    env_name = "Mock"
+
+    def __init__(
+        self, client_args: Mapping[str, Any], *args, n_clients: int = 1, **kwargs
+    ) -> None:
+        super().__init__(client_args, n_clients, *args, **kwargs)
+
+
+class BatchedMockTask(MockTask):
+    env_client_cls = BatchedMockEnvClient
+    env_name = "Mock"
+
+
+def launch():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=36001)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--create_latency", type=float, default=0.0)
+    parser.add_argument("--reset_latency", type=float, default=0.0)
+    parser.add_argument("--step_latency", type=float, default=0.0)
+    parser.add_argument("--observation_words", type=int, default=100)
+    parser.add_argument("--max_steps", type=int, default=5)
+    args = parser.parse_args()
+    configure(
+        create_latency=args.create_latency,
+        reset_latency=args.reset_latency,
+        step_latency=args.step_latency,
+        observation_words=args.observation_words,
+        max_steps=args.max_steps,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    launch()
@@ -0,0 +1,249 @@
+"""
+End-to-end rollout throughput on a CPU, with the mock env server of `benchmarks.mock_env`
+running in this process and the mock agents of `benchmarks.mock_agent`.
+
+Two paths are measured at every concurrency level:
+  - "evaluator": one `Evaluator.eval` call over a task with `n_clients=concurrency`,
+    once per rollout mode ("lockstep_batched" is lockstep with one `/step_batch` request per round);
+  - "multiprocessing": a `multiprocessing.Pool(concurrency)` of single-client evaluators,
+    as in `examples/basic/openai_eval_multiprocessing.py`.
+
+Each result reports episodes/s, rounds/s and p50/p99 env step latency. Results are printed
+as JSON and, with --output_file, written there together with the commit they were measured on:
+
+    python -m benchmarks.rollout_throughput --concurrency 1,4,16 --output_file rollout.json
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import transformers
+from transformers import GenerationConfig
+
+from agentenv.controller import Evaluator, RolloutTracer
+
+from . import mock_env
+from .mock_agent import MockAgent, MockAPIAgent
+
+
+@dataclass
+class BenchmarkArguments:
+    agent: str = field(default="local", metadata={"help": "local or api"})
+    paths: str = field(default="evaluator,multiprocessing")
+    rollout_modes: str = field(
+        default="lockstep,pipelined",
+        metadata={
+            "help": "Rollout modes of the evaluator path, for the local agent, and lockstep_batched"
+        },
+    )
+    concurrency: str = field(default="1,4,16")
+    n_episodes: int = field(default=64)
+    max_round: int = field(default=10)
+
+    # mock env
+    create_latency: float = field(default=0.0)
+    reset_latency: float = field(default=0.01)
+    step_latency: float = field(default=0.02)
+    observation_words: int = field(default=100)
+    max_steps: int = field(default=5)
+    env_transport: str = field(
+        default="http",
+        metadata={"help": "http, ws, or local to run the mock env in this process"},
+    )
+
+    # mock agent
+    generation_latency: float = field(default=0.02)
+    per_sequence_latency: float = field(default=0.002)
+    generation_tokens: int = field(default=64)
+
+    output_file: str = field(default=None)
+
+
+def make_agent(args: BenchmarkArguments):
+    if args.agent == "local":
+        return MockAgent(
+            generation_latency=args.generation_latency,
+            per_sequence_latency=args.per_sequence_latency,
+            generation_tokens=args.generation_tokens,
+        )
+    elif args.agent == "api":
+        return MockAPIAgent(
+            generation_latency=args.generation_latency,
+            generation_tokens=args.generation_tokens,
+        )
+    raise ValueError(f"Unsupported agent: {args.agent}")
+
+
+def summarize(
+    path: str,
+    mode: str,
+    concurrency: int,
+    seconds: float,
+    experiences: list,
+    step_ms: list[float],
+) -> dict:
+    step_ms = np.array(step_ms) if step_ms else np.zeros(1)
+    return {
+        "path": path,
+        "mode": mode,
+        "concurrency": concurrency,
+        "episodes": len(experiences),
+        "rounds": len(step_ms),
+        "seconds": seconds,
+        "episodes_per_s": len(experiences) / seconds,
+        "rounds_per_s": len(step_ms) / seconds,
+        "step_p50_ms": float(np.percentile(step_ms, 50)),
+        "step_p99_ms": float(np.percentile(step_ms, 99)),
+        "mean_reward": float(np.mean([exp.reward for exp in experiences])),
+    }
+
+
+def step_durations_ms(tracer: RolloutTracer) -> list[float]:
+    """Env step latency as seen by each episode; a batched step counts once per episode in it."""
+    durations = []
+    for name, start, end, _, args in tracer.events:
+        if name == "env.step":
+            durations.append((end - start) / 1e6)
+        elif name == "env.step_batch":
+            durations.extend([(end - start) / 1e6] * args["batch_size"])
+    return durations
+
+
+def run_evaluator(args, env_args, generation_config, concurrency, mode) -> dict:
+    if mode == "lockstep_batched":
+        task = mock_env.BatchedMockTask(
+            client_args=env_args, n_clients=concurrency, rollout_mode="lockstep"
+        )
+    else:
+        task = mock_env.MockTask(
+            client_args=env_args, n_clients=concurrency, rollout_mode=mode
+        )
+    evaluator = Evaluator(make_agent(args), [task])
+    with RolloutTracer() as tracer:
+        start_time = time.perf_counter()
+        exps = evaluator.eval(
+            generation_config=generation_config,
+            max_rounds=args.max_round,
+            idxs=list(range(args.n_episodes)),
+        )
+        seconds = time.perf_counter() - start_time
+    return summarize(
+        "evaluator",
+        mode,
+        concurrency,
+        seconds,
+        exps.experiences,
+        step_durations_ms(tracer),
+    )
+
+
+def init(args, env_args, generation_config):
+    global evaluator, eval_args, eval_generation_config
+    eval_args = args
+    eval_generation_config = generation_config
+    evaluator = Evaluator(
+        make_agent(args), [mock_env.MockTask(client_args=env_args, n_clients=1)]
+    )
+
+
+def process(data_idx):
+    with RolloutTracer() as tracer:
+        exps = evaluator.eval(
+            generation_config=eval_generation_config,
+            max_rounds=eval_args.max_round,
+            idxs=[data_idx],
+        )
+    return exps.experiences[0], step_durations_ms(tracer)
+
+
+def run_multiprocessing(args, env_args, generation_config, concurrency) -> dict:
+    with multiprocessing.Pool(
+        concurrency, init, (args, env_args, generation_config)
+    ) as pool:
+        # wait for every worker to create its env, as the evaluator path does before timing
+        pool.map(time.sleep, [0.1] * concurrency)
+        start_time = time.perf_counter()
+        results = pool.map(process, range(args.n_episodes))
+        seconds = time.perf_counter() - start_time
+    return summarize(
+        "multiprocessing",
+        "process_pool",
+        concurrency,
+        seconds,
+        [exp for exp, _ in results],
+        [ms for _, step_ms in results for ms in step_ms],
+    )
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = transformers.HfArgumentParser(BenchmarkArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+
+    mock_env.configure(
+        create_latency=args.create_latency,
+        reset_latency=args.reset_latency,
+        step_latency=args.step_latency,
+        observation_words=args.observation_words,
+        max_steps=args.max_steps,
+    )
+    env_args = {
+        "env_server_base": mock_env.serve_in_thread(),
+        "data_len": args.n_episodes,
+    }
+    if args.env_transport == "local":
+        env_args["backend"] = "local"
+    else:
+        env_args["transport"] = args.env_transport
+    generation_config = GenerationConfig(max_length=1 << 20)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    paths = args.paths.split(",")
+    modes = args.rollout_modes.split(",") if args.agent == "local" else ["concurrent"]
+
+    results = []
+    for concurrency in levels:
+        if "evaluator" in paths:
+            for mode in modes if concurrency > 1 else ["sequential"]:
+                results.append(
+                    run_evaluator(args, env_args, generation_config, concurrency, mode)
+                )
+                print(json.dumps(results[-1]))
+        if "multiprocessing" in paths:
+            results.append(
+                run_multiprocessing(args, env_args, generation_config, concurrency)
+            )
+            print(json.dumps(results[-1]))
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": asdict(args),
+        "results": results,
+    }
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Rollouts of `RolloutWorkerPool` on a CPU, with a tiny random Llama over the byte-level tokenizer of
+`benchmarks.mock_agent` and the mock env server of `benchmarks.mock_env` running in this process.
+
+The pool rolls the episodes out with a first version of the weights, which are then perturbed and
+published as a second version, as a trainer does at an iteration boundary. Each phase reports
+episodes/s, the episodes that pass the reward filter and per-worker busy time, next to an
+in-process `Evaluator` over the same episodes for reference:
+
+    python -m benchmarks.rollout_workers --n_workers 2 --n_episodes 32
+"""
+
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+import torch
+import transformers
+from transformers import GenerationConfig, LlamaConfig, LlamaForCausalLM
+
+from agentenv.controller import Agent, Evaluator, RolloutWorkerPool
+
+from . import mock_env
+from .mock_agent import MockChatTemplate, MockTokenizer
+
+
+@dataclass
+class BenchmarkArguments:
+    n_workers: int = field(default=2)
+    n_clients: int = field(default=4, metadata={"help": "Env clients per worker"})
+    n_episodes: int = field(default=32)
+    max_round: int = field(default=3)
+    max_new_tokens: int = field(default=16)
+    reward_threshold: float = field(default=0.99)
+    hidden_size: int = field(default=64)
+    num_hidden_layers: int = field(default=2)
+
+
+def make_model(args: BenchmarkArguments) -> LlamaForCausalLM:
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=259,
+        hidden_size=args.hidden_size,
+        intermediate_size=2 * args.hidden_size,
+        num_hidden_layers=args.num_hidden_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        pad_token_id=0,
+        bos_token_id=1,
+        eos_token_id=2,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def run_pool(pool: RolloutWorkerPool, n_episodes: int, weights_path: str, reward_threshold: float) -> dict:
+    start = time.perf_counter()
+    pool.submit(range(n_episodes), weights_path)
+    records = list(pool.results())
+    seconds = time.perf_counter() - start
+    return {
+        "episodes": len(records),
+        "episodes_per_s": len(records) / seconds,
+        "accepted": sum(record["reward"] > reward_threshold for record in records),
+        "weights": sorted({os.path.basename(record["weights_path"]) for record in records}),
+    }
+
+
+def main():
+    parser = transformers.HfArgumentParser(BenchmarkArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+    base_url = mock_env.serve_in_thread()
+    task = mock_env.MockTask(
+        client_args={"env_server_base": base_url, "data_len": args.n_episodes},
+        n_clients=args.n_clients,
+    )
+    generation_config = GenerationConfig(
+        max_new_tokens=args.max_new_tokens, do_sample=True, temperature=1.2, pad_token_id=0, eos_token_id=2
+    )
+    model = make_model(args)
+    agent = Agent(model, MockTokenizer(), chat_template=MockChatTemplate())
+
+    results = []
+    start = time.perf_counter()
+    with torch.no_grad():
+        exps = Evaluator(agent, [task]).eval(
+            generation_config, args.max_round, [list(range(args.n_episodes))]
+        ).experiences
+    results.append(
+        {
+            "path": "in_process",
+            "episodes": len(exps),
+            "episodes_per_s": len(exps) / (time.perf_counter() - start),
+            "accepted": sum(exp.reward > args.reward_threshold for exp in exps),
+        }
+    )
+    print(json.dumps(results[-1]))
+
+    with tempfile.TemporaryDirectory() as weights_dir:
+        pool = RolloutWorkerPool(
+            agent, [task], generation_config, args.max_round, n_workers=args.n_workers
+        )
+        try:
+            for version in range(2):
+                # publish: save the weights, then submit with their path
+                weights_path = os.path.join(weights_dir, f"v{version}")
+                model.save_pretrained(weights_path)
+                results.append({"path": "worker_pool", **run_pool(pool, args.n_episodes, weights_path, args.reward_threshold)})
+                print(json.dumps(results[-1]))
+                with torch.no_grad():
+                    for parameter in model.parameters():
+                        parameter.add_(torch.randn_like(parameter) * 0.01)
+            results.append(
+                {
+                    "path": "worker_pool",
+                    "worker_episodes": pool.worker_episodes,
+                    "worker_busy_s": [round(t, 3) for t in pool.worker_busy_time],
+                }
+            )
+            print(json.dumps(results[-1]))
+        finally:
+            pool.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Minimal OpenAI-compatible chat completion server for exercising `AsyncAPIAgent` locally.
+It answers every request with a fixed ReAct-style reply after a configurable latency,
+and can inject 429 / 500 errors to exercise the retry path.
+
+    python benchmarks/stub_openai_server.py --port 8765 --latency 0.2 --error_rate 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+app.state.latency = 0.0
+app.state.error_rate = 0.0
+app.state.reply = "Thought:\nI think I should look around.\n\nAction:\nlook"
+app.state.requests = 0
+app.state.in_flight = 0
+app.state.max_in_flight = 0
+
+
+@app.get("/")
+def hello():
+    return "This is a stub OpenAI-compatible server."
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "requests": app.state.requests,
+        "in_flight": app.state.in_flight,
+        "max_in_flight": app.state.max_in_flight,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    app.state.in_flight += 1
+    app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+    try:
+        await asyncio.sleep(app.state.latency)
+        if random.random() < app.state.error_rate:
+            status = random.choice([429, 500])
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"message": f"injected {status}", "type": "stub"}},
+            )
+        prompt_tokens = sum(len(m["content"].split()) for m in body["messages"])
+        completion_tokens = len(app.state.reply.split())
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": app.state.reply},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+    finally:
+        app.state.in_flight -= 1
+
+
+def launch():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    launch()
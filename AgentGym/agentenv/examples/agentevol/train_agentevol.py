@@ -55,6 +55,18 @@ class TrainingArguments:
     logging_step_freq: int = field(default=None)
     seed: int = field(default=42)
     max_input_length: int = field(default=700)
+    packing: bool = field(
+        default=False,
+        metadata={"help": "Pack several conversations into each row of max_input_length tokens."},
+    )
+    tokenization_cache_dir: str = field(
+        default=None,
+        metadata={"help": "Cache of tokenized items, reused across runs. Defaults to the HF datasets cache."},
+    )
+    max_tokens_per_batch: int = field(
+        default=None,
+        metadata={"help": "Token budget of a batch of samples of similar length, used instead of batch_size."},
+    )
 
     # agent evol
     sample_num: int = field(default=5)
@@ -75,6 +87,25 @@ class TrainingArguments:
     env_server_base: str = field(default=None)
     data_len: int = field(default=200)
     timeout: int = field(default=2400)
+    n_clients: int = field(
+        default=1,
+        metadata={"help": "Env clients per task. Larger than 1 rolls out episodes in batches."},
+    )
+
+    # rollout workers
+    rollout_workers: int = field(
+        default=0,
+        metadata={"help": "Rollout worker processes exploring the inference set after training, on the main process while the other ranks poll iter_data_path, which must be shared. 0 leaves exploration to separate launches."},
+    )
+    rollout_devices: str = field(
+        default="cpu",
+        metadata={"help": "Devices of the rollout workers, assigned round-robin, e.g. cuda:6,cuda:7."},
+    )
+    rollout_overlap: bool = field(
+        default=False,
+        metadata={"help": "Explore with the weights the iteration starts from, while training."},
+    )
+    rollout_reward_threshold: float = field(default=0.99)
 
 
 def main():
@@ -110,7 +141,7 @@ def main():
 
     trainer = AgentEvolTrainer(
         Agent(model, tokenizer),
-        [task_class(client_args=env_args, n_clients=1)],
+        [task_class(client_args=env_args, n_clients=args.n_clients)],
         args,
     )
     trainer.evol()
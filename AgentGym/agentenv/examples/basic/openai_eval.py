@@ -42,6 +42,10 @@ class EvalArguments:
     max_tokens: int = field(default=4096)
     temperature: float = field(default=1)
     top_p: float = field(default=1)
+    response_cache: str = field(
+        default=None,
+        metadata={"help": "SQLite file caching API responses, reused when a run is repeated or resumed"},
+    )
     task_name: str = field(
         default="webshop", metadata={"help": "Task name for evaluation"}
     )
@@ -102,6 +106,7 @@ def main(args):
             max_tokens=args["max_tokens"],
             temperature=args["temperature"],
             top_p=args["top_p"],
+            response_cache=args["response_cache"],
         ),
         [task_class(client_args=env_args, n_clients=1)],
     )
@@ -62,6 +62,18 @@ class TrainingArguments:
     logging_step_freq: int = field(default=None)
     seed: int = field(default=42)
     max_input_length: int = field(default=700)
+    packing: bool = field(
+        default=False,
+        metadata={"help": "Pack several conversations into each row of max_input_length tokens."},
+    )
+    tokenization_cache_dir: str = field(
+        default=None,
+        metadata={"help": "Cache of tokenized items, reused across runs. Defaults to the HF datasets cache."},
+    )
+    max_tokens_per_batch: int = field(
+        default=None,
+        metadata={"help": "Token budget of a batch of samples of similar length, used instead of batch_size."},
+    )
 
     # environment
     max_round: int = field(
@@ -38,6 +38,16 @@ class EvalArguments:
     seed: int = field(default=42)
     do_sample: bool = field(default=False, metadata={"help": "Do sampling or not."})
     temperature: float = field(default=1.0, metadata={"help": "Sampling temperature."})
+    work_queue: bool = field(
+        default=False,
+        metadata={
+            "help": "Ranks claim the next batch from a shared counter when done, "
+            "instead of running a static shard each. Ranks then run different numbers of "
+            "batches, so the model's forward must not run collectives: it is turned off "
+            "with sharded parameters (FSDP, Megatron-LM, DeepSpeed ZeRO-3). The counter is "
+            "served by the main process on MASTER_PORT + 1; static shards are used if it is unreachable."
+        },
+    )
 
     # conversation rounds
     max_round: int = field(
@@ -51,6 +61,10 @@ class EvalArguments:
     env_server_base: str = field(default=None)
     data_len: int = field(default=200)
     timeout: int = field(default=2400)
+    n_clients: int = field(
+        default=1,
+        metadata={"help": "Env clients per task. Larger than 1 rolls out episodes in batches."},
+    )
 
 
 def main():
@@ -96,7 +110,7 @@ def main():
 
     distributed_evaluator = DistributedEvaluator(
         Agent(model, tokenizer),
-        [task_class(client_args=env_args, n_clients=1)],
+        [task_class(client_args=env_args, n_clients=args.n_clients)],
         args,
     )
     start_time = time.time()